@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from .ir_model_data import IrModelData
+from .ir_model_data_file import IrModelDataFile
 from .ir_logger import IrLogger
+from .ir_logger_rollup import IrLoggerRollup
 
 from .users import User
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from tortoise import fields, models
+
+
+class IrLoggerRollup(models.Model):
+    id = fields.BigIntField(pk=True)
+
+    period = fields.CharField(max_length=4, description="汇总周期 hour/day")
+    bucket = fields.DatetimeField(description="周期开始时间")
+    log_type = fields.CharField(max_length=10, description="日志类型")
+    is_success = fields.BooleanField(description="操作是否成功")
+    # 没有IP的日志汇总为空字符串，保证唯一约束有效
+    ip_address = fields.CharField(max_length=45, default="", description="操作IP地址")
+    count = fields.BigIntField(default=0, description="日志数量")
+
+    write_date = fields.DatetimeField(auto_now=True, description="汇总时间")
+
+    class Meta:
+        table = "ir_logger_rollup"
+        unique_together = [("period", "bucket", "log_type", "is_success", "ip_address")]
+        table_description = "日志汇总表"
+
+    def __str__(self) -> str:
+        """获取字符串表示"""
+        return f"{self.period}:{self.bucket} {self.log_type} -> {self.count}"
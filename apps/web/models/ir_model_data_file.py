@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from tortoise import fields, models
+
+
+class IrModelDataFile(models.Model):
+    id = fields.IntField(pk=True)
+
+    module = fields.CharField(max_length=255, description="模块名称")
+    name = fields.CharField(max_length=512, description="数据文件路径")
+    checksum = fields.CharField(max_length=64, description="文件内容哈希")
+    records = fields.IntField(default=0, description="记录数量")
+
+    create_date = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    write_date = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "ir_model_data_file"
+        unique_together = [("module", "name")]
+        table_description = "Ir Model Data File"
+
+    def __str__(self) -> str:
+        """获取字符串表示"""
+        return f"{self.module}:{self.name} -> {self.checksum}"
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+async def _rollup_audit_logs() -> dict:
+    from tortoise import Tortoise
+    from core.conf import YamlLoader, settings
+    from core.reflect.rollup import log_rollup
+    from rcc.config import BASE_DIR
+    from utils.web import init_orm
+
+    if settings is None:
+        # worker 进程中没有通过命令行加载配置
+        YamlLoader.open(os.environ.get("PYRA_CONFIG", str(BASE_DIR / "application.yml"))).unwrap().glob()
+    (await init_orm(generate_schemas=False)).unwrap()
+    try:
+        log_rollup.configure()
+        return (await log_rollup.run()).unwrap()
+    finally:
+        await Tortoise.close_connections()
+
+
+@shared_task(name="apps.web.tasks.audit.rollup_audit_logs")
+def rollup_audit_logs():
+    """增量汇总审计日志(ir_logger)到 ir_logger_rollup"""
+    written = asyncio.run(_rollup_audit_logs())
+    logger.info(f"Audit log rollup finished: {written}")
+    return written
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import datetime
+import json as jsonlib
+import logging
+from sanic import Blueprint
+from sanic_ext import openapi
+from sanic.response import json
+
+from core.reflect.db import TortoiseLoggerReflect
+from utils.web import bearer_authorized
+
+logger = logging.getLogger(__name__)
+
+audit_bp = Blueprint('audit', url_prefix='/audit')
+
+# 翻页接口返回的日志字段，不包含 user_agent 等大字段
+LOG_FIELDS = ["id", "log_type", "title", "is_success", "error_message", "ip_address", "create_date"]
+MAX_LIMIT = 500
+
+
+def _time_arg(request, name: str):
+    value = request.args.get(name)
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def encode_cursor(cursor) -> str:
+    create_date, pk = cursor
+    return base64.urlsafe_b64encode(jsonlib.dumps([create_date.isoformat(), pk]).encode()).decode()
+
+
+def decode_cursor(value: str) -> tuple:
+    create_date, pk = jsonlib.loads(base64.urlsafe_b64decode(value.encode()))
+    return datetime.datetime.fromisoformat(create_date), pk
+
+
+@audit_bp.get('/summary')
+@openapi.tag('audit')
+@openapi.summary('日志数量汇总')
+@openapi.description('从汇总表读取每小时/每天的日志数量；参数 period(hour/day)、start、end(ISO时间)、'
+                     'group_by(逗号分隔的 log_type/is_success/ip_address)、log_type')
+async def audit_summary(request):
+    if not bearer_authorized(request, 'AUDIT.TOKEN'):
+        return json({"error": "unauthorized"}, status=401)
+    try:
+        group_by = request.args.get('group_by')
+        filters = {"log_type": request.args.get('log_type')} if request.args.get('log_type') else None
+        res = await TortoiseLoggerReflect().summary(
+            period=request.args.get('period', 'hour'),
+            start=_time_arg(request, 'start'),
+            end=_time_arg(request, 'end'),
+            group_by=[dim for dim in group_by.split(',') if dim] if group_by is not None else None,
+            filters=filters,
+        )
+    except ValueError as exc:
+        return json({"error": str(exc)}, status=400)
+    if not res.is_ok():
+        if isinstance(res.err_value, ValueError):
+            return json({"error": str(res.err_value)}, status=400)
+        logger.error(f"Audit summary failed: {res.err_value}")
+        return json({"error": "internal error"}, status=500)
+    return json([{**row, "bucket": row["bucket"].isoformat()} for row in res.ok_value])
+
+
+@audit_bp.get('/logs')
+@openapi.tag('audit')
+@openapi.summary('原始日志翻页')
+@openapi.description('按 (create_date, id) 倒序的键集分页；参数 log_type、is_success、start、end(ISO时间)、'
+                     'limit、cursor(上一页返回的 next)')
+async def audit_logs(request):
+    if not bearer_authorized(request, 'AUDIT.TOKEN'):
+        return json({"error": "unauthorized"}, status=401)
+    try:
+        filters = {}
+        if request.args.get('log_type'):
+            filters["log_type"] = request.args.get('log_type')
+        if request.args.get('is_success') is not None:
+            filters["is_success"] = request.args.get('is_success').lower() in ('1', 'true')
+        start, end = _time_arg(request, 'start'), _time_arg(request, 'end')
+        if start is not None:
+            filters["create_date__gte"] = start
+        if end is not None:
+            filters["create_date__lt"] = end
+        limit = min(max(int(request.args.get('limit', 100)), 1), MAX_LIMIT)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        return json({"error": str(exc)}, status=400)
+    res = await TortoiseLoggerReflect().logs(filters, after=after, limit=limit, fields=LOG_FIELDS)
+    if not res.is_ok():
+        logger.error(f"Audit logs failed: {res.err_value}")
+        return json({"error": "internal error"}, status=500)
+    rows, next_cursor = res.ok_value
+    return json({
+        "items": [{**row, "create_date": row["create_date"].isoformat()} for row in rows],
+        "next": encode_cursor(next_cursor) if next_cursor else None,
+    })
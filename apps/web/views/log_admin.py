@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from sanic import Blueprint
+from sanic_ext import openapi
+from sanic.response import json
+
+from utils.log import log_control
+from utils.web import bearer_authorized
+
+logger = logging.getLogger(__name__)
+
+log_admin_bp = Blueprint('log_admin', url_prefix='/admin')
+
+
+@log_admin_bp.get('/logging')
+@openapi.tag('admin')
+@openapi.summary('当前工作进程的日志级别与采样')
+async def get_logging(request):
+    if not bearer_authorized(request, 'LOGGING.ADMIN_TOKEN'):
+        return json({"error": "unauthorized"}, status=401)
+    return json(log_control.snapshot())
+
+
+@log_admin_bp.put('/logging')
+@openapi.tag('admin')
+@openapi.summary('修改日志级别与采样')
+@openapi.description('请求体 {"levels": {"logger": "INFO"}, "sampling": {"logger": {"first": 100, "every": 1000}}}，'
+                     'sampling 的值为null时取消采样；修改同步到所有工作进程，重启后恢复为配置文件的设置')
+async def put_logging(request):
+    if not bearer_authorized(request, 'LOGGING.ADMIN_TOKEN'):
+        return json({"error": "unauthorized"}, status=401)
+    body = request.json
+    if not isinstance(body, dict):
+        return json({"error": "invalid body"}, status=400)
+    res = log_control.update(body.get("levels"), body.get("sampling"))
+    if not res.is_ok():
+        return json({"error": str(res.err_value)}, status=400)
+    logger.warning(f"Logging changed at runtime: {body}")
+    return json(res.ok_value)
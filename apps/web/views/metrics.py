@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from sanic import Blueprint
+from sanic_ext import openapi
+from sanic.response import json, text
+
+from core.reflect.metrics import metrics
+from utils.web import bearer_authorized
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', url_prefix='/reflect')
+
+
+@metrics_bp.get('/stats')
+@openapi.tag('metrics')
+@openapi.summary('reflect层查询统计')
+@openapi.description('当前工作进程的操作延迟、语句延迟、N+1警告与慢查询日志')
+async def reflect_stats(request):
+    if not bearer_authorized(request, 'METRICS.TOKEN'):
+        return json({"error": "unauthorized"}, status=401)
+    return json(metrics.snapshot())
+
+
+@metrics_bp.get('/metrics')
+@openapi.tag('metrics')
+@openapi.summary('prometheus格式的reflect层查询统计')
+async def reflect_metrics(request):
+    if not bearer_authorized(request, 'METRICS.TOKEN'):
+        return text("unauthorized", status=401)
+    return text(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
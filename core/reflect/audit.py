@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from result import Result, Ok, Err
+from tortoise import timezone
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class AuditLogSink(object):
+    """
+    审计日志的异步批量写入，每个工作进程一个队列
+    队列达到 batch_size 条或距上次写入超过 flush_interval 秒时，用一次 copy_in（Postgres为COPY，其他为多行INSERT）写入
+    队列满时按 overflow 处理：drop_oldest(丢弃最早的)、drop_newest(丢弃新的)、block(等待写入腾出空间)
+    """
+
+    def __init__(self,
+                 table: str = "ir_logger",
+                 max_size: int = 10000,
+                 batch_size: int = 500,
+                 flush_interval: float = 1.0,
+                 overflow: str = "drop_oldest"):
+        self.table = table
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._closing = False
+
+    def configure(self):
+        """读取 AUDIT 配置"""
+        from core.conf import settings
+        if not settings:
+            return
+        self.max_size = settings.get_int("AUDIT.QUEUE_SIZE", self.max_size)
+        self.batch_size = settings.get_int("AUDIT.BATCH_SIZE", self.batch_size)
+        self.flush_interval = settings.get_float("AUDIT.FLUSH_INTERVAL", self.flush_interval)
+        overflow = settings.get_str("AUDIT.OVERFLOW", self.overflow)
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning(f"Unknown audit overflow policy {overflow}, fallback to drop_oldest")
+            overflow = "drop_oldest"
+        self.overflow = overflow
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._closing
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        """在工作进程的事件循环中启动后台写入任务"""
+        if self.running:
+            return
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task = asyncio.create_task(self._run(), name="audit-log-sink")
+
+    async def stop(self) -> Result[int, Exception]:
+        """停止后台任务并写入队列中剩余的日志，返回最后写入的条数"""
+        self._closing = True
+        try:
+            if self._task is not None:
+                self._wakeup.set()
+                # 唤醒等待空间的写入方
+                async with self._space:
+                    self._space.notify_all()
+                await self._task
+            return Ok(await self._drain())
+        except Exception as exc:
+            return Err(exc)
+        finally:
+            self._task = None
+
+    async def put(self, entry: Dict[str, Any]) -> bool:
+        """
+        日志加入队列，create_date/write_date 取入队时间
+        :return: 未启动或因队列已满被丢弃时返回False
+        """
+        if not self.running:
+            return False
+        now = timezone.now()
+        entry.setdefault("create_date", now)
+        entry.setdefault("write_date", now)
+        if len(self._queue) >= self.max_size:
+            if self.overflow == "drop_newest":
+                self.stats["dropped"] += 1
+                return False
+            if self.overflow == "drop_oldest":
+                self._queue.popleft()
+                self.stats["dropped"] += 1
+            else:
+                async with self._space:
+                    await self._space.wait_for(lambda: len(self._queue) < self.max_size or not self.running)
+                if len(self._queue) >= self.max_size:
+                    self.stats["dropped"] += 1
+                    return False
+        self._queue.append(entry)
+        self.stats["queued"] += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue and not self._closing:
+                await self._flush()
+                if len(self._queue) < self.batch_size:
+                    break
+
+    async def _drain(self) -> int:
+        written = 0
+        while self._queue:
+            written += await self._flush()
+        return written
+
+    async def _flush(self) -> int:
+        """取出一批写入，失败时记录错误并丢弃该批次，避免队列无限增长"""
+        batch: List[Dict[str, Any]] = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        if not batch:
+            return 0
+        if self._space is not None:
+            async with self._space:
+                self._space.notify_all()
+        from core.reflect.db import TortoiseReflect
+        res = await TortoiseReflect().copy_in(self.table, batch, columns=self.columns(batch))
+        if not res.is_ok():
+            self.stats["failed"] += len(batch)
+            logger.error(f"Failed to write {len(batch)} audit logs: {res.err_value}")
+            return 0
+        self.stats["written"] += res.ok_value
+        return res.ok_value
+
+    @staticmethod
+    def columns(batch: List[Dict[str, Any]]) -> List[str]:
+        """批次中所有出现过的键，缺少的键写入NULL"""
+        return list(dict.fromkeys(key for entry in batch for key in entry))
+
+
+audit_sink = AuditLogSink()
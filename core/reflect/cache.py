@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import pickle
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from result import Result, Ok, Err
+
+logger = logging.getLogger(__name__)
+
+# 共享代数数组的槽位数量，表名按crc32映射到槽位，冲突只会导致多余的失效
+GENERATION_SLOTS = 1024
+
+MISSING = object()
+
+# QueryCache.deferred 期间写入的表，提交后统一失效
+_deferred: ContextVar[Optional[Set[str]]] = ContextVar("query_cache_deferred", default=None)
+
+# 事务连接 -> 提交后需要失效的表
+_pending: "weakref.WeakKeyDictionary[Any, Set[str]]" = weakref.WeakKeyDictionary()
+
+
+class Generations(object):
+    """
+    每张表的缓存代数，写入时加一使旧的缓存键失效
+    绑定 multiprocessing.Array 后，所有工作进程共享代数，失效会同步到其他进程
+    """
+
+    def __init__(self, slots: int = GENERATION_SLOTS):
+        self._slots = slots
+        self._local: List[int] = [0] * slots
+        self._shared = None
+
+    @staticmethod
+    def create_shared(slots: int = GENERATION_SLOTS):
+        """在主进程中创建共享数组，通过 app.shared_ctx 传递给工作进程"""
+        import multiprocessing
+        return multiprocessing.Array('q', slots)
+
+    def bind(self, shared):
+        """工作进程中绑定主进程创建的共享数组"""
+        self._shared = shared
+        self._slots = len(shared)
+
+    def slot(self, table: str) -> int:
+        return zlib.crc32(table.encode()) % self._slots
+
+    def get(self, table: str) -> int:
+        if self._shared is not None:
+            return self._shared[self.slot(table)]
+        return self._local[self.slot(table)]
+
+    def bump(self, table: str) -> int:
+        i = self.slot(table)
+        if self._shared is not None:
+            with self._shared.get_lock():
+                self._shared[i] += 1
+                return self._shared[i]
+        self._local[i] += 1
+        return self._local[i]
+
+
+class SimpleCache(object):
+    """进程内存缓存，TTL过期 + LRU淘汰"""
+
+    def __init__(self, generations: Generations, max_size: int = 10000):
+        self.generations = generations
+        self.max_size = max_size
+        # {键: (过期时间, 值)}
+        self._data: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    async def generation(self, table: str) -> int:
+        return self.generations.get(table)
+
+    async def bump(self, table: str) -> int:
+        return self.generations.bump(table)
+
+    async def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return MISSING
+        expires, value = item
+        if expires and expires < time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, timeout: int):
+        self._data[key] = (time.monotonic() + timeout if timeout else 0, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def clear(self):
+        self._data.clear()
+
+
+class RedisCache(object):
+    """redis缓存，代数保存在redis中，多台机器之间也能同步失效"""
+
+    def __init__(self, prefix: str, host: str = "localhost", port: int = 6379,
+                 password: Optional[str] = None, db: int = 0):
+        from redis import asyncio as aioredis
+        self.prefix = prefix
+        self.client = aioredis.Redis(host=host, port=port, password=password, db=db)
+
+    async def generation(self, table: str) -> int:
+        return int(await self.client.get(f"{self.prefix}gen:{table}") or 0)
+
+    async def bump(self, table: str) -> int:
+        return await self.client.incr(f"{self.prefix}gen:{table}")
+
+    async def get(self, key: str) -> Any:
+        value = await self.client.get(key)
+        return MISSING if value is None else pickle.loads(value)
+
+    async def set(self, key: str, value: Any, timeout: int):
+        await self.client.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=timeout or None)
+
+    async def clear(self):
+        async for key in self.client.scan_iter(f"{self.prefix}*"):
+            await self.client.delete(key)
+
+
+class MemcachedCache(object):
+    """memcached缓存（aiomcache），代数保存在memcached中"""
+
+    def __init__(self, prefix: str, servers: List[str]):
+        import aiomcache
+        host, _, port = (servers or ["127.0.0.1:11211"])[0].partition(":")
+        self.prefix = prefix
+        self.client = aiomcache.Client(host, int(port or 11211))
+
+    def _key(self, key: str) -> bytes:
+        # memcached的键不能超过250字节且不能包含空白
+        return hashlib.sha1(key.encode()).hexdigest().encode()
+
+    async def generation(self, table: str) -> int:
+        value = await self.client.get(self._key(f"{self.prefix}gen:{table}"))
+        return int(value or 0)
+
+    async def bump(self, table: str) -> int:
+        key = self._key(f"{self.prefix}gen:{table}")
+        try:
+            return await self.client.incr(key)
+        except Exception:
+            # 键不存在时incr失败，先初始化
+            await self.client.set(key, b"1")
+            return 1
+
+    async def get(self, key: str) -> Any:
+        value = await self.client.get(self._key(key))
+        return MISSING if value is None else pickle.loads(value)
+
+    async def set(self, key: str, value: Any, timeout: int):
+        await self.client.set(self._key(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                              exptime=timeout or 0)
+
+    async def clear(self):
+        await self.client.flush_all()
+
+
+class QueryCache(object):
+    """
+    reflect层的查询结果缓存，按 表名 + 表代数 + 操作 + 规范化的过滤条件 生成键
+    配置读取 CONFIG.CACHE_TYPE、CACHE_DEFAULT_TIMEOUT、CACHE_KEY_PREFIX
+    """
+
+    def __init__(self):
+        self.generations = Generations()
+        self._backend = None
+        self.timeout = 300
+        self.prefix = "sanic_cache_"
+
+    def configure(self) -> Result[bool, Exception]:
+        """根据配置创建缓存后端，redis/memcached不可用时退回内存缓存"""
+        from core.conf import settings
+        try:
+            cache_type = settings.get_str("CONFIG.CACHE_TYPE", "simple") if settings else "simple"
+            if settings:
+                self.timeout = settings.get_int("CONFIG.CACHE_DEFAULT_TIMEOUT", 300)
+                self.prefix = f"{settings.get_str('CONFIG.CACHE_KEY_PREFIX', 'sanic_cache_')}reflect:"
+            try:
+                if cache_type == "redis":
+                    self._backend = RedisCache(
+                        self.prefix,
+                        host=settings.get_str("CONFIG.CACHE_REDIS_HOST", "localhost"),
+                        port=settings.get_int("CONFIG.CACHE_REDIS_PORT", 6379),
+                        password=settings.get_str("CONFIG.CACHE_REDIS_PASSWORD", None),
+                        db=settings.get_int("CONFIG.CACHE_REDIS_DB", 0),
+                    )
+                elif cache_type == "memcached":
+                    self._backend = MemcachedCache(
+                        self.prefix, settings.get_list("CONFIG.CACHE_MEMCACHED_SERVERS", []))
+            except ImportError as exc:
+                logger.warning(f"Cache backend {cache_type} is unavailable ({exc}), fallback to simple")
+            if self._backend is None:
+                max_size = settings.get_int("CONFIG.CACHE_THRESHOLD", 10000) if settings else 10000
+                self._backend = SimpleCache(self.generations, max_size)
+            return Ok(True)
+        except Exception as exc:
+            return Err(exc)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self.configure().unwrap()
+        return self._backend
+
+    def reset(self):
+        """重新读取配置，下次使用时创建后端"""
+        self._backend = None
+
+    @staticmethod
+    def make_key(table: str, generation: int, op: str, params: Dict[str, Any]) -> str:
+        normalized = json.dumps(params, sort_keys=True, default=str, ensure_ascii=False)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        return f"{table}:{generation}:{op}:{digest}"
+
+    async def get(self, table: str, op: str, params: Dict[str, Any]) -> Tuple[str, Any]:
+        """:return: (缓存键, 缓存值)，未命中时缓存值为 MISSING"""
+        backend = self.backend
+        key = self.prefix + self.make_key(table, await backend.generation(table), op, params)
+        return key, await backend.get(key)
+
+    async def set(self, key: str, value: Any, timeout: Optional[int] = None):
+        await self.backend.set(key, value, self.timeout if timeout is None else timeout)
+
+    async def invalidate(self, table: str, transaction: Any = None):
+        """
+        表数据变化，旧的缓存键全部失效；在 deferred 中时推迟到结束时
+        :param transaction: 写入所在的事务连接（router.transaction），推迟到事务提交后，回滚时不失效
+        """
+        deferred = _deferred.get()
+        if deferred is not None:
+            deferred.add(table)
+            return
+        if transaction is not None:
+            self._after_commit(transaction, table)
+            return
+        await self._bump(table)
+
+    async def _bump(self, table: str):
+        try:
+            await self.backend.bump(table)
+        except Exception as exc:
+            logger.error(f"Failed to invalidate cache of {table}: {exc}")
+
+    def _after_commit(self, transaction: Any, table: str):
+        """记录到事务连接上，第一次记录时包装它的 commit，提交成功后每张表增加一次代数"""
+        tables = _pending.get(transaction)
+        if tables is None:
+            tables = _pending[transaction] = set()
+            commit = transaction.commit
+
+            async def commit_then_invalidate():
+                await commit()
+                for name in _pending.pop(transaction, ()):
+                    await self._bump(name)
+
+            transaction.commit = commit_then_invalidate
+        tables.add(table)
+
+    async def invalidate_many(self, tables: Iterable[str]):
+        for table in dict.fromkeys(tables):
+            await self.invalidate(table)
+
+    @asynccontextmanager
+    async def deferred(self):
+        """
+        包在事务外面使用：期间的写入只记录表名，结束时（事务已提交或回滚）每张表增加一次代数
+        期间读取这些表时不使用缓存，嵌套时并入外层
+        """
+        tables: Set[str] = set()
+        token = _deferred.set(tables)
+        try:
+            yield tables
+        finally:
+            _deferred.reset(token)
+            await self.invalidate_many(tables)
+
+    async def cached(self, table: str, op: str, params: Dict[str, Any], loader,
+                     timeout: Optional[int] = None, transaction: Any = None) -> Any:
+        """
+        命中时直接返回，否则调用loader查询并写入缓存；缓存后端出错时直接查询
+        当前事务写过的表直接查询，未提交的数据不进入缓存
+        """
+        deferred = _deferred.get()
+        if deferred is not None and table in deferred:
+            return await loader()
+        if transaction is not None and table in _pending.get(transaction, ()):
+            return await loader()
+        try:
+            key, value = await self.get(table, op, params)
+        except Exception as exc:
+            logger.error(f"Cache get failed: {exc}")
+            return await loader()
+        if value is not MISSING:
+            return value
+        value = await loader()
+        try:
+            await self.set(key, value, timeout)
+        except Exception as exc:
+            logger.error(f"Cache set failed: {exc}")
+        return value
+
+
+query_cache = QueryCache()
+
+
+def cache_timeout(cache: Any) -> Optional[int]:
+    """cache参数: True使用默认过期时间，整数为过期秒数"""
+    if cache is True:
+        return None
+    return int(cache)
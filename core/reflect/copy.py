@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import csv
+import io
+import re
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Tuple, Union
+
+from tortoise import timezone
+
+from core.reflect.registry import ModelInfo
+
+COPY_FORMATS = ("records", "csv", "binary")
+# COPY 支持的数据库方言，其他数据库退回多行INSERT/分页SELECT
+COPY_DIALECTS = ("postgres",)
+
+_COPY_STATUS = re.compile(r'COPY (\d+)')
+
+Source = Union[AsyncIterable[Any], Iterable[Any]]
+
+
+async def aiterate(source: Source) -> AsyncIterator[Any]:
+    """同步或异步可迭代对象统一为异步迭代"""
+    if hasattr(source, "__aiter__"):
+        async for item in source:
+            yield item
+    else:
+        for item in source:
+            yield item
+
+
+async def achunks(source: AsyncIterator[Any], size: int) -> AsyncIterator[List[Any]]:
+    chunk = []
+    async for item in source:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def copy_count(status: str) -> int:
+    """asyncpg 返回的状态 "COPY n" 中的行数"""
+    match = _COPY_STATUS.search(status or "")
+    return int(match.group(1)) if match else 0
+
+
+class CopyColumns(object):
+    """
+    COPY 的列映射：字段名（外键可以用关系名）转换为列名，值通过字段的 to_db_value 转换
+    未提供的 auto_now/auto_now_add 与有默认值的字段自动补充，与ORM创建记录的结果一致
+    """
+
+    def __init__(self, info: ModelInfo, fields: List[str], fill_defaults: bool = True):
+        meta = info.model._meta
+        self.model = info.model
+        self.keys = list(fields)
+        self.fields = [info.fk[key][0] if key in info.fk else key for key in self.keys]
+        unknown = [key for key, field in zip(self.keys, self.fields) if field not in info.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown} for {info.table}")
+        self.converters = [meta.fields_map[field].to_db_value for field in self.fields]
+        self.defaults: List[Tuple[str, Callable[[], Any]]] = []
+        if fill_defaults:
+            for name in info.columns:
+                field = meta.fields_map[name]
+                if name in self.fields or field.generated:
+                    continue
+                if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+                    self.defaults.append((name, timezone.now))
+                elif field.default is not None:
+                    default = field.default
+                    self.defaults.append((name, default if callable(default) else (lambda value=default: value)))
+        self.columns = [info.columns[name] for name in self.fields + [name for name, _ in self.defaults]]
+
+    def convert(self, row: Any) -> tuple:
+        """字典按字段名取值，元组/列表按 fields 的顺序"""
+        values = [row.get(key) for key in self.keys] if isinstance(row, dict) else row
+        converted = [convert(value, self.model) for convert, value in zip(self.converters, values)]
+        converted.extend(factory() for _, factory in self.defaults)
+        return tuple(converted)
+
+
+async def csv_records(source: AsyncIterator[Any],
+                      encoding: str = "utf-8",
+                      **fmt: Any) -> AsyncIterator[List[Optional[str]]]:
+    """
+    把CSV字节块解析为行，引号内的换行可以跨越块边界；未加引号的空值视为NULL（与COPY CSV一致）
+    """
+    pending = ""
+    async for chunk in source:
+        pending += chunk.decode(encoding) if isinstance(chunk, (bytes, bytearray)) else chunk
+        # 只解析引号配对完整的行，剩余部分等待下一块
+        complete, record = [], ""
+        for line in pending.splitlines(keepends=True):
+            record += line
+            if record.count('"') % 2 == 0 and record.endswith(("\n", "\r")):
+                complete.append(record)
+                record = ""
+        pending = record
+        for values in csv.reader(complete, **fmt):
+            yield [value if value != "" else None for value in values]
+    if pending.strip():
+        for values in csv.reader([pending], **fmt):
+            yield [value if value != "" else None for value in values]
+
+
+def csv_bytes(rows: Iterable[Iterable[Any]], header: Optional[List[str]] = None, encoding: str = "utf-8") -> bytes:
+    """与 COPY ... CSV 相同的格式：NULL为未加引号的空值"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(header)
+    writer.writerows(["" if value is None else value for value in row] for row in rows)
+    return buffer.getvalue().encode(encoding)
+
+
+async def copy_from_query_chunks(db, sql: str, params: List[Any], fmt: str, header: Optional[bool] = None,
+                                 max_chunks: int = 8) -> AsyncIterator[bytes]:
+    """
+    asyncpg copy_from_query 的输出转为异步迭代，队列满时COPY暂停，内存占用有上限
+    提前结束迭代时取消COPY
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks)
+    done = object()
+
+    async def output(data: bytes):
+        await queue.put(data)
+
+    async def run():
+        try:
+            async with db.acquire_connection() as connection:
+                await connection.copy_from_query(sql, *params, output=output, format=fmt, header=header)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # 异常交给迭代方抛出
+            await queue.put(exc)
+            return
+        await queue.put(done)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            data = await queue.get()
+            if data is done:
+                break
+            if isinstance(data, Exception):
+                raise data
+            yield data
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -1,11 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import datetime
+import functools
+import json
+import operator
+
+from pypika_tortoise import Table
 from tortoise import Tortoise
+from tortoise.expressions import Q
+from tortoise.functions import Sum
 from tortoise.models import Model
-from typing import Type, Dict, Any, List, Optional
+from typing import Type, Dict, Any, List, Optional, AsyncIterator, Tuple, Union
 from sanic.request import Request
 from result import Result, Ok, Err
 
+from core.reflect.audit import audit_sink
+from core.reflect.cache import cache_timeout, query_cache
+from core.reflect.copy import (
+    COPY_DIALECTS, COPY_FORMATS, CopyColumns, Source,
+    achunks, aiterate, copy_count, copy_from_query_chunks, csv_bytes, csv_records,
+)
+from core.reflect.frame import build_frame, column_kinds, concat_frames, raw_tuples, require
+from core.reflect.metrics import instrumented
+from core.reflect.registry import registry
+from core.reflect.rollup import ROLLUP_DIMENSIONS, ROLLUP_PERIODS
+from core.reflect.router import router
+
 
 def client_info(request: Request) -> tuple:
     """获取客户端信息"""
@@ -22,46 +42,21 @@ def client_info(request: Request) -> tuple:
 
 class TortoiseReflect(object):
     def __init__(self):
-        """初始化实例，每个实例有自己的缓存"""
-        self._models_cache = None
+        """模型元数据由进程内共享的 registry 提供，实例可以随意创建"""
+        self.registry = registry
 
     async def models_cache(self) -> Result[Dict[str, Type[Model]], Exception]:
         """
-        获取并缓存模型: {模型名称(表名): 模型对象}
+        获取模型: {模型名称(表名)/模型名/小写别名: 模型对象}
         :return:
         """
-        if self._models_cache is None:
-            try:
-                self._models_cache = {}
-                apps = Tortoise.apps
-                for app_name, models in apps.items():
-                    for model_name, model_class in models.items():
-                        # 使用 describe_model 方法获取模型元数据
-                        table_name = model_class.describe()["table"]
-                        self._models_cache[table_name] = model_class
-                        # 同时存储小写版本以便不区分大小写查找
-                        self._models_cache[model_name.lower()] = model_class
-            except Exception as exc:
-                return Err(exc)
-        return Ok(self._models_cache)
+        return self.registry.models()
 
     async def get_model(self, identifier: str) -> Result[Type[Model], Exception]:
         """根据表名或模型名获取模型类型"""
-        model_cache_result = await self.models_cache()
-        if not model_cache_result.is_ok():
-            return Err(model_cache_result.err_value)
-        try:
-            model_cache = model_cache_result.ok_value
-            # 直接匹配
-            if identifier in model_cache:
-                return Ok(model_cache[identifier])
-            # 小写匹配
-            if identifier.lower() in model_cache:
-                return Ok(model_cache[identifier.lower()])
-            return Err(ValueError(f"Model '{identifier}' not found. Available models: {list(model_cache.keys())}"))
-        except Exception as exc:
-            return Err(exc)
+        return self.registry.model(identifier)
 
+    @instrumented("create")
     async def create(self, table_name: str, data: Dict[str, Any]) -> Result[Model, Exception]:
         """创建记录"""
         try:
@@ -69,11 +64,36 @@ class TortoiseReflect(object):
             if model_cls_result.is_ok():
                 model_cls = model_cls_result.ok_value
                 val = await model_cls.create(**data)
+                router.mark_write()
+                await query_cache.invalidate(model_cls._meta.db_table, router.transaction(model_cls))
                 return Ok(val)
             return Err(model_cls_result.err_value)
         except Exception as exc:
             return Err(exc)
 
+    @instrumented("reserve_ids")
+    async def reserve_ids(self, table_name: str, n: int) -> Result[Optional[List[int]], Exception]:
+        """
+        预先从序列分配n个主键，用于批量插入后仍能获得记录id
+        :return: 不支持预分配的数据库返回None
+        """
+        try:
+            model_cls_result = await self.get_model(table_name)
+            if not model_cls_result.is_ok():
+                return Err(model_cls_result.err_value)
+            model_cls = model_cls_result.ok_value
+            db = model_cls._meta.db
+            if db.capabilities.dialect != "postgres" or not model_cls._meta.pk.generated:
+                return Ok(None)
+            rows = await db.execute_query_dict(
+                "SELECT nextval(pg_get_serial_sequence($1, $2)) AS id FROM generate_series(1, $3)",
+                [model_cls._meta.db_table, model_cls._meta.db_pk_column, n]
+            )
+            return Ok([row["id"] for row in rows])
+        except Exception as exc:
+            return Err(exc)
+
+    @instrumented("update")
     async def update(self, table_name: str, filters: Dict[str, Any], data: Dict[str, Any]) -> Result[int, Exception]:
         """更新记录"""
         try:
@@ -81,11 +101,14 @@ class TortoiseReflect(object):
             if model_cls_result.is_ok():
                 model_cls = model_cls_result.ok_value
                 n = await model_cls.filter(**filters).update(**data)
+                router.mark_write()
+                await query_cache.invalidate(model_cls._meta.db_table, router.transaction(model_cls))
                 return Ok(n)
             return Err(model_cls_result.err_value)
         except Exception as exc:
             return Err(exc)
 
+    @instrumented("delete")
     async def delete(self, table_name: str, filters: Dict[str, Any]) -> Result[int, Exception]:
         """删除记录"""
         try:
@@ -93,13 +116,138 @@ class TortoiseReflect(object):
             if model_cls_result.is_ok():
                 model_cls = model_cls_result.ok_value
                 val = await model_cls.filter(**filters).delete()
+                router.mark_write()
+                await query_cache.invalidate(model_cls._meta.db_table, router.transaction(model_cls))
                 return Ok(val)
             return Err(model_cls_result.err_value)
         except Exception as exc:
             return Err(exc)
 
-    async def get(self, table_name: str, filters: Dict[str, Any] = None) -> Result[List[Model], Exception]:
-        """查询记录"""
+    @instrumented("create_many")
+    async def create_many(self,
+                          table_name: str,
+                          rows: List[Dict[str, Any]],
+                          chunk_size: int = 1000,
+                          ignore_conflicts: bool = False) -> Result[int, Exception]:
+        """
+        批量创建记录，每个批次一条INSERT语句
+        不会回填自增主键，需要id时先用 reserve_ids 分配后写入rows
+        :return: 提交的记录数量
+        """
+        try:
+            model_cls_result = await self.get_model(table_name)
+            if not model_cls_result.is_ok():
+                return Err(model_cls_result.err_value)
+            model_cls = model_cls_result.ok_value
+            if rows:
+                await model_cls.bulk_create([model_cls(**row) for row in rows],
+                                            batch_size=chunk_size, ignore_conflicts=ignore_conflicts)
+                router.mark_write()
+                await query_cache.invalidate(model_cls._meta.db_table, router.transaction(model_cls))
+            return Ok(len(rows))
+        except Exception as exc:
+            return Err(exc)
+
+    @instrumented("update_many")
+    async def update_many(self,
+                          table_name: str,
+                          rows: List[Dict[str, Any]],
+                          chunk_size: int = 1000) -> Result[int, Exception]:
+        """
+        按主键批量更新，每行可以有不同的值，每个批次一条 UPDATE ... CASE 语句
+        :param rows: 每行必须包含主键，其余键为要更新的字段，字段相同的行合并到同一批次
+        :return: 更新的记录数量
+        """
+        try:
+            info_result = self.registry.info(table_name)
+            if not info_result.is_ok():
+                return Err(info_result.err_value)
+            info = info_result.ok_value
+            model_cls = info.model
+            groups: Dict[tuple, List[Model]] = {}
+            for row in rows:
+                row = dict(row)
+                pk = row.pop(info.pk_attr, row.pop("pk", None))
+                if pk is None:
+                    return Err(ValueError(f"Missing primary key '{info.pk_attr}' in {row}"))
+                if not row:
+                    continue
+                # bulk_update 只读取主键和指定字段，不需要完整的实例
+                groups.setdefault(tuple(sorted(row)), []).append(model_cls(**{info.pk_attr: pk}, **row))
+            n = 0
+            for fields, objects in groups.items():
+                n += await model_cls.bulk_update(objects, fields, batch_size=chunk_size)
+            if n:
+                router.mark_write()
+                await query_cache.invalidate(info.table, router.transaction(model_cls))
+            return Ok(n)
+        except Exception as exc:
+            return Err(exc)
+
+    @instrumented("delete_many")
+    async def delete_many(self, table_name: str, ids: List[Any], chunk_size: int = 1000) -> Result[int, Exception]:
+        """按主键批量删除，每个批次一条 DELETE ... IN 语句"""
+        try:
+            model_cls_result = await self.get_model(table_name)
+            if not model_cls_result.is_ok():
+                return Err(model_cls_result.err_value)
+            model_cls = model_cls_result.ok_value
+            n = 0
+            for i in range(0, len(ids), chunk_size):
+                n += await model_cls.filter(pk__in=ids[i:i + chunk_size]).delete()
+            if n:
+                router.mark_write()
+                await query_cache.invalidate(model_cls._meta.db_table, router.transaction(model_cls))
+            return Ok(n)
+        except Exception as exc:
+            return Err(exc)
+
+    @instrumented("upsert")
+    async def upsert(self,
+                     table_name: str,
+                     rows: List[Dict[str, Any]],
+                     conflict: List[str],
+                     update_fields: Optional[List[str]] = None,
+                     chunk_size: int = 1000) -> Result[int, Exception]:
+        """
+        批量插入，冲突时更新: Postgres/SQLite 为 ON CONFLICT (conflict) DO UPDATE，
+        MySQL 为 ON DUPLICATE KEY UPDATE（由表的唯一索引判断冲突）
+        :param conflict: 判断冲突的唯一约束字段
+        :param update_fields: 冲突时更新的字段，默认为rows中除conflict和主键外的所有字段，为空时忽略冲突的行
+        :return: 提交的记录数量
+        """
+        try:
+            info_result = self.registry.info(table_name)
+            if not info_result.is_ok():
+                return Err(info_result.err_value)
+            info = info_result.ok_value
+            model_cls = info.model
+            if not rows:
+                return Ok(0)
+            if update_fields is None:
+                keys = dict.fromkeys(key for row in rows for key in row)
+                update_fields = [key for key in keys if key not in conflict and key != info.pk_attr]
+            objects = [model_cls(**row) for row in rows]
+            if update_fields:
+                await model_cls.bulk_create(objects, batch_size=chunk_size,
+                                            update_fields=update_fields, on_conflict=conflict)
+            else:
+                await model_cls.bulk_create(objects, batch_size=chunk_size, ignore_conflicts=True)
+            router.mark_write()
+            await query_cache.invalidate(info.table, router.transaction(model_cls))
+            return Ok(len(rows))
+        except Exception as exc:
+            return Err(exc)
+
+    @instrumented("get")
+    async def get(self,
+                  table_name: str,
+                  filters: Dict[str, Any] = None,
+                  cache: Union[bool, int] = False) -> Result[List[Model], Exception]:
+        """
+        查询记录
+        :param cache: True使用默认过期时间缓存结果，整数为过期秒数；命中时返回共享的实例，不要修改
+        """
         try:
             model_cls_result = await self.get_model(table_name)
             if model_cls_result.is_ok():
@@ -107,29 +255,223 @@ class TortoiseReflect(object):
                 query = model_cls.all()
                 if filters:
                     query = query.filter(**filters)
-                return Ok(await query)
+                async with router.read(model_cls) as db:
+                    query = query.using_db(db)
+                    if cache:
+                        return Ok(await query_cache.cached(
+                            model_cls._meta.db_table, "get", {"filters": filters}, lambda: query, cache_timeout(cache),
+                            transaction=router.transaction(model_cls)))
+                    return Ok(await query)
             return Err(model_cls_result.err_value)
         except Exception as exc:
             return Err(exc)
 
-    async def get_first(self, table_name: str, filters: Dict[str, Any] = None) -> Result[Optional[Model], Exception]:
-        """获取第一条记录"""
+    @instrumented("stream")
+    async def stream(self,
+                     table_name: str,
+                     filters: Dict[str, Any] = None,
+                     order_by: Optional[str] = None,
+                     page_size: int = 1000,
+                     fields: Optional[List[str]] = None,
+                     values_list: bool = False,
+                     flat: bool = False) -> AsyncIterator[Result[List[Any], Exception]]:
+        """
+        按键集(keyset)分页遍历记录，每页一次查询，内存占用与表大小无关
+        :param order_by: 分页使用的列，"-"前缀表示倒序，默认主键；列应有索引且不为空，不唯一时以主键作为第二排序
+        :param page_size: 每页记录数
+        :param fields: 只查询这些字段，返回字典（values），不创建模型实例
+        :param values_list: 与fields一起使用，返回元组（values_list）
+        :param flat: values_list 只有一个字段时返回值本身
+        :return: 逐页产出Result，出错时产出Err并停止
+        """
+        info_result = self.registry.info(table_name)
+        if not info_result.is_ok():
+            yield Err(info_result.err_value)
+            return
+        info = info_result.ok_value
+        model_cls = info.model
+        pk = info.pk_attr
+        order_by = order_by or pk
+        descending = order_by.startswith("-")
+        key = order_by.lstrip("-")
+        keys = [key] if key == pk else [key, pk]
+        orderings = [f"-{k}" if descending else k for k in keys]
+        op = "lt" if descending else "gt"
+        # 投影查询时补充分页需要的列，返回前去掉
+        columns = None
+        if fields:
+            columns = list(fields) + [k for k in keys if k not in fields]
+        last = None
+        try:
+            # 整个遍历固定使用同一个连接，避免分页之间读到不同副本的复制进度
+            async with router.read(model_cls) as db:
+                while True:
+                    query = model_cls.all().using_db(db)
+                    if filters:
+                        query = query.filter(**filters)
+                    if last is not None:
+                        query = query.filter(self.keyset_filter(keys, op, last))
+                    query = query.order_by(*orderings).limit(page_size)
+                    if columns is None:
+                        page = await query
+                        if page:
+                            last = tuple(getattr(page[-1], k) for k in keys)
+                    else:
+                        rows = await query.values_list(*columns)
+                        if rows:
+                            last = tuple(rows[-1][columns.index(k)] for k in keys)
+                        n = len(fields)
+                        if not values_list:
+                            page = [dict(zip(fields, row)) for row in rows]
+                        elif flat and n == 1:
+                            page = [row[0] for row in rows]
+                        else:
+                            page = [tuple(row[:n]) for row in rows]
+                    if page:
+                        yield Ok(page)
+                    if len(page) < page_size:
+                        return
+        except Exception as exc:
+            yield Err(exc)
+
+    @staticmethod
+    def keyset_filter(keys: List[str], op: str, last: tuple) -> Q:
+        """(key, pk) 在 last 之后（op为gt）或之前（op为lt）的记录"""
+        if len(keys) == 1:
+            return Q(**{f"{keys[0]}__{op}": last[0]})
+        return Q(**{f"{keys[0]}__{op}": last[0]}) | Q(**{keys[0]: last[0], f"{keys[1]}__{op}": last[1]})
+
+    @instrumented("seek")
+    async def seek(self,
+                   table_name: str,
+                   filters: Dict[str, Any] = None,
+                   order_by: Optional[str] = None,
+                   after: Optional[tuple] = None,
+                   limit: int = 100,
+                   fields: Optional[List[str]] = None) -> Result[Tuple[List[Any], Optional[tuple]], Exception]:
+        """
+        按键集(keyset)分页读取一页，与 stream 相同的排序，用于无状态的翻页接口
+        :param order_by: 分页使用的列，"-"前缀表示倒序，默认主键；不是主键时以主键作为第二排序
+        :param after: 上一页返回的游标
+        :param fields: 只查询这些字段，返回字典（values）
+        :return: (记录, 下一页的游标)，没有下一页时游标为None
+        """
+        try:
+            info = self.registry.info(table_name).unwrap()
+            model_cls = info.model
+            pk = info.pk_attr
+            order_by = order_by or pk
+            descending = order_by.startswith("-")
+            key = order_by.lstrip("-")
+            keys = [key] if key == pk else [key, pk]
+            query = model_cls.all()
+            if filters:
+                query = query.filter(**filters)
+            if after is not None:
+                query = query.filter(self.keyset_filter(keys, "lt" if descending else "gt", tuple(after)))
+            # 多取一条判断是否有下一页
+            query = query.order_by(*[f"-{k}" if descending else k for k in keys]).limit(limit + 1)
+            async with router.read(model_cls) as db:
+                query = query.using_db(db)
+                if fields:
+                    columns = list(fields) + [k for k in keys if k not in fields]
+                    rows = await query.values(*columns)
+                    cursors = [tuple(row[k] for k in keys) for row in rows]
+                    page = [{name: row[name] for name in fields} for row in rows]
+                else:
+                    page = await query
+                    cursors = [tuple(getattr(row, k) for k in keys) for row in page]
+            if len(page) <= limit:
+                return Ok((page, None))
+            return Ok((page[:limit], cursors[limit - 1]))
+        except Exception as exc:
+            return Err(exc)
+
+    @instrumented("get_first")
+    async def get_first(self,
+                        table_name: str,
+                        filters: Dict[str, Any] = None,
+                        cache: Union[bool, int] = False) -> Result[Optional[Model], Exception]:
+        """获取第一条记录，cache参数同get"""
         try:
             model_cls_result = await self.get_model(table_name)
             if model_cls_result.is_ok():
                 model_cls = model_cls_result.ok_value
                 # 构建查询
                 if filters is not None:
-                    record = await model_cls.filter(**filters).first()
+                    query = model_cls.filter(**filters)
                 else:
-                    record = await model_cls.all().first()
-                return Ok(record)
+                    query = model_cls.all()
+                async with router.read(model_cls) as db:
+                    query = query.using_db(db).first()
+                    if cache:
+                        return Ok(await query_cache.cached(
+                            model_cls._meta.db_table, "get_first", {"filters": filters}, lambda: query,
+                            cache_timeout(cache), transaction=router.transaction(model_cls)))
+                    record = await query
+                    return Ok(record)
             return Err(model_cls_result.err_value)
         except Exception as exc:
             return Err(exc)
 
-    async def count(self, table_name: str, filters: Dict[str, Any] = None) -> Result[int, Exception]:
-        """获取count"""
+    @staticmethod
+    async def estimate_count(model_cls: Type[Model],
+                             query,
+                             filters: Dict[str, Any] = None,
+                             db=None) -> Optional[int]:
+        """
+        从统计信息估算记录数量，不扫描表
+        无过滤条件时读取 pg_class.reltuples / information_schema.TABLES.TABLE_ROWS，有过滤条件时读取EXPLAIN的估算行数
+        :param db: 执行查询的连接，默认为模型的连接
+        :return: 数据库不支持或没有统计信息时返回None
+        """
+        db = db or model_cls._meta.db
+        dialect = db.capabilities.dialect
+        if dialect == "postgres":
+            if not filters:
+                rows = await db.execute_query_dict(
+                    "SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = to_regclass($1)",
+                    [model_cls._meta.db_table])
+                # 从未ANALYZE的表 reltuples 为 -1
+                if rows and rows[0]["estimate"] is not None and rows[0]["estimate"] >= 0:
+                    return int(rows[0]["estimate"])
+                return None
+            values_query = query.values_list(model_cls._meta.pk_attr)
+            values_query.sql()
+            sql, params = values_query.query.get_parameterized_sql()
+            rows = await db.execute_query_dict(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = rows[0]["QUERY PLAN"]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        if dialect == "mysql":
+            if not filters:
+                rows = await db.execute_query_dict(
+                    "SELECT TABLE_ROWS AS estimate FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    [model_cls._meta.db_table])
+                return int(rows[0]["estimate"]) if rows and rows[0]["estimate"] is not None else None
+            values_query = query.values_list(model_cls._meta.pk_attr)
+            values_query.sql()
+            sql, params = values_query.query.get_parameterized_sql()
+            rows = await db.execute_query_dict(f"EXPLAIN {sql}", params)
+            if not rows or rows[0].get("rows") is None:
+                return None
+            return int(rows[0]["rows"] * float(rows[0].get("filtered") or 100) / 100)
+        return None
+
+    @instrumented("count")
+    async def count(self,
+                    table_name: str,
+                    filters: Dict[str, Any] = None,
+                    cache: Union[bool, int] = False,
+                    mode: str = "exact",
+                    max_age: Optional[int] = None) -> Result[int, Exception]:
+        """
+        获取count，cache参数同get
+        :param mode: exact(COUNT(*))、estimate(统计信息估算，不支持时退回exact)、cached(缓存的精确值)
+        :param max_age: cached模式的最大过期秒数，默认读取 DATABASE.COUNT_MAX_AGE
+        """
         try:
             model_cls_result = await self.get_model(table_name)
             if model_cls_result.is_ok():
@@ -137,15 +479,282 @@ class TortoiseReflect(object):
                 query = model_cls.all()
                 if filters:
                     query = query.filter(**filters)
-                count = await query.count()
-                return Ok(count)
+                async with router.read(model_cls) as db:
+                    query = query.using_db(db)
+                    if mode == "estimate":
+                        estimate = await self.estimate_count(model_cls, query, filters, db)
+                        if estimate is not None:
+                            return Ok(estimate)
+                    elif mode == "cached":
+                        if max_age is None:
+                            from core.conf import settings
+                            max_age = settings.get_int("DATABASE.COUNT_MAX_AGE", 60) if settings else 60
+                        cache = max_age
+                    elif mode != "exact":
+                        return Err(ValueError(f"Unknown count mode: {mode}"))
+                    if cache:
+                        return Ok(await query_cache.cached(
+                            model_cls._meta.db_table, "count", {"filters": filters}, query.count,
+                            cache_timeout(cache), transaction=router.transaction(model_cls)))
+                    count = await query.count()
+                    return Ok(count)
             return Err(model_cls_result.err_value)
         except Exception as exc:
             return Err(exc)
 
+    @instrumented("copy_in")
+    async def copy_in(self,
+                      table_name: str,
+                      source: Source,
+                      columns: Optional[List[str]] = None,
+                      format: str = "records",
+                      chunk_size: int = 10000,
+                      header: bool = False) -> Result[int, Exception]:
+        """
+        批量导入，Postgres使用COPY，其他数据库退回每个批次一条多行INSERT
+        :param source: 同步或异步可迭代对象；records格式为字典或元组（顺序同columns），csv/binary格式为bytes块
+        :param columns: 字段名，外键可以用关系名；records格式的字典行默认取第一行的键，csv/binary默认为表的所有列
+        :param format: records、csv、binary（binary只支持Postgres）
+        :param header: csv的第一行为表头
+        :return: 导入的记录数量
+        """
+        try:
+            if format not in COPY_FORMATS:
+                return Err(ValueError(f"Unknown copy format: {format}"))
+            info_result = self.registry.info(table_name)
+            if not info_result.is_ok():
+                return Err(info_result.err_value)
+            info = info_result.ok_value
+            db = info.model._meta.db
+            dialect = db.capabilities.dialect
+            rows = aiterate(source)
+
+            if format == "records":
+                first = await anext(rows, None)
+                if first is None:
+                    return Ok(0)
+                if columns is None:
+                    if not isinstance(first, dict):
+                        return Err(ValueError("columns is required for tuple rows"))
+                    columns = list(first)
+                mapping = CopyColumns(info, columns)
+
+                async def records():
+                    yield mapping.convert(first)
+                    async for row in rows:
+                        yield mapping.convert(row)
+
+                if dialect in COPY_DIALECTS:
+                    async with db.acquire_connection() as connection:
+                        n = copy_count(await connection.copy_records_to_table(
+                            info.table, records=records(), columns=mapping.columns))
+                else:
+                    n = await self._insert_chunks(db, info.table, mapping.columns, records(), chunk_size)
+            elif dialect in COPY_DIALECTS:
+                mapping = CopyColumns(info, columns, fill_defaults=False) if columns else None
+
+                async def chunks():
+                    async for chunk in rows:
+                        yield chunk.encode() if isinstance(chunk, str) else chunk
+
+                async with db.acquire_connection() as connection:
+                    n = copy_count(await connection.copy_to_table(
+                        info.table, source=chunks(), columns=mapping.columns if mapping else None,
+                        format=format, header=header if format == "csv" else None))
+            elif format == "csv":
+                # 与COPY一致，未指定columns时按表的列顺序
+                mapping = CopyColumns(info, columns or list(info.columns), fill_defaults=False)
+                records = csv_records(rows)
+                if header:
+                    await anext(records, None)
+                n = await self._insert_chunks(db, info.table, mapping.columns, records, chunk_size)
+            else:
+                return Err(NotImplementedError(f"COPY {format} is not supported on {dialect}"))
+
+            if n:
+                router.mark_write()
+                await query_cache.invalidate(info.table, router.transaction(model_cls))
+            return Ok(n)
+        except Exception as exc:
+            return Err(exc)
+
+    @staticmethod
+    async def _insert_chunks(db,
+                             table: str,
+                             columns: List[str],
+                             records: AsyncIterator[tuple],
+                             chunk_size: int) -> int:
+        """不支持COPY的数据库，每个批次一条多行INSERT"""
+        n = 0
+        target = Table(table)
+        async for chunk in achunks(records, chunk_size):
+            query = db.query_class.into(target).columns(*[target[column] for column in columns])
+            for record in chunk:
+                query = query.insert(*record)
+            await db.execute_query(*query.get_parameterized_sql())
+            n += len(chunk)
+        return n
+
+    @instrumented("copy_out")
+    async def copy_out(self,
+                       table_name: str,
+                       filters: Dict[str, Any] = None,
+                       columns: Optional[List[str]] = None,
+                       format: str = "records",
+                       chunk_size: int = 10000,
+                       header: bool = False) -> AsyncIterator[Result[Any, Exception]]:
+        """
+        批量导出，Postgres的csv/binary使用 COPY (SELECT ...) TO STDOUT，records使用服务端游标；
+        其他数据库按主键分页查询，csv在本地生成
+        :param columns: 字段名，默认为表的所有列
+        :param format: records(逐批产出元组列表)、csv/binary(逐块产出bytes，binary只支持Postgres)
+        :param header: csv包含表头
+        :return: 逐批产出Result，出错时产出Err并停止
+        """
+        if format not in COPY_FORMATS:
+            yield Err(ValueError(f"Unknown copy format: {format}"))
+            return
+        info_result = self.registry.info(table_name)
+        if not info_result.is_ok():
+            yield Err(info_result.err_value)
+            return
+        info = info_result.ok_value
+        model_cls = info.model
+        try:
+            mapping = CopyColumns(info, columns or list(info.columns), fill_defaults=False)
+            async with router.read(model_cls) as db:
+                db = db or model_cls._meta.db
+                dialect = db.capabilities.dialect
+                if dialect in COPY_DIALECTS:
+                    query = model_cls.all().using_db(db)
+                    if filters:
+                        query = query.filter(**filters)
+                    # 以列名作为别名，csv表头为列名
+                    values_query = query.values(**dict(zip(mapping.columns, mapping.fields)))
+                    values_query.sql()
+                    sql, params = values_query.query.get_parameterized_sql()
+                    if format == "records":
+                        async with db.acquire_connection() as connection:
+                            # 游标需要在事务中使用，已在事务中时为保存点
+                            async with connection.transaction():
+                                chunk = []
+                                async for record in connection.cursor(sql, *params, prefetch=chunk_size):
+                                    chunk.append(tuple(record))
+                                    if len(chunk) >= chunk_size:
+                                        yield Ok(chunk)
+                                        chunk = []
+                                if chunk:
+                                    yield Ok(chunk)
+                    else:
+                        async for data in copy_from_query_chunks(db, sql, params, format,
+                                                                 header=header if format == "csv" else None):
+                            yield Ok(data)
+                    return
+
+            if format == "binary":
+                yield Err(NotImplementedError(f"COPY binary is not supported on {dialect}"))
+                return
+            first = True
+            async for page in self.stream(table_name, filters, page_size=chunk_size,
+                                          fields=mapping.fields, values_list=True):
+                if not page.is_ok() or format == "records":
+                    yield page
+                    if not page.is_ok():
+                        return
+                    continue
+                yield Ok(csv_bytes(page.ok_value, mapping.columns if header and first else None))
+                first = False
+        except Exception as exc:
+            yield Err(exc)
+
+    @instrumented("iter_frames")
+    async def iter_frames(self,
+                          table_name: str,
+                          filters: Dict[str, Any] = None,
+                          fields: Optional[List[str]] = None,
+                          chunk_size: int = 50000,
+                          as_numpy: bool = False) -> AsyncIterator[Result[Any, Exception]]:
+        """
+        按主键分页，每页直接从驱动返回的元组按列构建 DataFrame（或numpy record array），不创建模型实例
+        列类型来自模型字段：整数、浮点(Decimal也转为float64)、布尔、日期时间(UTC)，其他为object
+        :param fields: 字段名，外键可以用关系名，默认为表的所有列
+        :param as_numpy: 返回 numpy record array，可为空的整数列为float64(NaN)
+        :return: 逐页产出Result，需要安装 pyra[frame]（as_numpy时只需要numpy）
+        """
+        try:
+            # 未安装时在查询之前返回错误
+            require("numpy" if as_numpy else "pandas")
+        except ImportError as exc:
+            yield Err(exc)
+            return
+        info_result = self.registry.info(table_name)
+        if not info_result.is_ok():
+            yield Err(info_result.err_value)
+            return
+        info = info_result.ok_value
+        model_cls = info.model
+        pk = info.pk_attr
+        try:
+            mapping = CopyColumns(info, fields or list(info.columns), fill_defaults=False)
+            selected = mapping.fields + ([] if pk in mapping.fields else [pk])
+            pk_index = selected.index(pk)
+            kinds = column_kinds(model_cls, mapping.fields)
+            kinds = [kinds[name] for name in mapping.fields]
+            n = len(mapping.fields)
+            last = None
+            async with router.read(model_cls) as db:
+                db = db or model_cls._meta.db
+                while True:
+                    query = model_cls.all().using_db(db)
+                    if filters:
+                        query = query.filter(**filters)
+                    if last is not None:
+                        query = query.filter(**{f"{pk}__gt": last})
+                    values_query = query.order_by(pk).limit(chunk_size).values_list(*selected)
+                    values_query.sql()
+                    _, rows = await db.execute_query(*values_query.query.get_parameterized_sql())
+                    rows = raw_tuples(rows)
+                    if rows:
+                        last = rows[-1][pk_index]
+                        if len(selected) > n:
+                            rows = [row[:n] for row in rows]
+                        yield Ok(build_frame(rows, mapping.keys, kinds, as_numpy))
+                    if len(rows) < chunk_size:
+                        return
+        except Exception as exc:
+            yield Err(exc)
+
+    async def get_frame(self,
+                        table_name: str,
+                        filters: Dict[str, Any] = None,
+                        fields: Optional[List[str]] = None,
+                        chunk_size: int = 50000,
+                        as_numpy: bool = False) -> Result[Any, Exception]:
+        """
+        查询结果构建为一个 DataFrame（或numpy record array），参数同 iter_frames
+        没有记录时返回只有列名的空表
+        """
+        frames = []
+        async for frame in self.iter_frames(table_name, filters, fields, chunk_size, as_numpy):
+            if not frame.is_ok():
+                return Err(frame.err_value)
+            frames.append(frame.ok_value)
+        if frames:
+            try:
+                return Ok(concat_frames(frames, as_numpy))
+            except Exception as exc:
+                return Err(exc)
+        try:
+            info = self.registry.info(table_name).unwrap()
+            mapping = CopyColumns(info, fields or list(info.columns), fill_defaults=False)
+            kinds = column_kinds(info.model, mapping.fields)
+            return Ok(build_frame([], mapping.keys, [kinds[name] for name in mapping.fields], as_numpy))
+        except Exception as exc:
+            return Err(exc)
+
     async def clear_cache(self):
         """清除缓存，如果需要重新加载模型时可以调用"""
-        self._models_cache = None
+        self.registry.invalidate()
         return Ok(None)
 
 
@@ -166,39 +775,110 @@ class TortoiseIrModelDataReflect(TortoiseReflect):
             return Err(exc)
 
     @staticmethod
-    async def many2many(instance, data: Dict[str, List[int]]) -> Result[bool, Exception]:
-        """添加多对多关联关系"""
-        for field_name, related_ids in data.items():
-            try:
-                # 检查记录实例是否有这个多对多字段
-                if hasattr(instance, field_name):
-                    # 获取多对多 管理器
-                    many2many_manager = getattr(instance, field_name)
-                    # 获取对应的模型类
-                    related_model = many2many_manager.remote_model
-                    # 查询相关的记录
-                    related_objects = []
-                    for rel_id in related_ids:
-                        related_obj = await related_model.filter(id=rel_id).first()
-                        if related_obj:
-                            related_objects.append(related_obj)
-                    if related_objects:
-                        # 添加多对多关系
-                        await many2many_manager.add(*related_objects)
-                return Ok(True)
-            except Exception as exc:
-                return Err(exc)
+    async def many2many(instance, data: Dict[str, List[int]], replace: bool = False) -> Result[bool, Exception]:
+        """添加多对多关联关系，replace为True时同步为data中的关系"""
+        links_result = await TortoiseIrModelDataReflect.many2many_links(
+            type(instance), {instance.pk: data}, replace=replace
+        )
+        if not links_result.is_ok():
+            return Err(links_result.err_value)
+        return Ok(True)
 
-    async def batch_ref_id(self, xml_ids: List[str]) -> Result[Dict[str, Optional[int]], Exception]:
-        """批量获取多个xml_id对应的记录id"""
+    @staticmethod
+    async def many2many_links(model_cls: Type[Model],
+                              links: Dict[Any, Dict[str, List[int]]],
+                              replace: bool = False,
+                              created: bool = False) -> Result[int, Exception]:
+        """
+        批量建立多对多关联关系，每个字段只执行一次 id__in 校验查询和一次中间表插入
+        :param model_cls: 记录所属模型
+        :param links: {记录主键: {多对多字段名: 关联记录id列表}}
+        :param replace: 为True时与已有关系比较差异，只插入新增、删除多余的关系
+        :param created: 记录均为新建时跳过已有关系查询
+        :return: 插入与删除的关系数量
+        """
+        changed = 0
         try:
-            result = {}
-            for xml_id in xml_ids:
-                ref_id_result = await self.ref_id(xml_id)
-                if ref_id_result.is_ok():
-                    result[xml_id] = ref_id_result.ok_value
-                else:
-                    return Err(ref_id_result.err_value)
+            fields: Dict[str, Dict[Any, List[int]]] = {}
+            for pk, data in links.items():
+                for field_name, related_ids in (data or {}).items():
+                    if field_name in model_cls._meta.m2m_fields:
+                        fields.setdefault(field_name, {})[pk] = related_ids
+
+            info = registry.info_of(model_cls).unwrap()
+            for field_name, field_links in fields.items():
+                field = info.m2m[field_name]
+                related_model = field.related_model
+                db = model_cls._meta.db
+                through = Table(field.through, schema=field.through_schema)
+                backward, forward = field.backward_key, field.forward_key
+                to_backward = model_cls._meta.pk.to_db_value
+                to_forward = related_model._meta.pk.to_db_value
+
+                # 一次查询过滤掉不存在的关联记录
+                wanted = {rel_id for related_ids in field_links.values() for rel_id in related_ids}
+                valid = set()
+                if wanted:
+                    valid = set(await related_model.filter(
+                        pk__in=list(wanted)
+                    ).values_list(related_model._meta.pk_attr, flat=True))
+                desired = {
+                    to_backward(pk, None): {to_forward(rel_id, None) for rel_id in related_ids if rel_id in valid}
+                    for pk, related_ids in field_links.items()
+                }
+
+                # 一次查询取出已有关系
+                existing: Dict[Any, set] = {pk: set() for pk in desired}
+                if not created:
+                    query = db.query_class.from_(through).where(
+                        through[backward].isin(list(desired))
+                    ).select(through[backward], through[forward])
+                    _, rows = await db.execute_query(*query.get_parameterized_sql())
+                    for row in rows:
+                        existing.setdefault(row[backward], set()).add(row[forward])
+
+                inserts = [(pk, rel_id) for pk, rel_ids in desired.items()
+                           for rel_id in rel_ids - existing[pk]]
+                if inserts:
+                    query = db.query_class.into(through).columns(through[backward], through[forward])
+                    for pk, rel_id in inserts:
+                        query = query.insert(pk, rel_id)
+                    await db.execute_query(*query.get_parameterized_sql())
+                    changed += len(inserts)
+
+                if replace:
+                    criteria = [
+                        (through[backward] == pk) & through[forward].isin(list(rel_ids - desired[pk]))
+                        for pk, rel_ids in existing.items() if rel_ids - desired[pk]
+                    ]
+                    if criteria:
+                        query = db.query_class.from_(through).where(
+                            functools.reduce(operator.or_, criteria)
+                        ).delete()
+                        await db.execute_query(*query.get_parameterized_sql())
+                        changed += sum(len(existing[pk] - desired[pk]) for pk in existing)
+            if changed:
+                router.mark_write()
+            return Ok(changed)
+        except Exception as exc:
+            return Err(exc)
+
+    async def batch_ref_id(self, xml_ids: List[str], chunk_size: int = 500) -> Result[Dict[str, Optional[int]], Exception]:
+        """批量获取多个xml_id对应的记录id，每个批次只执行一次 complete_name__in 查询"""
+        try:
+            model_cls_result = await self.get_model("ir_model_data")
+            if not model_cls_result.is_ok():
+                return Err(model_cls_result.err_value)
+            model_cls = model_cls_result.ok_value
+            # 去重并保持顺序，未找到的xml_id对应None
+            xml_ids = list(dict.fromkeys(xml_ids))
+            result: Dict[str, Optional[int]] = {xml_id: None for xml_id in xml_ids}
+            for i in range(0, len(xml_ids), chunk_size):
+                rows = await model_cls.filter(
+                    complete_name__in=xml_ids[i:i + chunk_size]
+                ).values_list("complete_name", "ref_id")
+                for complete_name, ref_id in rows:
+                    result[complete_name] = ref_id
             return Ok(result)
         except Exception as exc:
             return Err(exc)
@@ -222,7 +902,8 @@ class TortoiseLoggerReflect(TortoiseReflect):
                     content: str,
                     is_success: bool = True,
                     error_message: Optional[str] = None,
-                    metadata: Optional[Any] = None
+                    metadata: Optional[Any] = None,
+                    buffered: bool = True
                     ) -> Result[bool, Exception]:
         """
         :param request: sanic request
@@ -232,11 +913,12 @@ class TortoiseLoggerReflect(TortoiseReflect):
         :param is_success:
         :param error_message:
         :param metadata:
-        :return:
+        :param buffered: audit_sink 已启动时加入队列批量写入，否则直接写入
+        :return: 队列已满被丢弃时为Ok(False)
         """
         try:
             ip_address, user_agent = client_info(request)
-            user_log_result = await self.create("ir_logger", **{
+            data = {
                 'log_type': mode,
                 'title': title,
                 'content': content,
@@ -245,9 +927,63 @@ class TortoiseLoggerReflect(TortoiseReflect):
                 'error_message': error_message,
                 'ip_address': ip_address,
                 'user_agent': user_agent,
-            })
+            }
+            if buffered and audit_sink.running:
+                return Ok(await audit_sink.put(data))
+            user_log_result = await self.create("ir_logger", data)
             if not user_log_result.is_ok():
                 return Err(user_log_result.err_value)
             return Ok(True)
         except Exception as exc:
             return Err(exc)
+
+    async def summary(self,
+                      period: str = "hour",
+                      start: Optional[datetime.datetime] = None,
+                      end: Optional[datetime.datetime] = None,
+                      group_by: Optional[List[str]] = None,
+                      filters: Dict[str, Any] = None) -> Result[List[Dict[str, Any]], Exception]:
+        """
+        从汇总表(ir_logger_rollup)读取每个周期的日志数量，不扫描原始日志
+        :param period: hour/day
+        :param group_by: 汇总维度 log_type/is_success/ip_address，默认按 log_type，空列表为只按周期
+        :param filters: 汇总表上的过滤条件，如 {"log_type": "login"}
+        :return: [{"bucket": 周期开始时间, <维度>..., "count": 数量}]，按周期排序
+        """
+        try:
+            if period not in ROLLUP_PERIODS:
+                return Err(ValueError(f"Unknown rollup period {period}"))
+            dims = ["log_type"] if group_by is None else list(group_by)
+            unknown = [dim for dim in dims if dim not in ROLLUP_DIMENSIONS]
+            if unknown:
+                return Err(ValueError(f"Unknown rollup dimensions {unknown}"))
+            model_cls = (await self.get_model("ir_logger_rollup")).unwrap()
+            query = model_cls.filter(period=period)
+            if start is not None:
+                query = query.filter(bucket__gte=start)
+            if end is not None:
+                query = query.filter(bucket__lt=end)
+            if filters:
+                query = query.filter(**filters)
+            async with router.read(model_cls) as db:
+                rows = await (query.using_db(db)
+                              .annotate(total=Sum("count"))
+                              .group_by("bucket", *dims)
+                              .order_by("bucket", *dims)
+                              .values("bucket", "total", *dims))
+            return Ok([{"bucket": row["bucket"], **{dim: row[dim] for dim in dims}, "count": int(row["total"])}
+                       for row in rows])
+        except Exception as exc:
+            return Err(exc)
+
+    async def logs(self,
+                   filters: Dict[str, Any] = None,
+                   after: Optional[tuple] = None,
+                   limit: int = 100,
+                   fields: Optional[List[str]] = None) -> Result[Tuple[List[Any], Optional[tuple]], Exception]:
+        """
+        按 (create_date, id) 倒序翻页查看原始日志，filters 带有 create_date 范围时只扫描相关分区
+        :param after: 上一页返回的游标 (create_date, id)
+        :return: (日志, 下一页的游标)
+        """
+        return await self.seek("ir_logger", filters, "-create_date", after, limit, fields)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import datetime
+import importlib
+from typing import Any, Dict, List, Sequence, Tuple
+
+from tortoise import fields as tortoise_fields
+
+# 字段类型 -> 列类型，子类在前；未列出的字段（字符串、JSON、UUID等）为object
+FIELD_KINDS: Tuple[Tuple[type, str], ...] = (
+    (tortoise_fields.BooleanField, "bool"),
+    (tortoise_fields.BigIntField, "int64"),
+    (tortoise_fields.SmallIntField, "int16"),
+    (tortoise_fields.IntField, "int32"),
+    (tortoise_fields.FloatField, "float"),
+    # Decimal转为float64以便向量化计算，需要精确值时用get/stream
+    (tortoise_fields.DecimalField, "float"),
+    (tortoise_fields.DatetimeField, "datetime"),
+    (tortoise_fields.DateField, "date"),
+)
+
+
+def require(name: str):
+    """导入 pandas/numpy，未安装时提示安装 frame 扩展"""
+    try:
+        return importlib.import_module(name)
+    except ImportError as exc:
+        raise ImportError(f"get_frame/iter_frames require {name}, install it with: pip install 'pyra[frame]'") from exc
+
+
+def column_kinds(model, fields: List[str]) -> Dict[str, Tuple[str, bool]]:
+    """{字段名: (列类型, 是否可为空)}"""
+    kinds = {}
+    for name in fields:
+        field = model._meta.fields_map[name]
+        kind = next((kind for cls, kind in FIELD_KINDS if isinstance(field, cls)), "object")
+        # 主键自增与外键列来自数据库，不会为空
+        kinds[name] = (kind, bool(field.null))
+    return kinds
+
+
+def raw_tuples(rows: Sequence[Any]) -> List[tuple]:
+    """驱动返回的行（asyncpg Record、sqlite Row、MySQL字典）统一为元组"""
+    if rows and isinstance(rows[0], dict):
+        return [tuple(row.values()) for row in rows]
+    return [tuple(row) for row in rows]
+
+
+def _parse_datetime(value: Any) -> Any:
+    """SQLite返回ISO字符串；numpy不接受带时区的datetime，统一转换为UTC的naive时间"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _parse_date(value: Any) -> Any:
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def numpy_column(np, values: Sequence[Any], kind: str, null: bool):
+    """按列类型构建numpy数组，可为空的整数列使用float64(NaN)，可为空的布尔列使用object"""
+    if kind.startswith("int"):
+        if not null:
+            return np.fromiter(values, dtype=kind, count=len(values))
+        return np.array([np.nan if v is None else v for v in values], dtype="float64")
+    if kind == "float":
+        return np.array([np.nan if v is None else float(v) for v in values], dtype="float64")
+    if kind == "bool":
+        if not null:
+            return np.array(values, dtype=bool)
+        return np.array([None if v is None else bool(v) for v in values], dtype=object)
+    if kind == "datetime":
+        return np.array([np.datetime64("NaT") if v is None else _parse_datetime(v) for v in values],
+                        dtype="datetime64[us]")
+    if kind == "date":
+        return np.array([np.datetime64("NaT") if v is None else _parse_date(v) for v in values],
+                        dtype="datetime64[D]")
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def pandas_column(pd, values: Sequence[Any], kind: str, null: bool):
+    """按列类型构建pandas列，可为空的整数/布尔列使用pandas的可空类型(Int64、boolean)"""
+    if kind.startswith("int"):
+        return pd.array(values, dtype=f"Int{kind[3:]}" if null else kind)
+    if kind == "float":
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype("float64").array
+    if kind == "bool":
+        return pd.array([None if v is None else bool(v) for v in values], dtype="boolean" if null else bool)
+    if kind == "datetime":
+        return pd.to_datetime(pd.Series(values, dtype=object), utc=True, format="ISO8601").array
+    if kind == "date":
+        return pd.to_datetime(pd.Series([None if v is None else _parse_date(v) for v in values],
+                                        dtype=object)).array
+    return pd.array(values, dtype=object)
+
+
+def build_frame(rows: List[tuple], names: List[str], kinds: List[Tuple[str, bool]], as_numpy: bool = False):
+    """
+    从元组行按列构建 DataFrame 或 numpy record array
+    :param names: 结果的列名
+    :param kinds: 与names顺序相同的 (列类型, 是否可为空)
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    if as_numpy:
+        np = require("numpy")
+        return np.rec.fromarrays([numpy_column(np, list(values), kind, null)
+                                  for values, (kind, null) in zip(columns, kinds)], names=names)
+    pd = require("pandas")
+    return pd.DataFrame({name: pandas_column(pd, list(values), kind, null)
+                         for name, values, (kind, null) in zip(names, columns, kinds)}, columns=names)
+
+
+def concat_frames(frames: List[Any], as_numpy: bool = False):
+    if as_numpy:
+        np = require("numpy")
+        return np.concatenate(frames).view(np.recarray) if len(frames) > 1 else frames[0]
+    pd = require("pandas")
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
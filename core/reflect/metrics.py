@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bisect
+import functools
+import inspect
+import logging
+import re
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from tortoise import connections
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶（秒），与 prometheus_client 的默认桶相同
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_METHODS = ('execute_query', 'execute_query_dict', 'execute_insert', 'execute_many', 'execute_script')
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+[`"]?(\w+)[`"]?', re.IGNORECASE)
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_PATTERN = re.compile(r'\(\s*(?:\?|%s|\$\d+)(?:\s*,\s*(?:\?|%s|\$\d+))*\s*\)')
+_PLACEHOLDER_PATTERN = re.compile(r'\$\d+')
+
+# 当前执行的reflect操作 (表名, 操作)，原始语句归属到该操作
+_operation: ContextVar[Optional[Tuple[str, str]]] = ContextVar("reflect_metrics_operation", default=None)
+# 当前请求的统计，request中间件中创建
+_request: ContextVar[Optional['RequestStats']] = ContextVar("reflect_metrics_request", default=None)
+# 子类方法调用父类方法时只统计一次
+_depth: ContextVar[int] = ContextVar("reflect_metrics_depth", default=0)
+
+
+class Histogram(object):
+    """累计桶直方图，导出格式与prometheus的histogram相同"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """[(le, 累计数量)]，最后一项为 +Inf"""
+        total, result = 0, []
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            result.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class RequestStats(object):
+    """单个请求内执行的语句统计"""
+    __slots__ = ('queries', 'seconds', 'fingerprints')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.fingerprints: Counter = Counter()
+
+
+def fingerprint(sql: str) -> str:
+    """去掉字面量并折叠IN列表，只有参数不同的语句得到相同的指纹"""
+    sql = _LITERAL_PATTERN.sub("?", sql)
+    sql = _IN_LIST_PATTERN.sub("(...)", sql)
+    return " ".join(_PLACEHOLDER_PATTERN.sub("?", sql).split())
+
+
+def params_shape(values: Any) -> Dict[str, Any]:
+    """参数的形状（数量与类型），慢查询日志不记录参数值"""
+    if not values:
+        return {"count": 0, "types": []}
+    if isinstance(values, (list, tuple)) and values and isinstance(values[0], (list, tuple)):
+        # execute_many: 多行参数
+        return {"rows": len(values), "count": len(values[0]), "types": [type(v).__name__ for v in values[0]]}
+    values = list(values)
+    return {"count": len(values), "types": [type(v).__name__ for v in values[:20]]}
+
+
+class ReflectMetrics(object):
+    """
+    reflect层的查询统计:
+    按 表名 + 操作 统计reflect方法的延迟，按 表名 + 语句类型 统计数据库客户端执行的语句，
+    请求内同一语句指纹执行次数超过阈值时警告N+1，超过慢查询阈值的语句记录到慢查询日志
+    统计保存在进程内，多个工作进程各自统计
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.slow_query_seconds = 0.2
+        self.n_plus_one_threshold = 10
+        self.buckets = DEFAULT_BUCKETS
+        # {(表名, 操作): 直方图}
+        self.operations: Dict[Tuple[str, str], Histogram] = {}
+        # {(表名, 语句类型): 直方图}
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.errors: Counter = Counter()
+        self.n_plus_one: Counter = Counter()
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=100)
+        self._patched: List[tuple] = []
+
+    def configure(self):
+        """读取 METRICS 配置"""
+        from core.conf import settings
+        if not settings:
+            return
+        self.enabled = settings.get_bool("METRICS.ENABLED", True)
+        self.slow_query_seconds = settings.get_int("METRICS.SLOW_QUERY_MS", 200) / 1000
+        self.n_plus_one_threshold = settings.get_int("METRICS.N_PLUS_ONE_THRESHOLD", 10)
+        self.buckets = tuple(settings.get_list("METRICS.BUCKETS", []) or DEFAULT_BUCKETS)
+        self.slow_queries = deque(self.slow_queries, maxlen=settings.get_int("METRICS.SLOW_QUERY_LOG_SIZE", 100))
+
+    def reset(self):
+        self.operations.clear()
+        self.queries.clear()
+        self.errors.clear()
+        self.n_plus_one.clear()
+        self.slow_queries.clear()
+
+    def _histogram(self, store: Dict[Tuple[str, str], Histogram], key: Tuple[str, str]) -> Histogram:
+        histogram = store.get(key)
+        if histogram is None:
+            histogram = store[key] = Histogram(self.buckets)
+        return histogram
+
+    # reflect操作
+
+    @contextmanager
+    def operation(self, table: str, op: str) -> Iterator[None]:
+        """统计一次reflect操作，期间执行的语句归属到该操作"""
+        if not self.enabled:
+            yield
+            return
+        token = _operation.set((table, op))
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[(table, op)] += 1
+            raise
+        finally:
+            self._histogram(self.operations, (table, op)).observe(time.perf_counter() - started)
+            _operation.reset(token)
+
+    def observe_operation(self, table: str, op: str, seconds: float, failed: bool = False):
+        if not self.enabled:
+            return
+        self._histogram(self.operations, (table, op)).observe(seconds)
+        if failed:
+            self.errors[(table, op)] += 1
+
+    # 原始语句
+
+    def observe_query(self, method: str, sql: str, values: Any, seconds: float):
+        if not self.enabled:
+            return
+        operation = _operation.get()
+        match = _TABLE_PATTERN.search(sql)
+        table = match.group(1) if match else (operation[0] if operation else "")
+        statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else method
+        self._histogram(self.queries, (table, statement)).observe(seconds)
+
+        stats = _request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += seconds
+            stats.fingerprints[fingerprint(sql)] += 1
+
+        if seconds >= self.slow_query_seconds:
+            entry = {
+                "time": time.time(),
+                "seconds": round(seconds, 6),
+                "table": table,
+                "operation": operation[1] if operation else None,
+                "method": method,
+                "sql": sql if len(sql) <= 2000 else sql[:2000] + "...",
+                "params": params_shape(values),
+            }
+            self.slow_queries.append(entry)
+            logger.warning(f"Slow query {seconds * 1000:.1f}ms on {table}: {entry['sql']} params={entry['params']}")
+
+    def wrap(self, method):
+        metrics = self
+
+        @functools.wraps(method)
+        async def wrapper(client, query, *args, **kwargs):
+            token = _depth.set(_depth.get() + 1)
+            started = time.perf_counter()
+            try:
+                return await method(client, query, *args, **kwargs)
+            finally:
+                if _depth.get() == 1:
+                    values = args[0] if args else kwargs.get("values")
+                    metrics.observe_query(method.__name__, str(query), values, time.perf_counter() - started)
+                _depth.reset(token)
+
+        wrapper.__reflect_metrics__ = True
+        return wrapper
+
+    @staticmethod
+    def client_classes() -> List[type]:
+        """当前连接的客户端类及其子类（事务包装类）"""
+        classes = []
+        pending = [type(client) for client in connections.all()]
+        while pending:
+            cls = pending.pop()
+            if cls in classes:
+                continue
+            classes.append(cls)
+            pending.extend(cls.__subclasses__())
+        return classes
+
+    def instrument_clients(self) -> int:
+        """在数据库客户端类上替换 execute_* 方法，ORM初始化后调用，重复调用不会重复替换"""
+        patched = 0
+        for cls in self.client_classes():
+            for name in QUERY_METHODS:
+                method = cls.__dict__.get(name)
+                if method is None or getattr(method, "__reflect_metrics__", False):
+                    continue
+                self._patched.append((cls, name, method))
+                setattr(cls, name, self.wrap(method))
+                patched += 1
+        return patched
+
+    def uninstrument_clients(self):
+        for cls, name, method in reversed(self._patched):
+            setattr(cls, name, method)
+        self._patched.clear()
+
+    # 请求
+
+    def begin_request(self) -> RequestStats:
+        stats = RequestStats()
+        _request.set(stats)
+        return stats
+
+    def end_request(self, path: str = "") -> Optional[RequestStats]:
+        """请求结束，同一语句执行次数超过阈值时警告N+1"""
+        stats = _request.get()
+        if stats is None:
+            return None
+        _request.set(None)
+        for sql, n in stats.fingerprints.items():
+            if n >= self.n_plus_one_threshold:
+                self.n_plus_one[sql] += 1
+                logger.warning(f"Possible N+1 in {path}: executed {n} times: {sql}")
+        return stats
+
+    @staticmethod
+    def current_request() -> Optional[RequestStats]:
+        return _request.get()
+
+    # 导出
+
+    def snapshot(self) -> Dict[str, Any]:
+        """进程内的统计数据"""
+        return {
+            "operations": [
+                {"table": table, "operation": op, "errors": self.errors[(table, op)], **histogram.to_dict()}
+                for (table, op), histogram in sorted(self.operations.items())
+            ],
+            "queries": [
+                {"table": table, "statement": statement, **histogram.to_dict()}
+                for (table, statement), histogram in sorted(self.queries.items())
+            ],
+            "n_plus_one": [{"sql": sql, "requests": n} for sql, n in self.n_plus_one.most_common()],
+            "slow_queries": list(self.slow_queries),
+        }
+
+    def render_prometheus(self) -> str:
+        """prometheus文本格式"""
+        lines = []
+
+        def histogram_lines(name: str, help_text: str, store: Dict[Tuple[str, str], Histogram], label: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (table, value), histogram in sorted(store.items()):
+                labels = f'table="{escape_label(table)}",{label}="{escape_label(value)}"'
+                for le, n in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {n}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        histogram_lines("reflect_operation_seconds", "Latency of reflect operations",
+                        self.operations, "operation")
+        histogram_lines("reflect_query_seconds", "Latency of database statements", self.queries, "statement")
+        lines.append("# HELP reflect_operation_errors_total Failed reflect operations")
+        lines.append("# TYPE reflect_operation_errors_total counter")
+        for (table, op), n in sorted(self.errors.items()):
+            lines.append(f'reflect_operation_errors_total{{table="{escape_label(table)}",'
+                         f'operation="{escape_label(op)}"}} {n}')
+        lines.append("# HELP reflect_n_plus_one_total Requests that repeated a statement over the threshold")
+        lines.append("# TYPE reflect_n_plus_one_total counter")
+        lines.append(f"reflect_n_plus_one_total {sum(self.n_plus_one.values())}")
+        lines.append("# HELP reflect_slow_queries Slow queries kept in the log")
+        lines.append("# TYPE reflect_slow_queries gauge")
+        lines.append(f"reflect_slow_queries {len(self.slow_queries)}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+metrics = ReflectMetrics()
+
+
+def instrumented(op: str):
+    """
+    统计reflect方法，第一个参数为表名；返回Err时计为失败
+    支持异步生成器（stream），统计完整遍历的时间
+    """
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def gen_wrapper(self, table_name, *args, **kwargs):
+                # 生成器在调用方的上下文中恢复执行，不设置 _operation，避免调用方的语句被归属到该操作
+                started = time.perf_counter()
+                failed = False
+                try:
+                    async for item in func(self, table_name, *args, **kwargs):
+                        failed = failed or getattr(item, "is_err", lambda: False)()
+                        yield item
+                finally:
+                    metrics.observe_operation(table_name, op, time.perf_counter() - started, failed)
+
+            return gen_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(self, table_name, *args, **kwargs):
+            if not metrics.enabled:
+                return await func(self, table_name, *args, **kwargs)
+            token = _operation.set((table_name, op))
+            started = time.perf_counter()
+            failed = True
+            try:
+                res = await func(self, table_name, *args, **kwargs)
+                failed = getattr(res, "is_err", lambda: False)()
+                return res
+            finally:
+                metrics.observe_operation(table_name, op, time.perf_counter() - started, failed)
+                _operation.reset(token)
+
+        return wrapper
+
+    return decorator
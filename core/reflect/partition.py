@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+import logging
+import re
+from typing import Dict, List, Optional
+
+from result import Result, Ok, Err
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from core.reflect.registry import registry
+
+logger = logging.getLogger(__name__)
+
+PARTITION_INTERVALS = ("month", "day")
+EXPIRE_POLICIES = ("detach", "drop")
+# 分区功能支持的数据库方言
+PARTITION_DIALECTS = ("postgres",)
+
+
+def period_start(value: datetime.datetime, interval: str) -> datetime.datetime:
+    """value 所在分区的开始时间（默认时区）"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    value = timezone.localtime(value)
+    start = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.replace(day=1) if interval == "month" else start
+
+
+def shift_period(start: datetime.datetime, interval: str, count: int) -> datetime.datetime:
+    """分区开始时间向后（count<0时向前）移动count个分区"""
+    if interval == "day":
+        return start + datetime.timedelta(days=count)
+    month = start.year * 12 + start.month - 1 + count
+    return start.replace(year=month // 12, month=month % 12 + 1)
+
+
+class RangePartitioner(object):
+    """
+    Postgres 按时间列的范围分区
+    普通表通过 convert 转换为分区表（主键加入分区列），提前创建后续分区，超过保留期的分区 detach 或 drop
+    分区名为 <表名>_pYYYYMM（按月）或 <表名>_pYYYYMMDD（按天），其他名称的分区不做处理
+    """
+
+    def __init__(self,
+                 table: str,
+                 column: str,
+                 interval: str = "month",
+                 precreate: int = 3,
+                 retention: int = 0,
+                 expire: str = "detach",
+                 check_interval: float = 3600):
+        self.table = table
+        self.column = column
+        self.interval = interval
+        self.precreate = precreate
+        # 保留当前分区之前的分区数，0为不清理
+        self.retention = retention
+        self.expire = expire
+        self.check_interval = check_interval
+        self.enabled = True
+        self._task: Optional[asyncio.Task] = None
+
+    def configure(self, prefix: str = "AUDIT.PARTITION"):
+        """读取分区配置"""
+        from core.conf import settings
+        if not settings:
+            return
+        self.enabled = settings.get_bool(f"{prefix}.ENABLED", self.enabled)
+        interval = settings.get_str(f"{prefix}.INTERVAL", self.interval)
+        if interval not in PARTITION_INTERVALS:
+            logger.warning(f"Unknown partition interval {interval}, fallback to month")
+            interval = "month"
+        self.interval = interval
+        self.precreate = settings.get_int(f"{prefix}.PRECREATE", self.precreate)
+        self.retention = settings.get_int(f"{prefix}.RETENTION", self.retention)
+        expire = settings.get_str(f"{prefix}.EXPIRE", self.expire)
+        if expire not in EXPIRE_POLICIES:
+            logger.warning(f"Unknown partition expire policy {expire}, fallback to detach")
+            expire = "detach"
+        self.expire = expire
+        self.check_interval = settings.get_float(f"{prefix}.CHECK_INTERVAL", self.check_interval)
+
+    @property
+    def _name_pattern(self):
+        digits = 6 if self.interval == "month" else 8
+        return re.compile(rf'^{re.escape(self.table)}_p(\d{{{digits}}})$')
+
+    def partition_name(self, start: datetime.datetime) -> str:
+        return f"{self.table}_p{start:%Y%m}" if self.interval == "month" else f"{self.table}_p{start:%Y%m%d}"
+
+    def partition_start(self, name: str) -> Optional[datetime.datetime]:
+        """从分区名解析分区开始时间，不是本分区规则的名称返回None"""
+        match = self._name_pattern.match(name)
+        if not match:
+            return None
+        fmt = "%Y%m" if self.interval == "month" else "%Y%m%d"
+        value = datetime.datetime.strptime(match.group(1), fmt)
+        return value.replace(tzinfo=timezone.get_default_timezone())
+
+    def cutoff(self, now: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+        """结束时间不晚于该时间的分区已过期，retention为0时不过期"""
+        if self.retention <= 0:
+            return None
+        return shift_period(period_start(now or timezone.now(), self.interval), self.interval, -self.retention)
+
+    def _model(self):
+        return registry.model(self.table).unwrap()
+
+    @staticmethod
+    def _literal(value: datetime.datetime) -> str:
+        return f"'{value.isoformat()}'"
+
+    async def _relkind(self, db) -> Optional[str]:
+        """r 普通表，p 分区表，不存在时为None"""
+        rows = await db.execute_query_dict(
+            "SELECT relkind::text AS relkind FROM pg_class WHERE oid = to_regclass($1)", [self.table])
+        return rows[0]["relkind"] if rows else None
+
+    async def partitions(self, db) -> Dict[str, datetime.datetime]:
+        """{分区名: 开始时间}，按开始时间排序"""
+        rows = await db.execute_query_dict(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass($1)", [self.table])
+        found = [(row["relname"], self.partition_start(row["relname"])) for row in rows]
+        return dict(sorted(((name, start) for name, start in found if start is not None), key=lambda item: item[1]))
+
+    async def _create_partition(self, db, start: datetime.datetime) -> str:
+        name = self.partition_name(start)
+        end = shift_period(start, self.interval, 1)
+        await db.execute_script(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{self.table}" '
+            f'FOR VALUES FROM ({self._literal(start)}) TO ({self._literal(end)})')
+        return name
+
+    def index_statements(self) -> List[str]:
+        """按模型的 Meta.indexes 和字段的 index=True 建立索引，分区表上的索引自动建立到各分区"""
+        model = self._model()
+        groups = [tuple(index) for index in model._meta.indexes if isinstance(index, (tuple, list))]
+        groups += [(name,) for name, field in model._meta.fields_map.items() if field.index and not field.pk]
+        statements = []
+        for group in dict.fromkeys(groups):
+            columns = [model._meta.fields_map[name].source_field or name for name in group]
+            name = f"idx_{self.table}_{'_'.join(columns)}"[:63]
+            quoted = ", ".join(f'"{column}"' for column in columns)
+            statements.append(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{self.table}" ({quoted})')
+        return statements
+
+    async def _retire(self, db, legacy: str):
+        """原表的索引和约束改名，避免与新表的索引名冲突"""
+        rows = await db.execute_query_dict(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass($1) ORDER BY c.relname", [legacy])
+        for i, row in enumerate(rows):
+            # 约束对应的索引改名时约束一起改名
+            await db.execute_script(f'ALTER INDEX "{row["relname"]}" RENAME TO "{legacy}_idx{i}"')
+
+    async def _convert(self, db, now: datetime.datetime) -> int:
+        """
+        普通表转换为分区表：原表改名为 <表名>_unpartitioned 后用 LIKE 建立分区表，主键改为(主键, 分区列)，序列转移到新表
+        建立从最早到最晚记录的分区并复制全部记录，原表保留（确认后手动删除），过期分区由 maintain 按 expire 处理
+        :return: 复制的记录数
+        """
+        model = self._model()
+        pk = model._meta.db_pk_column
+        legacy = f"{self.table}_unpartitioned"
+        rows = await db.execute_query_dict("SELECT to_regclass($1)::text AS name", [legacy])
+        if rows and rows[0]["name"]:
+            raise RuntimeError(f"{legacy} already exists, drop or rename it before converting {self.table}")
+        await db.execute_script(f'ALTER TABLE "{self.table}" RENAME TO "{legacy}"')
+        await self._retire(db, legacy)
+        await db.execute_script(
+            f'CREATE TABLE "{self.table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING COMMENTS) '
+            f'PARTITION BY RANGE ("{self.column}")')
+        rows = await db.execute_query_dict("SELECT pg_get_serial_sequence($1, $2) AS seq", [legacy, pk])
+        if rows and rows[0]["seq"]:
+            await db.execute_script(f'ALTER SEQUENCE {rows[0]["seq"]} OWNED BY "{self.table}"."{pk}"')
+        await db.execute_script(
+            f'ALTER TABLE "{self.table}" ADD CONSTRAINT "{self.table}_pkey" PRIMARY KEY ("{pk}", "{self.column}")')
+        for statement in self.index_statements():
+            await db.execute_script(statement)
+
+        rows = await db.execute_query_dict(
+            f'SELECT min("{self.column}") AS oldest, max("{self.column}") AS newest FROM "{legacy}"')
+        oldest, newest = (rows[0]["oldest"], rows[0]["newest"]) if rows else (None, None)
+        current = period_start(oldest or now, self.interval)
+        last = period_start(max(newest, now) if newest is not None else now, self.interval)
+        while current <= last:
+            await self._create_partition(db, current)
+            current = shift_period(current, self.interval, 1)
+        copied = 0
+        if oldest is not None:
+            rows = await db.execute_query_dict(
+                f'WITH copied AS (INSERT INTO "{self.table}" SELECT * FROM "{legacy}" RETURNING 1) '
+                f'SELECT count(*) AS n FROM copied')
+            copied = rows[0]["n"]
+        return copied
+
+    async def convert(self, now: Optional[datetime.datetime] = None) -> Result[int, Exception]:
+        """
+        普通表在一个事务中转换为分区表，由 partition-logger 命令执行，服务启动时不自动转换
+        :return: 复制的记录数，已经是分区表或数据库不支持分区时为0
+        """
+        try:
+            db = self._model()._meta.db
+            if db.capabilities.dialect not in PARTITION_DIALECTS:
+                return Ok(0)
+            async with in_transaction(db.connection_name) as conn:
+                await conn.execute_query("SELECT pg_advisory_xact_lock(hashtext($1))", [self.table])
+                if await self._relkind(conn) != "r":
+                    return Ok(0)
+                copied = await self._convert(conn, now or timezone.now())
+            logger.info(f"Converted {self.table} to a partitioned table, {copied} rows copied, "
+                        f"the original table is kept as {self.table}_unpartitioned")
+            return Ok(copied)
+        except Exception as exc:
+            return Err(exc)
+
+    async def maintain(self, now: Optional[datetime.datetime] = None) -> Result[Dict[str, List[str]], Exception]:
+        """
+        建立当前及后续 precreate 个分区，处理过期分区；普通表需要先用 convert 转换
+        多个工作进程同时执行时通过 advisory lock 串行
+        :return: {"created": [...], "expired": [...]}，数据库不支持分区或未启用时为空
+        """
+        result = {"created": [], "expired": []}
+        try:
+            if not self.enabled:
+                return Ok(result)
+            db = self._model()._meta.db
+            if db.capabilities.dialect not in PARTITION_DIALECTS:
+                return Ok(result)
+            now = now or timezone.now()
+            async with in_transaction(db.connection_name) as conn:
+                await conn.execute_query("SELECT pg_advisory_xact_lock(hashtext($1))", [self.table])
+                relkind = await self._relkind(conn)
+                if relkind is None:
+                    return Ok(result)
+                if relkind == "r":
+                    logger.warning(f"{self.table} is not partitioned, run partition-logger to convert it")
+                    return Ok(result)
+                existing = await self.partitions(conn)
+                current = period_start(now, self.interval)
+                for offset in range(self.precreate + 1):
+                    start = shift_period(current, self.interval, offset)
+                    name = self.partition_name(start)
+                    if name not in existing:
+                        await self._create_partition(conn, start)
+                        result["created"].append(name)
+                cutoff = self.cutoff(now)
+                if cutoff is not None:
+                    for name, start in existing.items():
+                        if shift_period(start, self.interval, 1) > cutoff:
+                            break
+                        await conn.execute_script(f'ALTER TABLE "{self.table}" DETACH PARTITION "{name}"')
+                        if self.expire == "drop":
+                            await conn.execute_script(f'DROP TABLE "{name}"')
+                        result["expired"].append(name)
+            if result["created"] or result["expired"]:
+                logger.info(f"Partitions of {self.table}: created {result['created']}, "
+                            f"{self.expire} {result['expired']}")
+            return Ok(result)
+        except Exception as exc:
+            return Err(exc)
+
+    def start(self):
+        """在工作进程中定期执行 maintain"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"{self.table}-partitions")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            res = await self.maintain()
+            if not res.is_ok():
+                logger.error(f"Failed to maintain partitions of {self.table}: {res.err_value}")
+            await asyncio.sleep(self.check_interval)
+
+
+logger_partitions = RangePartitioner("ir_logger", "create_date")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+from typing import Dict, List, Optional, Tuple, Type
+
+from tortoise import Tortoise
+from tortoise.models import Model
+from result import Result, Ok, Err
+
+logger = logging.getLogger(__name__)
+
+
+class M2MInfo(object):
+    """多对多字段的中间表信息"""
+    __slots__ = ('name', 'related_model', 'through', 'through_schema', 'backward_key', 'forward_key')
+
+    def __init__(self, name: str, field):
+        self.name = name
+        self.related_model: Type[Model] = field.related_model
+        self.through: str = field.through
+        self.through_schema: Optional[str] = field.through_schema
+        self.backward_key: str = field.backward_key
+        self.forward_key: str = field.forward_key
+
+
+class ModelInfo(object):
+    """从 Model._meta 预先计算的模型元数据"""
+    __slots__ = ('model', 'name', 'app', 'table', 'pk_attr', 'pk_column', 'columns', 'fk', 'm2m')
+
+    def __init__(self, app: str, name: str, model: Type[Model]):
+        meta = model._meta
+        self.model = model
+        self.name = name
+        self.app = app
+        self.table: str = meta.db_table
+        self.pk_attr: str = meta.pk_attr
+        self.pk_column: str = meta.db_pk_column
+        # {字段名: 列名}，不包含反向关系和多对多字段
+        self.columns: Dict[str, str] = dict(meta.fields_db_projection)
+        # {外键字段名: (列字段名, 关联模型)}
+        self.fk: Dict[str, Tuple[str, Type[Model]]] = {
+            field_name: (meta.fields_map[field_name].source_field or f"{field_name}_id",
+                         meta.fields_map[field_name].related_model)
+            for field_name in meta.fk_fields
+        }
+        self.m2m: Dict[str, M2MInfo] = {
+            field_name: M2MInfo(field_name, meta.fields_map[field_name]) for field_name in meta.m2m_fields
+        }
+
+    def __repr__(self) -> str:
+        return f"ModelInfo({self.app}.{self.name} -> {self.table})"
+
+
+class ModelRegistry(object):
+    """
+    进程内共享的模型注册表，Tortoise初始化后第一次查找时构建
+    Tortoise重新初始化（apps对象变化）时自动重建，也可以调用invalidate显式失效
+    """
+
+    def __init__(self):
+        self._apps = None
+        self._infos: List[ModelInfo] = []
+        # {表名/模型名/小写别名: 模型信息}
+        self._index: Dict[str, ModelInfo] = {}
+        self._by_model: Dict[Type[Model], ModelInfo] = {}
+
+    def build(self) -> Result[int, Exception]:
+        """根据 Tortoise.apps 构建索引，返回模型数量"""
+        try:
+            apps = Tortoise.apps
+            if apps is None:
+                return Err(RuntimeError("Tortoise is not initialized"))
+            infos, index, by_model = [], {}, {}
+            for app_name, models in apps.items():
+                for model_name, model_class in models.items():
+                    info = ModelInfo(app_name, model_name, model_class)
+                    infos.append(info)
+                    by_model[model_class] = info
+                    # 表名优先，模型名与小写别名不覆盖已有的表名
+                    index[info.table] = info
+            for info in infos:
+                for alias in (info.name, info.name.lower(), info.table.lower(), f"{info.app}.{info.name}"):
+                    index.setdefault(alias, info)
+            self._apps, self._infos, self._index, self._by_model = apps, infos, index, by_model
+            logger.debug(f"Model registry built with {len(infos)} models")
+            return Ok(len(infos))
+        except Exception as exc:
+            return Err(exc)
+
+    def invalidate(self):
+        """模型重新注册后调用，下次查找时重建"""
+        self._apps = None
+        self._infos, self._index, self._by_model = [], {}, {}
+
+    def ensure(self) -> Result[bool, Exception]:
+        if self._apps is not None and self._apps is Tortoise.apps:
+            return Ok(True)
+        res = self.build()
+        if not res.is_ok():
+            return Err(res.err_value)
+        return Ok(True)
+
+    def info(self, identifier: str) -> Result[ModelInfo, Exception]:
+        """根据表名、模型名或小写别名获取模型信息"""
+        res = self.ensure()
+        if not res.is_ok():
+            return Err(res.err_value)
+        info = self._index.get(identifier) or self._index.get(identifier.lower())
+        if info is None:
+            return Err(ValueError(f"Model '{identifier}' not found. Available models: {list(self._index)}"))
+        return Ok(info)
+
+    def info_of(self, model: Type[Model]) -> Result[ModelInfo, Exception]:
+        """根据模型类获取模型信息"""
+        res = self.ensure()
+        if not res.is_ok():
+            return Err(res.err_value)
+        info = self._by_model.get(model)
+        if info is None:
+            return Err(ValueError(f"Model {model.__name__} is not registered"))
+        return Ok(info)
+
+    def model(self, identifier: str) -> Result[Type[Model], Exception]:
+        res = self.info(identifier)
+        if not res.is_ok():
+            return Err(res.err_value)
+        return Ok(res.ok_value.model)
+
+    def models(self) -> Result[Dict[str, Type[Model]], Exception]:
+        """{表名/模型名/别名: 模型类}"""
+        res = self.ensure()
+        if not res.is_ok():
+            return Err(res.err_value)
+        return Ok({alias: info.model for alias, info in self._index.items()})
+
+
+registry = ModelRegistry()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from result import Result, Ok, Err
+from tortoise import timezone
+from tortoise.expressions import RawSQL
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from core.reflect.cache import query_cache
+from core.reflect.partition import period_start
+from core.reflect.registry import registry
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_PERIODS = ("hour", "day")
+# 汇总的维度
+ROLLUP_DIMENSIONS = ("log_type", "is_success", "ip_address")
+# 按小时截断 create_date（UTC）；MySQL 的参数占位为 %s，格式中的 % 需要转义
+HOUR_BUCKETS = {
+    "postgres": "date_trunc('hour', \"create_date\" AT TIME ZONE 'UTC')",
+    "sqlite": "strftime('%Y-%m-%d %H:00:00', \"create_date\")",
+    "mysql": "DATE_FORMAT(`create_date`, '%%Y-%%m-%%d %%H:00:00')",
+}
+
+
+def floor_hour(value: datetime.datetime) -> datetime.datetime:
+    return value.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def as_utc(value: Any) -> datetime.datetime:
+    """驱动返回的小时（字符串或不带时区的UTC时间）转为带时区的UTC时间"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+class LogRollup(object):
+    """
+    ir_logger 按小时、按天汇总到 ir_logger_rollup
+    每次从最后一个小时汇总（以及 late_seconds 内可能迟到的日志）开始重新计算，结果覆盖写入，重复执行结果相同
+    按天的汇总由当天的小时汇总相加，天的边界使用默认时区
+    """
+
+    def __init__(self,
+                 source: str = "ir_logger",
+                 target: str = "ir_logger_rollup",
+                 late_seconds: float = 300,
+                 window_hours: int = 24):
+        self.source = source
+        self.target = target
+        # 批量写入(audit_sink)等原因导致日志晚于 create_date 写入的最长时间
+        self.late_seconds = late_seconds
+        # 每个事务汇总的小时数，首次执行时按该窗口分段回填历史数据
+        self.window_hours = window_hours
+
+    def configure(self, prefix: str = "AUDIT.ROLLUP"):
+        """读取汇总配置"""
+        from core.conf import settings
+        if not settings:
+            return
+        self.late_seconds = settings.get_float(f"{prefix}.LATE_SECONDS", self.late_seconds)
+        self.window_hours = settings.get_int(f"{prefix}.WINDOW_HOURS", self.window_hours)
+
+    async def _start(self, source, target, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """本次汇总的开始小时，没有日志时为None"""
+        last = await target.filter(period="hour").order_by("-bucket").first().values_list("bucket", flat=True)
+        if last is None:
+            oldest = await source.all().order_by("create_date").first().values_list("create_date", flat=True)
+            return floor_hour(oldest) if oldest is not None else None
+        late = now - datetime.timedelta(seconds=self.late_seconds)
+        return floor_hour(min(as_utc(last), late))
+
+    async def _hourly(self, conn, source, start: datetime.datetime, end: datetime.datetime) -> List[Dict[str, Any]]:
+        dialect = conn.capabilities.dialect
+        if dialect not in HOUR_BUCKETS:
+            raise NotImplementedError(f"Log rollup is not supported on {dialect}")
+        rows = await (source.filter(create_date__gte=start, create_date__lt=end)
+                      .using_db(conn)
+                      .annotate(bucket=RawSQL(HOUR_BUCKETS[dialect]), n=Count("id"))
+                      .group_by("bucket", *ROLLUP_DIMENSIONS)
+                      .values("bucket", "n", *ROLLUP_DIMENSIONS))
+        return [{
+            "bucket": as_utc(row["bucket"]),
+            "log_type": row["log_type"],
+            "is_success": bool(row["is_success"]),
+            "ip_address": row["ip_address"] or "",
+            "count": row["n"],
+        } for row in rows]
+
+    async def _replace(self, conn, target, period: str, start, end, rows: List[Dict[str, Any]]):
+        await target.filter(period=period, bucket__gte=start, bucket__lt=end).using_db(conn).delete()
+        if rows:
+            await target.bulk_create([target(period=period, **row) for row in rows], using_db=conn)
+
+    async def _daily(self, conn, target, start: datetime.datetime, end: datetime.datetime) -> int:
+        """重新计算 [start, end) 涉及的整天"""
+        day_start = period_start(start, "day")
+        day_end = period_start(end - datetime.timedelta(microseconds=1), "day") + datetime.timedelta(days=1)
+        rows = await (target.filter(period="hour", bucket__gte=day_start, bucket__lt=day_end)
+                      .using_db(conn)
+                      .values_list("bucket", "count", *ROLLUP_DIMENSIONS))
+        totals = defaultdict(int)
+        for bucket, count, *dims in rows:
+            totals[(period_start(as_utc(bucket), "day"), *dims)] += count
+        await self._replace(conn, target, "day", day_start, day_end, [
+            {"bucket": bucket, **dict(zip(ROLLUP_DIMENSIONS, dims)), "count": count}
+            for (bucket, *dims), count in totals.items()
+        ])
+        return len(totals)
+
+    async def run(self, now: Optional[datetime.datetime] = None) -> Result[Dict[str, int], Exception]:
+        """
+        增量汇总到当前时间（当前小时与当天为部分结果，下次执行时覆盖）
+        :return: {"hour": 写入的小时汇总行数, "day": 写入的天汇总行数}
+        """
+        written = {"hour": 0, "day": 0}
+        try:
+            source = registry.model(self.source).unwrap()
+            target = registry.model(self.target).unwrap()
+            db = target._meta.db
+            now = now or timezone.now()
+            start = await self._start(source, target, now)
+            if start is None:
+                return Ok(written)
+            end = floor_hour(now) + datetime.timedelta(hours=1)
+            window = datetime.timedelta(hours=max(self.window_hours, 1))
+            while start < end:
+                stop = min(start + window, end)
+                async with in_transaction(db.connection_name) as conn:
+                    if conn.capabilities.dialect == "postgres":
+                        # 多个worker同时执行时串行
+                        await conn.execute_query("SELECT pg_advisory_xact_lock(hashtext($1))", [self.target])
+                    hourly = await self._hourly(conn, source, start, stop)
+                    await self._replace(conn, target, "hour", start, stop, hourly)
+                    written["hour"] += len(hourly)
+                    written["day"] += await self._daily(conn, target, start, stop)
+                # 提交后失效汇总表的查询缓存
+                await query_cache.invalidate(target._meta.db_table)
+                start = stop
+            return Ok(written)
+        except Exception as exc:
+            return Err(exc)
+
+
+log_rollup = LogRollup()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Type
+
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient, TransactionalDBClient
+from tortoise.models import Model
+
+logger = logging.getLogger(__name__)
+
+# 当前上下文（请求/任务）最后一次写入的时间
+_last_write: ContextVar[float] = ContextVar("replica_router_last_write", default=0.0)
+
+
+class ReplicaRouter(object):
+    """
+    读写分离路由，读取按 round_robin 或 least_busy 选择只读副本
+    事务中、以及同一上下文写入后 read_after_write 秒内的读取仍然走主库
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.policy = "round_robin"
+        self.read_after_write = 1.0
+        self._cycle = None
+        self._busy: Dict[str, int] = {}
+
+    def configure(self, names: List[str], policy: str = "round_robin", read_after_write: float = 1.0):
+        """
+        :param names: 已注册的只读副本连接名称
+        :param policy: round_robin、least_busy
+        :param read_after_write: 写入后读取主库的秒数
+        """
+        if policy not in ("round_robin", "least_busy"):
+            logger.warning(f"Unknown replica policy {policy}, fallback to round_robin")
+            policy = "round_robin"
+        self.names = list(names)
+        self.policy = policy
+        self.read_after_write = read_after_write
+        self._cycle = itertools.cycle(self.names) if self.names else None
+        self._busy = {name: 0 for name in self.names}
+
+    @staticmethod
+    def mark_write():
+        """记录当前上下文的写入时间"""
+        _last_write.set(time.monotonic())
+
+    @staticmethod
+    def transaction(model: Type[Model]) -> Optional[TransactionalDBClient]:
+        """当前上下文中模型连接上的事务，不在事务中时返回None"""
+        # in_transaction 中 connections.get 返回事务连接
+        client = connections.get(model._meta.default_connection)
+        return client if isinstance(client, TransactionalDBClient) else None
+
+    def use_primary(self, model: Type[Model]) -> bool:
+        if not self.names:
+            return True
+        if self.transaction(model) is not None:
+            return True
+        return time.monotonic() - _last_write.get() < self.read_after_write
+
+    def choose(self) -> str:
+        if self.policy == "least_busy":
+            # 并发最少的副本，相同时按轮询顺序
+            start = next(self._cycle)
+            index = self.names.index(start)
+            ordered = self.names[index:] + self.names[:index]
+            return min(ordered, key=lambda name: self._busy[name])
+        return next(self._cycle)
+
+    @asynccontextmanager
+    async def read(self, model: Type[Model]) -> AsyncIterator[Optional[BaseDBAsyncClient]]:
+        """
+        获取读取使用的连接，返回None时使用模型默认连接（主库）
+        async with router.read(model_cls) as db:
+            await model_cls.filter(...).using_db(db)
+        """
+        if self.use_primary(model):
+            yield None
+            return
+        name = self.choose()
+        self._busy[name] += 1
+        try:
+            yield connections.get(name)
+        finally:
+            self._busy[name] -= 1
+
+
+router = ReplicaRouter()
@@ -8,9 +8,10 @@ scheduler = SanicScheduler()
 
 if __name__ == '__main__':
     if app is not None:
-        @app.listener('main_process_start')  # 只在主进程执行一次
-        async def main_process_start(srv, loop):
-            await load_data(srv, loop)
+        if getattr(app.ctx, 'load_data', True):
+            @app.listener('main_process_start')  # 只在主进程执行一次
+            async def main_process_start(srv, loop):
+                await load_data(srv, loop)
 
 
         app.run(
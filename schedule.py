@@ -115,8 +115,8 @@ app = Celery(
 
 # 引入 RedisBeat 调度器配置
 app.conf.update(
-    # 使用 RedisBeat 作为 Beat 调度器
-    CELERY_BEAT_SCHEDULER='redisbeat.RedisScheduler',
+    # 使用 RedisBeat 作为 Beat 调度器，子类跳过禁用的任务
+    CELERY_BEAT_SCHEDULER='tokio.scheduler:RedisBeatScheduler',
     # 指定 RedisBeat 连接 Redis 的 URL (通常与 Broker 一致)
     CELERY_REDIS_SCHEDULER_URL=os.environ.get('CELERY_BROKER'),
     # 如果想在配置中预设静态定时任务，可以保留 CELERYBEAT_SCHEDULE
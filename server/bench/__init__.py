@@ -0,0 +1,5 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""数据加载(Parse2XML)基准测试：生成合成数据集并测量解析与写入性能"""
+from server.bench.generator import generate_dataset
+from server.bench.runner import BenchResult, QueryCounter, run_benchmark
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+from mimesis import Person
+from mimesis.locales import Locale
+from result import Result, Ok, Err
+
+logger = logging.getLogger(__name__)
+
+BENCH_MODULE = "bench"
+
+# 轻量eval在事件循环中执行，重量eval（低轮数bcrypt）会被放到进程池
+LIGHT_EVAL = 'hashlib.sha1("{seed}".encode()).hexdigest()'
+HEAVY_EVAL = 'bcrypt.hashpw("{seed}".encode(), bcrypt.gensalt(4)).decode()'
+
+
+def generate_dataset(output_dir: str,
+                     records: int = 1000,
+                     tags: int = 100,
+                     ref_density: float = 0.3,
+                     fanout: int = 3,
+                     eval_ratio: float = 0.1,
+                     heavy_eval: bool = False,
+                     seed: int = 0,
+                     locale: str = "en") -> Result[str, Exception]:
+    """
+    生成合成的manifest与数据文件，逐行写入，百万级记录也不会占用大量内存
+    :param output_dir: 输出目录
+    :param records: bench_partner 记录数量
+    :param tags: bench_tag 记录数量，作为多对多关联目标
+    :param ref_density: 引用之前某条 bench_partner 作为 parent 的记录比例
+    :param fanout: 每条记录多对多关联的最大标签数量，实际数量在 0~fanout 之间随机
+    :param eval_ratio: 包含eval字段的记录比例
+    :param heavy_eval: eval字段使用bcrypt，测试进程池的效果
+    :param seed: 随机种子，相同参数生成相同的数据
+    :param locale: mimesis 语言
+    :return: manifest文件路径
+    """
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        rnd = random.Random(seed)
+        person = Person(Locale(locale), seed=seed)
+        tags = max(1, tags)
+
+        tags_path = os.path.join(output_dir, "tags.xml")
+        with open(tags_path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8" ?>\n<pyra>\n')
+            for i in range(tags):
+                f.write(f'    <record id="tag_{i}" model="bench_tag">'
+                        f'<field name="name">{escape(person.occupation())}</field></record>\n')
+            f.write('</pyra>\n')
+
+        partners_path = os.path.join(output_dir, "partners.xml")
+        template = HEAVY_EVAL if heavy_eval else LIGHT_EVAL
+        with open(partners_path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8" ?>\n<pyra>\n')
+            for i in range(records):
+                fields = [
+                    f'<field name="name">{escape(person.full_name())}</field>',
+                    f'<field name="email">{escape(person.email())}</field>',
+                ]
+                if i and rnd.random() < ref_density:
+                    fields.append(f'<field name="parent" ref="{BENCH_MODULE}.partner_{rnd.randrange(i)}"/>')
+                n_tags = rnd.randint(0, fanout) if fanout > 0 else 0
+                if n_tags:
+                    refs = ", ".join(f"(4, '{BENCH_MODULE}.tag_{t}')" for t in rnd.sample(range(tags), min(n_tags, tags)))
+                    fields.append(f'<field name="tags" eval={quoteattr(f"[{refs}]")}/>')
+                if rnd.random() < eval_ratio:
+                    code = template.format(seed=f"{seed}-{i}")
+                    fields.append(f'<field name="code">eval("""{escape(code)}""")</field>')
+                f.write(f'    <record id="partner_{i}" model="bench_partner">{"".join(fields)}</record>\n')
+            f.write('</pyra>\n')
+
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "name": BENCH_MODULE,
+                "version": "1.0.0",
+                "data": [os.path.abspath(tags_path), os.path.abspath(partners_path)],
+            }, f, indent=2)
+        logger.info(f"Generated {records} records ({tags} tags) to {output_dir}")
+        return Ok(manifest_path)
+    except Exception as exc:
+        return Err(exc)
+
+
+def dataset_dir(base_dir: str, records: int, **options) -> str:
+    """按记录数与参数生成数据集目录名称，参数相同时复用已生成的数据"""
+    suffix = "-".join(f"{key}{value}" for key, value in sorted(options.items()) if value is not None)
+    return os.path.join(base_dir, f"{records}" + (f"-{suffix}" if suffix else ""))
+
+
+def ensure_dataset(base_dir: str, records: int, **options) -> Result[str, Exception]:
+    """数据集不存在时生成，返回manifest路径"""
+    output_dir = dataset_dir(base_dir, records, **options)
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        return Ok(manifest_path)
+    return generate_dataset(output_dir, records=records, **options)
+
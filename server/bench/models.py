@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from tortoise import fields, models
+
+
+class BenchTag(models.Model):
+    id = fields.IntField(pk=True)
+
+    name = fields.CharField(max_length=128, description="名称")
+
+    class Meta:
+        table = "bench_tag"
+        table_description = "基准测试标签"
+
+
+class BenchPartner(models.Model):
+    id = fields.IntField(pk=True)
+
+    name = fields.CharField(max_length=128, description="名称")
+    email = fields.CharField(max_length=255, null=True, description="邮箱")
+    code = fields.CharField(max_length=255, null=True, description="eval生成的值")
+    parent = fields.ForeignKeyField(
+        "models.BenchPartner", related_name="children", null=True, on_delete=fields.SET_NULL, description="上级")
+    tags = fields.ManyToManyField(
+        "models.BenchTag", related_name="partners", through="bench_partner_tag", description="标签")
+
+    class Meta:
+        table = "bench_partner"
+        table_description = "基准测试伙伴"
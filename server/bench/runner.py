@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import functools
+import json
+import logging
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+from result import Result, Ok, Err
+from tortoise import Tortoise, connections
+
+from server.bench.generator import BENCH_MODULE, ensure_dataset
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("parse", "load", "bulk")
+DEFAULT_SIZES = (1000, 100000, 1000000)
+BENCH_MODELS = ['apps.web.models', 'server.bench.models']
+QUERY_METHODS = ('execute_query', 'execute_query_dict', 'execute_insert', 'execute_many', 'execute_script')
+
+
+class BenchResult(BaseModel):
+    scenario: str
+    records: int
+    seconds: float
+    queries: int = 0
+    # tracemalloc 统计的Python内存峰值(字节)，未开启时为0
+    peak_memory: int = 0
+
+    @property
+    def rate(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+
+class QueryCounter(object):
+    """统计数据库客户端执行的语句数量，在类上替换 execute_* 方法，事务连接也会被统计"""
+
+    _depth: ContextVar[int] = ContextVar("bench_query_depth", default=0)
+
+    def __init__(self):
+        self.count = 0
+        self._patched: List[tuple] = []
+
+    @staticmethod
+    def client_classes() -> List[type]:
+        """当前连接的客户端类及其子类（事务包装类）"""
+        classes = []
+        pending = [type(client) for client in connections.all()]
+        while pending:
+            cls = pending.pop()
+            if cls in classes:
+                continue
+            classes.append(cls)
+            pending.extend(cls.__subclasses__())
+        return classes
+
+    def wrap(self, method):
+        counter = self
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            # 子类方法调用父类方法时只统计一次
+            token = counter._depth.set(counter._depth.get() + 1)
+            try:
+                if counter._depth.get() == 1:
+                    counter.count += 1
+                return await method(*args, **kwargs)
+            finally:
+                counter._depth.reset(token)
+
+        return wrapper
+
+    def __enter__(self) -> 'QueryCounter':
+        for cls in self.client_classes():
+            for name in QUERY_METHODS:
+                if name in cls.__dict__:
+                    self._patched.append((cls, name, cls.__dict__[name]))
+                    setattr(cls, name, self.wrap(cls.__dict__[name]))
+        return self
+
+    def __exit__(self, *exc_info):
+        for cls, name, method in reversed(self._patched):
+            setattr(cls, name, method)
+        self._patched.clear()
+
+
+async def init_bench_db(db_url: str) -> Result[bool, Exception]:
+    """初始化基准测试数据库并清空上次运行写入的数据"""
+    try:
+        await Tortoise.init(db_url=db_url, modules={'models': BENCH_MODELS})
+        await Tortoise.generate_schemas(safe=True)
+        from apps.web.models import IrModelData, IrModelDataFile
+        from server.bench.models import BenchPartner, BenchTag
+        await BenchPartner.all().update(parent_id=None)
+        await BenchPartner.all().delete()
+        await BenchTag.all().delete()
+        await IrModelData.filter(module=BENCH_MODULE).delete()
+        await IrModelDataFile.filter(module=BENCH_MODULE).delete()
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def data_files(manifest_path: str) -> List[str]:
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("data", [])
+
+
+async def bench_parse(manifest_path: str, trace_memory: bool = True) -> Result[BenchResult, Exception]:
+    """只流式解析数据文件，不访问数据库"""
+    from server.parse2xml import Parse2XML
+    parse = Parse2XML(incremental=False)
+    records = 0
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        for path in data_files(manifest_path):
+            for res in parse.iter_records(path):
+                if not res.is_ok():
+                    return Err(res.err_value)
+                records += 1
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        return Ok(BenchResult(scenario="parse", records=records, seconds=seconds, peak_memory=peak))
+    except Exception as exc:
+        return Err(exc)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+
+async def bench_load(manifest_path: str,
+                     db_url: str,
+                     bulk: bool = False,
+                     trace_memory: bool = True) -> Result[BenchResult, Exception]:
+    """完整加载数据文件到空的数据库，统计语句数量"""
+    from server.parse2xml import Parse2XML
+    init_result = await init_bench_db(db_url)
+    if not init_result.is_ok():
+        await Tortoise.close_connections()
+        return Err(init_result.err_value)
+    parse = Parse2XML(bulk=bulk, incremental=False)
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with QueryCounter() as counter:
+            started = time.perf_counter()
+            res = await parse.load([(BENCH_MODULE, manifest_path)])
+            seconds = time.perf_counter() - started
+        if not res.is_ok():
+            return Err(res.err_value)
+        failed = [path for (_, path), file_result in res.ok_value.items() if not file_result.is_ok()]
+        if failed:
+            return Err(RuntimeError(f"Failed to load data files: {failed}"))
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        return Ok(BenchResult(
+            scenario="bulk" if bulk else "load",
+            records=parse.stats["records_created"] + parse.stats["records_updated"],
+            seconds=seconds,
+            queries=counter.count,
+            peak_memory=peak,
+        ))
+    except Exception as exc:
+        return Err(exc)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        await Tortoise.close_connections()
+
+
+async def run_benchmark(sizes: Optional[List[int]] = None,
+                        scenarios: Optional[List[str]] = None,
+                        data_dir: str = "bench_data",
+                        db_url: str = "sqlite://:memory:",
+                        trace_memory: bool = True,
+                        **options: Any) -> Result[List[BenchResult], Exception]:
+    """
+    按记录数量依次运行各个场景
+    :param sizes: 记录数量，默认 1k、100k、1M
+    :param scenarios: parse(只解析)、load(逐条写入)、bulk(批量写入)
+    :param data_dir: 合成数据集目录，参数相同的数据集会被复用
+    :param db_url: 基准测试使用的数据库，会清空 bench_* 表和 bench 模块的 ir_model_data
+    :param trace_memory: 使用tracemalloc统计内存峰值，会降低吞吐量
+    :param options: 传递给 generate_dataset 的参数
+    """
+    results = []
+    for size in sizes or DEFAULT_SIZES:
+        dataset_result = ensure_dataset(data_dir, size, **options)
+        if not dataset_result.is_ok():
+            return Err(dataset_result.err_value)
+        manifest_path = dataset_result.ok_value
+        for scenario in scenarios or SCENARIOS:
+            if scenario == "parse":
+                res = await bench_parse(manifest_path, trace_memory)
+            elif scenario in ("load", "bulk"):
+                res = await bench_load(manifest_path, db_url, scenario == "bulk", trace_memory)
+            else:
+                return Err(ValueError(f"Unknown scenario: {scenario}"))
+            if not res.is_ok():
+                logger.error(f"Benchmark {scenario} of {size} records failed: {res.err_value}")
+                return Err(res.err_value)
+            logger.info(format_results([res.ok_value], header=False))
+            results.append(res.ok_value)
+    return Ok(results)
+
+
+def format_results(results: List[BenchResult], header: bool = True) -> str:
+    """格式化为文本表格"""
+    lines = []
+    if header:
+        lines.append(f"{'scenario':<10}{'records':>10}{'seconds':>10}{'rec/s':>12}{'queries':>10}{'peak MB':>10}")
+    for r in results:
+        lines.append(f"{r.scenario:<10}{r.records:>10}{r.seconds:>10.2f}{r.rate:>12.0f}"
+                     f"{r.queries:>10}{r.peak_memory / 1024 / 1024:>10.1f}")
+    return "\n".join(lines)
+
+
+def results_json(results: List[BenchResult]) -> List[Dict[str, Any]]:
+    return [{**r.model_dump(), "rate": r.rate} for r in results]
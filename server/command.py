@@ -1,15 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
+import asyncio
 import logging
+import multiprocessing
 import os
 from argparse import Namespace
-from typing import Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 from sanic import Sanic
 from result import Result, Ok, Err
 
-from utils.log import ensure_logging_config
+from utils.log import configure_logging, ensure_logging_config
 from utils.app import create_app
 from rcc.config import (
     LOGGER,
@@ -30,6 +33,24 @@ def parse_args():
     # run-server 子命令
     run_parser = subparsers.add_parser('run-server', help='run server')
     run_parser.add_argument('-c', '--config', required=True, help='config file path')
+    run_parser.add_argument('--skip-data', action='store_true', help='skip loading app data on start')
+
+    # load-data 子命令
+    load_parser = subparsers.add_parser('load-data', help='load app data')
+    load_parser.add_argument('-c', '--config', required=True, help='config file path')
+    load_parser.add_argument('-a', '--app', action='append', help='app name, can be repeated, default all apps')
+    load_parser.add_argument('-s', '--snapshot', help='load from a snapshot generated by compile-data')
+    load_parser.add_argument('--dry-run', action='store_true', help='roll back all changes after loading')
+
+    # compile-data 子命令
+    compile_parser = subparsers.add_parser('compile-data', help='compile app data to a snapshot')
+    compile_parser.add_argument('-c', '--config', required=True, help='config file path')
+    compile_parser.add_argument('-o', '--output', required=True, help='snapshot file path')
+    compile_parser.add_argument('-a', '--app', action='append', help='app name, can be repeated, default all apps')
+
+    # partition-logger 子命令
+    partition_parser = subparsers.add_parser('partition-logger', help='convert ir_logger to a partitioned table (postgres)')
+    partition_parser.add_argument('-c', '--config', required=True, help='config file path')
 
     # rsa-generate 子命令
     rsa_generate_parser = subparsers.add_parser('rsa-generate', help='rsa generate')
@@ -39,6 +60,21 @@ def parse_args():
     start_parser = subparsers.add_parser('start-app', help='start app')
     start_parser.add_argument('-n', '--name', required=True, help='app name')
 
+    # bench-data 子命令
+    bench_parser = subparsers.add_parser('bench-data', help='benchmark app data loading')
+    bench_parser.add_argument('-c', '--config', help='config file path, used for LOADER settings')
+    bench_parser.add_argument('-n', '--records', type=int, action='append', help='record count, can be repeated, default 1000 100000 1000000')
+    bench_parser.add_argument('-s', '--scenario', action='append', choices=['parse', 'load', 'bulk'], help='scenario, can be repeated, default all')
+    bench_parser.add_argument('--db-url', default='sqlite://:memory:', help='database url, bench tables are cleared before each run')
+    bench_parser.add_argument('--data-dir', default='bench_data', help='directory of generated datasets')
+    bench_parser.add_argument('--tags', type=int, default=100, help='number of many2many target records')
+    bench_parser.add_argument('--ref-density', type=float, default=0.3, help='ratio of records referencing another record')
+    bench_parser.add_argument('--fanout', type=int, default=3, help='max many2many links per record')
+    bench_parser.add_argument('--eval-ratio', type=float, default=0.1, help='ratio of records with an eval field')
+    bench_parser.add_argument('--heavy-eval', action='store_true', help='use bcrypt in eval fields')
+    bench_parser.add_argument('--no-memory', action='store_true', help='do not trace peak memory')
+    bench_parser.add_argument('--json', help='write results to a json file')
+
     return parser.parse_args()
 
 
@@ -92,15 +128,46 @@ class ManagementUtility:
     def execute(self) -> (Optional[Sanic], str, int, bool, int):
         """"""
         from tokio.tasks import Task
+        from server.parse2xml import start_eval_pool
 
         if self.args.command == 'run-server':
             YamlLoader.open(self.args.config).unwrap().glob()
             self.reset_server().unwrap()
+            from core.conf import settings as cfg
 
             app = Sanic(self.name)
+            # 数据可以通过 load-data 在部署时单独加载
+            app.ctx.load_data = not self.args.skip_data and cfg.get_bool("LOADER.ON_START", True)
+            if app.ctx.load_data and multiprocessing.parent_process() is None:
+                # 主进程加载数据，在启动日志线程之前创建进程池
+                start_eval_pool().unwrap()
+            # Sanic 创建时配置了自己的 logger，之后再按 LOGGING 调整
+            configure_logging().unwrap()
             setup(app).unwrap()
             app.ctx.task = Task()
             return app, self.host, self.port, self.debug, self.workers
+        elif self.args.command == 'load-data':
+            YamlLoader.open(self.args.config).unwrap().glob()
+            start_eval_pool().unwrap()
+            configure_logging().unwrap()
+            asyncio.run(run_load_data(self.args.app, self.args.dry_run, self.args.snapshot)).unwrap()
+            return self.default_app()
+        elif self.args.command == 'bench-data':
+            if self.args.config:
+                YamlLoader.open(self.args.config).unwrap().glob()
+            asyncio.run(bench_data(self.args)).unwrap()
+            return self.default_app()
+        elif self.args.command == 'compile-data':
+            YamlLoader.open(self.args.config).unwrap().glob()
+            start_eval_pool().unwrap()
+            configure_logging().unwrap()
+            asyncio.run(compile_data(self.args.app, self.args.output)).unwrap()
+            return self.default_app()
+        elif self.args.command == 'partition-logger':
+            YamlLoader.open(self.args.config).unwrap().glob()
+            configure_logging().unwrap()
+            asyncio.run(partition_logger()).unwrap()
+            return self.default_app()
         elif self.args.command == 'rsa-generate':
             generate_rsa_key(self.args.path).unwrap()
             return self.default_app()
@@ -114,22 +181,146 @@ def execute_from_command() -> (Optional[Sanic], str, int, bool, int):
     return utility.execute()
 
 
-async def load_data(srv, loop):
-    """"""
-    from server.parse2xml import Parse2XML
+def data_apps(names: Optional[List[str]] = None) -> Result[List[Tuple[str, Path]], Exception]:
+    """
+    获取已安装应用的manifest
+    :param names: 应用名称（短名称或完整路径），为空时返回所有应用
+    :return: [(模块名称, manifest路径)]
+    """
     from rcc.config import BASE_DIR, INSTALL_APPS
 
+    selected = set(names or [])
+    unknown = selected - {name for app_name in INSTALL_APPS for name in (app_name, app_name.split('.')[-1])}
+    if unknown:
+        return Err(ValueError(f"Apps not installed: {sorted(unknown)}"))
+    apps = []
+    for app_name in INSTALL_APPS:
+        short_name = app_name.split('.')[-1]
+        if selected and app_name not in selected and short_name not in selected:
+            continue
+        app_path = BASE_DIR / app_name.replace('.', '/')
+        manifest_path = app_path / 'manifest.json'
+        if not manifest_path.exists():
+            logger.warning(f"Manifest file not found for app {app_name}: {manifest_path}")
+            continue
+        apps.append((short_name, manifest_path))
+    return Ok(apps)
+
+
+async def load_app_data(names: Optional[List[str]] = None,
+                        dry_run: bool = False,
+                        snapshot: Optional[str] = None) -> Result[Dict, Exception]:
+    """按依赖关系并发加载应用数据，指定snapshot时从快照加载"""
+    from server.parse2xml import Parse2XML
+
+    apps_result = data_apps(names)
+    if not apps_result.is_ok():
+        return Err(apps_result.err_value)
     parse = Parse2XML()
+    if snapshot:
+        snapshot_result = parse.use_snapshot(snapshot)
+        if not snapshot_result.is_ok():
+            return Err(snapshot_result.err_value)
+        logger.info(f"Loading app data from snapshot {snapshot}")
+    return await parse.load(apps_result.ok_value, dry_run=dry_run)
 
-    for app_name in INSTALL_APPS:
-        try:
-            app_path = BASE_DIR / app_name.replace('.', '/')
-            manifest_path = app_path / 'manifest.json'
-            if not manifest_path.exists():
-                logger.warning(f"Manifest file not found for app {app_name}: {manifest_path}")
-                continue
-            await parse.parse(app_name.split('.')[-1], manifest_path)
-        except Exception as exc:
-            logger.error(f"Error processing app {app_name}: {str(exc)}")
+
+async def run_load_data(names: Optional[List[str]] = None,
+                        dry_run: bool = False,
+                        snapshot: Optional[str] = None) -> Result[bool, Exception]:
+    """命令行加载应用数据，任一文件失败时返回Err"""
+    from tortoise import Tortoise
+    from utils.web import init_orm
+
+    init_result = await init_orm()
+    if not init_result.is_ok():
+        return Err(init_result.err_value)
+    try:
+        res = await load_app_data(names, dry_run, snapshot)
+        if not res.is_ok():
+            return Err(res.err_value)
+        failed = [path for (_, path), file_result in res.ok_value.items() if not file_result.is_ok()]
+        if failed:
+            return Err(RuntimeError(f"Failed to load data files: {failed}"))
+        return Ok(True)
+    finally:
+        await Tortoise.close_connections()
+
+
+async def compile_data(names: Optional[List[str]], output: str) -> Result[int, Exception]:
+    """将应用数据编译为快照，不需要连接数据库"""
+    from server.parse2xml import Parse2XML
+
+    apps_result = data_apps(names)
+    if not apps_result.is_ok():
+        return Err(apps_result.err_value)
+    return await Parse2XML().compile(apps_result.ok_value, output)
+
+
+async def partition_logger() -> Result[bool, Exception]:
+    """ir_logger 转换为分区表并建立后续分区，原表保留为 ir_logger_unpartitioned"""
+    from tortoise import Tortoise
+    from core.reflect.partition import logger_partitions
+    from utils.web import init_orm
+
+    init_result = await init_orm()
+    if not init_result.is_ok():
+        return Err(init_result.err_value)
+    try:
+        logger_partitions.configure()
+        # 转换后需要服务定期建立新分区，否则之后的日志无法写入
+        if not logger_partitions.enabled:
+            return Err(RuntimeError("Set AUDIT.PARTITION.ENABLED to true before converting ir_logger"))
+        res = await logger_partitions.convert()
+        if not res.is_ok():
+            return Err(res.err_value)
+        res = await logger_partitions.maintain()
+        if not res.is_ok():
+            return Err(res.err_value)
+        return Ok(True)
+    finally:
+        await Tortoise.close_connections()
+
+
+async def bench_data(args: Namespace) -> Result[bool, Exception]:
+    """运行数据加载基准测试并输出结果"""
+    import json
+    from server.bench.runner import format_results, results_json, run_benchmark
+
+    res = await run_benchmark(
+        sizes=args.records,
+        scenarios=args.scenario,
+        data_dir=args.data_dir,
+        db_url=args.db_url,
+        trace_memory=not args.no_memory,
+        tags=args.tags,
+        ref_density=args.ref_density,
+        fanout=args.fanout,
+        eval_ratio=args.eval_ratio,
+        heavy_eval=args.heavy_eval,
+    )
+    if not res.is_ok():
+        return Err(res.err_value)
+    print(format_results(res.ok_value))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results_json(res.ok_value), f, indent=2)
+    return Ok(True)
+
+
+async def load_data(srv, loop):
+    """"""
+    from core.conf import settings
+
+    # 配置了快照且文件存在时从快照加载
+    snapshot = settings.get_str("LOADER.SNAPSHOT", None)
+    if snapshot and not os.path.exists(snapshot):
+        logger.warning(f"Data snapshot not found: {snapshot}, loading from xml")
+        snapshot = None
+    # 按依赖关系并发加载所有应用的数据
+    res = await load_app_data(snapshot=snapshot)
+    if not res.is_ok():
+        logger.error(f"Error loading app data: {res.err_value}")
+        return
     # 为所有用户分配默认用户组
     logger.info("All apps initialized successfully")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+from result import Result, Ok, Err
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyGraph(object):
+    """有向无环依赖图，节点在其依赖全部完成后才会执行"""
+
+    def __init__(self):
+        # {节点: 依赖的节点集合}，保持插入顺序
+        self._deps: Dict[Hashable, Set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._deps)
+
+    @property
+    def nodes(self) -> List[Hashable]:
+        return list(self._deps)
+
+    def add_node(self, node: Hashable):
+        self._deps.setdefault(node, set())
+
+    def add_edge(self, node: Hashable, depends_on: Hashable):
+        """node 依赖 depends_on"""
+        self.add_node(node)
+        self.add_node(depends_on)
+        if node != depends_on:
+            self._deps[node].add(depends_on)
+
+    def depends(self, node: Hashable) -> Set[Hashable]:
+        return set(self._deps.get(node, ()))
+
+    def levels(self) -> Result[List[List[Hashable]], Exception]:
+        """拓扑分层，同一层的节点互不依赖；存在环时返回Err"""
+        remaining = {node: set(deps) for node, deps in self._deps.items()}
+        levels = []
+        while remaining:
+            level = [node for node, deps in remaining.items() if not deps]
+            if not level:
+                return Err(ValueError(f"Circular dependency between: {list(remaining)}"))
+            for node in level:
+                del remaining[node]
+            for deps in remaining.values():
+                deps.difference_update(level)
+            levels.append(level)
+        return Ok(levels)
+
+    async def run(self,
+                  func: Callable[[Hashable], Awaitable[Result[Any, Exception]]],
+                  limit: int) -> Result[Dict[Hashable, Result[Any, Exception]], Exception]:
+        """
+        按依赖关系并发执行，节点的依赖全部成功后立即开始
+        :param func: 节点执行函数，返回Result
+        :param limit: 最大并发数
+        :return: {节点: 执行结果}，依赖失败的节点不会执行并记为Err
+        """
+        levels_result = self.levels()
+        if not levels_result.is_ok():
+            return Err(levels_result.err_value)
+
+        semaphore = asyncio.Semaphore(max(1, limit))
+        done: Dict[Hashable, asyncio.Future] = {
+            node: asyncio.get_running_loop().create_future() for node in self._deps
+        }
+        results: Dict[Hashable, Result[Any, Exception]] = {}
+
+        async def execute(node):
+            for dep in self._deps[node]:
+                await done[dep]
+            failed = [dep for dep in self._deps[node] if not results[dep].is_ok()]
+            if failed:
+                results[node] = Err(RuntimeError(f"Skipped {node}, dependencies failed: {failed}"))
+            else:
+                async with semaphore:
+                    try:
+                        results[node] = await func(node)
+                    except Exception as exc:
+                        results[node] = Err(exc)
+            done[node].set_result(True)
+
+        await asyncio.gather(*(execute(node) for node in self._deps))
+        return Ok(results)
@@ -1,20 +1,37 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from core.reflect.cache import query_cache
 from core.reflect.db import TortoiseIrModelDataReflect
+from core.reflect.router import router
+from server.graph import DependencyGraph
 import logging
 import json
 import os
 import bcrypt
 import hashlib
 import base64
+import datetime
+import decimal
 import random
 import string
+import ast
+import asyncio
+import functools
+import multiprocessing
+import threading
+import zlib
 import xml.etree.ElementTree as ET
 
 from result import Result, Ok, Err
-from typing import Any, Optional, Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar, Token
+from types import CodeType
+from typing import Any, Optional, Dict, List, Iterator, Set, Tuple
 from pydantic import BaseModel
+from tortoise import timezone
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +42,39 @@ class Record(BaseModel):
     noupdate: bool = False
     fields: Optional[Dict] = None
     many2many: Optional[Dict[str, List[str]]] = None
+    # record元素原文的哈希，用于增量加载
+    checksum: Optional[str] = None
+    # 延迟执行的eval字段 {字段名: (代码, 是否放到进程池执行)}
+    evals: Optional[Dict[str, Tuple[str, Optional[bool]]]] = None
 
     class Config:
         extra = 'allow'
 
 
+class XmlRecord(object):
+    """流式解析使用的轻量记录，字段与Record一致，避免为每个元素创建pydantic对象"""
+    __slots__ = ('id', 'model', 'noupdate', 'fields', 'many2many', 'checksum', 'evals')
+
+    def __init__(self,
+                 id: Optional[str] = None,
+                 model: Optional[str] = None,
+                 noupdate: bool = False,
+                 fields: Optional[Dict] = None,
+                 many2many: Optional[Dict[str, List[str]]] = None,
+                 checksum: Optional[str] = None,
+                 evals: Optional[Dict[str, Tuple[str, Optional[bool]]]] = None):
+        self.id = id
+        self.model = model
+        self.noupdate = noupdate
+        self.fields = fields
+        self.many2many = many2many
+        self.checksum = checksum
+        self.evals = evals
+
+    def __repr__(self) -> str:
+        return f"XmlRecord(id={self.id!r}, model={self.model!r})"
+
+
 def recover2img(path: str) -> str | None:
     """将图片转换为base64编码"""
     try:
@@ -75,45 +120,296 @@ def safe_eval(code_string, context=None):
     safe_context.update(context)
 
     try:
-        # 对于多行代码，使用exec并在最后设置result
-        if '\n' in code_string or code_string.strip().startswith(
-                ('import ', 'def ', 'class ', 'for ', 'while ', 'if ')):
-            # 创建完整的可执行代码
-            lines = code_string.strip().split('\n')
-            last_line = lines[-1].strip()
-
-            # 检查最后一行是否是表达式（不是语句）
-            if not last_line.startswith((' ', '\t', 'def ', 'class ', 'for ', 'while ', 'if ', 'import ', 'from ')):
-                # 最后一行是表达式，将其结果赋给result
-                exec_code = '\n'.join(lines[:-1]) + f'\nresult = {last_line}'
-            else:
-                # 最后一行是语句，直接执行并设置result为None
-                exec_code = code_string + '\nresult = None'
-            exec(exec_code, safe_context)
+        code, mode = compile_code(code_string)
+        if mode == 'exec':
+            exec(code, safe_context)
             return safe_context.get('result')
-        else:
-            # 单行表达式，使用eval
-            return eval(code_string, safe_context)
+        # 单行表达式，使用eval
+        return eval(code, safe_context)
     except Exception as exc:
         logger.error(f"Error in safe_eval: {exc}")
         return None
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_code(code_string: str) -> Tuple[CodeType, str]:
+    """编译代码字符串并按源码缓存，返回(代码对象, exec或eval)"""
+    # 对于多行代码，使用exec并在最后设置result
+    if '\n' in code_string or code_string.strip().startswith(
+            ('import ', 'def ', 'class ', 'for ', 'while ', 'if ')):
+        # 创建完整的可执行代码
+        lines = code_string.strip().split('\n')
+        last_line = lines[-1].strip()
+
+        # 检查最后一行是否是表达式（不是语句）
+        if not last_line.startswith((' ', '\t', 'def ', 'class ', 'for ', 'while ', 'if ', 'import ', 'from ')):
+            # 最后一行是表达式，将其结果赋给result
+            exec_code = '\n'.join(lines[:-1]) + f'\nresult = {last_line}'
+        else:
+            # 最后一行是语句，直接执行并设置result为None
+            exec_code = code_string + '\nresult = None'
+        return compile(exec_code, '<safe_eval>', 'exec'), 'exec'
+    return compile(code_string, '<safe_eval>', 'eval'), 'eval'
+
+
+# 默认视为耗时的表达式特征，命中时放到进程池执行
+HEAVY_EVAL_MARKERS = ('bcrypt.', 'hashlib.pbkdf2', 'hashlib.scrypt', 'recover2img')
+
+_eval_pool: Optional[ProcessPoolExecutor] = None
+
+
+def start_eval_pool() -> Result[bool, Exception]:
+    """
+    创建执行耗时表达式的进程池，workers数量读取 LOADER.EVAL_WORKERS
+    使用 fork 避免子进程重新导入启动脚本（main.py 导入时会执行命令），
+    fork 会继承其他线程持有的锁，需要在启动日志线程和事件循环之前调用；已有其他线程时不创建
+    :return: 是否创建了进程池
+    """
+    global _eval_pool
+    try:
+        if _eval_pool is not None or "fork" not in multiprocessing.get_all_start_methods():
+            return Ok(False)
+        if threading.active_count() > 1:
+            logger.warning("Eval process pool is not started because other threads are running")
+            return Ok(False)
+        from core.conf import settings
+        workers = settings.get_int("LOADER.EVAL_WORKERS", None) if settings else None
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                   mp_context=multiprocessing.get_context("fork"))
+        # fork 的进程池在第一次提交时创建全部子进程
+        pool.submit(int).result()
+        _eval_pool = pool
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def shutdown_eval_pool():
+    """关闭进程池，数据加载结束后调用"""
+    global _eval_pool
+    if _eval_pool is not None:
+        _eval_pool.shutdown(wait=True)
+        _eval_pool = None
+
+
+def is_heavy_eval(code_string: str) -> bool:
+    """根据 LOADER.EVAL_HEAVY_MARKERS 判断表达式是否耗时"""
+    from core.conf import settings
+    markers = settings.get_list("LOADER.EVAL_HEAVY_MARKERS", list(HEAVY_EVAL_MARKERS)) if settings \
+        else HEAVY_EVAL_MARKERS
+    return any(marker in code_string for marker in markers)
+
+
+async def async_safe_eval(code_string: str, heavy: Optional[bool] = None) -> Any:
+    """执行代码字符串，耗时的表达式在进程池中执行，避免阻塞事件循环"""
+    if heavy is None:
+        heavy = is_heavy_eval(code_string)
+    if not heavy:
+        return safe_eval(code_string)
+    # 没有进程池时在线程池中执行，bcrypt、hashlib 计算时会释放GIL
+    return await asyncio.get_running_loop().run_in_executor(_eval_pool, safe_eval, code_string)
+
+
+def record_refs(record: Record) -> List[str]:
+    """收集记录中引用的所有xml_id（ref字段与多对多关系）"""
+    refs = []
+    if record.fields:
+        for field_name, field_value in record.fields.items():
+            if field_name.endswith('_xml_ref'):
+                refs.append(field_value)
+    if record.many2many:
+        for xml_ids in record.many2many.values():
+            refs.extend(xml_ids)
+    return refs
+
+
+_journal: ContextVar[Optional[List[str]]] = ContextVar("ref_resolver_journal", default=None)
+
+
+class RefResolver(object):
+    """xml_id -> 记录id 的内存映射，批量预取引用并在创建记录时同步填充"""
+
+    def __init__(self, reflect: TortoiseIrModelDataReflect, batch_size: int = 500):
+        self.reflect = reflect
+        self.batch_size = batch_size
+        self._ids: Dict[str, int] = {}
+        # 已预取但数据库中不存在的xml_id，避免重复查询
+        self._missing: set = set()
+
+    def register(self, xml_id: str, ref_id: int):
+        """登记新建或已存在记录的id"""
+        self._ids[xml_id] = ref_id
+        self._missing.discard(xml_id)
+        journal = _journal.get()
+        if journal is not None:
+            journal.append(xml_id)
+
+    @staticmethod
+    def savepoint() -> Tuple[List[str], Token]:
+        """事务开始时调用，之后当前任务登记的xml_id会被记录下来，并发加载的任务互不影响"""
+        journal: List[str] = []
+        return journal, _journal.set(journal)
+
+    def rollback(self, savepoint: Tuple[List[str], Token]):
+        """移除savepoint之后登记的xml_id，事务回滚时调用"""
+        journal, token = savepoint
+        for xml_id in journal:
+            self._ids.pop(xml_id, None)
+        _journal.reset(token)
+
+    @staticmethod
+    def release(savepoint: Tuple[List[str], Token]):
+        """事务提交后调用，登记记录并入外层事务"""
+        journal, token = savepoint
+        _journal.reset(token)
+        outer = _journal.get()
+        if outer is not None:
+            outer.extend(journal)
+
+    def clear(self):
+        self._ids.clear()
+        self._missing.clear()
+
+    async def prefetch(self, xml_ids: List[str]) -> Result[int, Exception]:
+        """批量预取尚未缓存的xml_id，返回本次查询的数量"""
+        pending = [xml_id for xml_id in dict.fromkeys(xml_ids)
+                   if xml_id not in self._ids and xml_id not in self._missing]
+        if not pending:
+            return Ok(0)
+        ids_result = await self.reflect.batch_ref_id(pending, self.batch_size)
+        if not ids_result.is_ok():
+            return Err(ids_result.err_value)
+        for xml_id, ref_id in ids_result.ok_value.items():
+            if ref_id is None:
+                self._missing.add(xml_id)
+            else:
+                self._ids[xml_id] = ref_id
+        return Ok(len(pending))
+
+    async def resolve(self, xml_id: str) -> Result[Optional[int], Exception]:
+        """解析单个xml_id，优先使用内存映射"""
+        if xml_id in self._ids:
+            return Ok(self._ids[xml_id])
+        if xml_id in self._missing:
+            return Ok(None)
+        ref_id_result = await self.reflect.ref_id(xml_id)
+        if not ref_id_result.is_ok():
+            return Err(ref_id_result.err_value)
+        if ref_id_result.ok_value is None:
+            self._missing.add(xml_id)
+        else:
+            self._ids[xml_id] = ref_id_result.ok_value
+        return Ok(ref_id_result.ok_value)
+
+
+SNAPSHOT_MAGIC = b"PYRASNAP"
+# 2: zlib 压缩的JSON，1 为pickle（不再支持）
+SNAPSHOT_VERSION = 2
+# JSON不支持的类型编码为 {"$t": 类型, "v": 值}
+SNAPSHOT_TYPES = {
+    "tuple": (tuple, list, tuple),
+    "set": (set, list, set),
+    "datetime": (datetime.datetime, datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    "date": (datetime.date, datetime.date.isoformat, datetime.date.fromisoformat),
+    "time": (datetime.time, datetime.time.isoformat, datetime.time.fromisoformat),
+    "decimal": (decimal.Decimal, str, decimal.Decimal),
+    "bytes": (bytes, lambda v: base64.b64encode(v).decode(), base64.b64decode),
+}
+
+
+def snapshot_encode(value: Any) -> Any:
+    """快照中的值转换为JSON可以表示的结构，不支持的类型报错"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [snapshot_encode(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and "$t" not in value:
+            return {key: snapshot_encode(item) for key, item in value.items()}
+        return {"$t": "dict", "v": [[snapshot_encode(key), snapshot_encode(item)] for key, item in value.items()]}
+    # datetime 是 date 的子类，按顺序先匹配
+    for name, (cls, encode, _) in SNAPSHOT_TYPES.items():
+        if isinstance(value, cls):
+            encoded = encode(value)
+            return {"$t": name, "v": snapshot_encode(encoded) if name in ("tuple", "set") else encoded}
+    raise TypeError(f"Unsupported value in data snapshot: {type(value).__name__}")
+
+
+def snapshot_decode(value: Dict[str, Any]) -> Any:
+    """json.loads 的 object_hook"""
+    name = value.get("$t")
+    if name is None:
+        return value
+    if name == "dict":
+        return {key: item for key, item in value["v"]}
+    if name not in SNAPSHOT_TYPES:
+        raise ValueError(f"Unknown value type in data snapshot: {name}")
+    return SNAPSHOT_TYPES[name][2](value["v"])
+
+
+class DryRunRollback(Exception):
+    """dry-run 结束时回滚事务"""
+
+
 class Parse2XML(TortoiseIrModelDataReflect):
-    def __init__(self):
+    def __init__(self,
+                 bulk: Optional[bool] = None,
+                 chunk_size: Optional[int] = None,
+                 commit: Optional[str] = None,
+                 concurrency: Optional[int] = None,
+                 incremental: Optional[bool] = None):
+        """
+        :param bulk: 是否使用批量写入模式，默认读取 LOADER.BULK
+        :param chunk_size: 批量模式下每个批次的记录数，默认读取 LOADER.CHUNK_SIZE
+        :param commit: 批量模式下的事务提交粒度 file、chunk，默认读取 LOADER.COMMIT
+        :param concurrency: 并发加载的文件数和记录数，默认读取 LOADER.CONCURRENCY，不超过 DATABASE.MAX_SIZE
+        :param incremental: 是否跳过内容未变化的文件和记录，默认读取 LOADER.INCREMENTAL
+        """
         super(Parse2XML, self).__init__()
+        from core.conf import settings
+        self.bulk = bulk if bulk is not None else bool(settings and settings.get_bool("LOADER.BULK", False))
+        self.chunk_size = chunk_size or (settings.get_int("LOADER.CHUNK_SIZE", 1000) if settings else 1000)
+        self.commit = commit or (settings.get_str("LOADER.COMMIT", "file") if settings else "file")
+        max_size = settings.get_int("DATABASE.MAX_SIZE", 10) if settings else 10
+        concurrency = concurrency or (settings.get_int("LOADER.CONCURRENCY", max_size) if settings else max_size)
+        self.concurrency = max(1, min(concurrency, max_size))
+        self.incremental = incremental if incremental is not None else bool(
+            settings and settings.get_bool("LOADER.INCREMENTAL", False))
+        self.resolver = RefResolver(self)
+        self.stats = {
+            "files_loaded": 0,
+            "files_skipped": 0,
+            "records_created": 0,
+            "records_updated": 0,
+            "records_skipped": 0,
+        }
+        self._record_semaphore = asyncio.Semaphore(self.concurrency)
+        # 预编译快照 {文件路径: 文件信息与记录}
+        self.snapshot: Optional[Dict[str, Dict[str, Any]]] = None
+        self.snapshot_depends: Dict[str, List[str]] = {}
 
     @staticmethod
     async def parse_element_tag2record(element: Any) -> Result[Record, Exception]:
         """解析record元素"""
+        return Parse2XML.element2record(element)
+
+    @staticmethod
+    def element2record(element: Any, record_cls: type = Record, defer_eval: bool = False) -> Result[Any, Exception]:
+        """
+        将record元素解析为record_cls的实例
+        :param defer_eval: 为True时eval字段只记录代码，由evaluate在写入前执行
+        """
         try:
-            r = Record(
+            r = record_cls(
                 id=element.get('id'),
                 model=element.get("model"),
                 noupdate=False if element.get("noupdate") is None else True if element.get(
                     "noupdate") == '1' else False,
                 fields={},
-                many2many={}
+                many2many={},
+                # 对原文计算哈希，eval结果（如随机盐）不影响哈希
+                checksum=hashlib.sha1(ET.tostring(element)).hexdigest(),
+                evals={}
             )
 
             for field in element:
@@ -145,6 +441,11 @@ class Parse2XML(TortoiseIrModelDataReflect):
                     eval_code = field_value[8:-4]  # 移除 eval(""" 和 """)
                     # 清理代码：移除多余的空格和换行
                     eval_code = eval_code.strip()
+                    if defer_eval:
+                        # offload="1" 强制放到进程池执行，offload="0" 强制在事件循环中执行
+                        offload = field.get("offload")
+                        r.evals[field_name] = (eval_code, None if offload is None else offload == '1')
+                        continue
                     try:
                         # 使用安全的eval函数
                         result = safe_eval(eval_code)
@@ -172,6 +473,52 @@ class Parse2XML(TortoiseIrModelDataReflect):
             logger.error(f"Error parsing record element: {exc}")
             return Err(exc)
 
+    def iter_records(self, path: str) -> Iterator[Result[XmlRecord, Exception]]:
+        """
+        使用iterparse流式解析数据文件，逐条产出记录
+        已处理的元素会被立即清理，内存占用与文件大小无关
+        """
+        if self.snapshot is not None and path in self.snapshot:
+            for values in self.snapshot[path]["records"]:
+                yield Ok(XmlRecord(*values))
+            return
+        depth = 0
+        root = None
+        try:
+            for event, element in ET.iterparse(path, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+                # 根节点的直接子元素已经完整解析
+                if element.tag == "record":
+                    yield self.element2record(element, XmlRecord, defer_eval=True)
+                else:
+                    logger.warning(f"Unknown element tag: {element.tag}")
+                root.clear()
+        except ET.ParseError as exc:
+            logger.error(f"XML parsing error: {exc}")
+            yield Err(exc)
+
+    def iter_chunks(self, path: str) -> Iterator[Result[List[XmlRecord], Exception]]:
+        """按chunk_size分批产出记录，解析失败时产出Err并停止"""
+        chunk = []
+        for res in self.iter_records(path):
+            if not res.is_ok():
+                logger.error(f"Failed to parse record: {res.err_value}")
+                yield Err(res.err_value)
+                return
+            chunk.append(res.ok_value)
+            if len(chunk) >= self.chunk_size:
+                yield Ok(chunk)
+                chunk = []
+        if chunk:
+            yield Ok(chunk)
+
     async def get_xml_with_record(self, xml_content: str) -> Result[List[Record], Exception]:
         """解析xml生成记录集，按照顺序放入列表"""
         try:
@@ -196,15 +543,33 @@ class Parse2XML(TortoiseIrModelDataReflect):
             logger.error(f"Unexpected error in get_xml_with_record: {exc}")
             return Err(exc)
 
+    @staticmethod
+    async def evaluate(record: Record) -> Result[Record, Exception]:
+        """执行记录中延迟的eval字段，耗时的表达式并行放到进程池中执行"""
+        if not record.evals:
+            return Ok(record)
+        try:
+            names = list(record.evals)
+            values = await asyncio.gather(*(async_safe_eval(*record.evals[name]) for name in names))
+            for field_name, value in zip(names, values):
+                if value is None:
+                    return Err(ValueError(f"Eval execution returned None for field {field_name}"))
+                record.fields[field_name] = value
+            record.evals = {}
+            return Ok(record)
+        except Exception as exc:
+            return Err(exc)
+
     async def resolve_references(self, record: Record) -> Result[Record, Exception]:
         """解析记录中的引用关系"""
         try:
-            resolved_record = Record(
+            resolved_record = type(record)(
                 id=record.id,
                 model=record.model,
                 noupdate=False,
                 fields=record.fields.copy() if record.fields else {},
-                many2many={}
+                many2many={},
+                checksum=record.checksum
             )
             # 解析字段中的引用 - 使用列表收集要处理的引用字段
             ref_fields_to_process = []
@@ -216,7 +581,7 @@ class Parse2XML(TortoiseIrModelDataReflect):
             # 处理引用字段
             for field_name, base_field_name, ref_id in ref_fields_to_process:
                 # 查找引用的数据库ID
-                referenced_id = await self.ref_id(ref_id)
+                referenced_id = await self.resolver.resolve(ref_id)
                 if referenced_id.is_ok():
                     if referenced_id.ok_value is not None:
                         resolved_record.fields[f"{base_field_name}_id"] = referenced_id.ok_value
@@ -232,7 +597,7 @@ class Parse2XML(TortoiseIrModelDataReflect):
                 for field_name, xml_ids in record.many2many.items():
                     db_ids = []
                     for xml_id in xml_ids:
-                        referenced_id = await self.ref_id(xml_id)
+                        referenced_id = await self.resolver.resolve(xml_id)
                         if referenced_id.is_ok():
                             if referenced_id.unwrap() is not None:
                                 db_ids.append(referenced_id.unwrap())
@@ -245,12 +610,63 @@ class Parse2XML(TortoiseIrModelDataReflect):
         except Exception as exc:
             return Err(exc)
 
+    async def update_record(self, module: str, record: Record, tmp: Model) -> Result[bool, Exception]:
+        """按照已存在的ir_model_data更新记录"""
+        try:
+            eval_result = await self.evaluate(record)
+            if not eval_result.is_ok():
+                return Err(eval_result.err_value)
+            # 更新记录
+            resolved_record = await self.resolve_references(record)  # 解析引用关系
+            if not resolved_record.is_ok():
+                return Err(resolved_record.err_value)
+            # 更新主记录
+            update_result = await self.update(
+                resolved_record.unwrap().model,
+                {"id": tmp.ref_id},
+                resolved_record.unwrap().fields
+            )
+            if not update_result.is_ok():
+                return Err(update_result.err_value)
+            updated_record_id = tmp.ref_id
+            # 多对多关系只同步差异
+            if resolved_record.unwrap().many2many:
+                model_result = await self.get_model(record.model)
+                if not model_result.is_ok():
+                    return Err(model_result.err_value)
+                links_result = await self.many2many_links(
+                    model_result.ok_value,
+                    {updated_record_id: resolved_record.unwrap().many2many},
+                    replace=True
+                )
+                if not links_result.is_ok():
+                    return Err(links_result.err_value)
+            # 更新记录时间戳与哈希
+            await self.update(
+                "ir_model_data",
+                {"id": tmp.id},
+                {"write_date": timezone.now(), "data": {**(tmp.data or {}), "checksum": record.checksum}}
+            )
+            self.stats["records_updated"] += 1
+            logger.info("Updated record %s (ID: %s)", record.id, updated_record_id)
+            return Ok(True)
+        except Exception as exc:
+            return Err(exc)
+
     async def create_record(self, module: str, record: Record) -> Result[bool, Exception]:
         """创建单个记录"""
         try:
             tmp_result = await self.get_first("ir_model_data", {"complete_name": f"{module}.{record.id}"})
             if tmp_result.is_ok():
                 tmp = tmp_result.ok_value
+                if tmp is not None:
+                    self.resolver.register(tmp.complete_name, tmp.ref_id)
+                    if self.unchanged(record, tmp):
+                        self.stats["records_skipped"] += 1
+                        return Ok(True)
+                eval_result = await self.evaluate(record)
+                if not eval_result.is_ok():
+                    return Err(eval_result.err_value)
                 # 解析引用关系
                 resolved_record = await self.resolve_references(record)
                 if not resolved_record.is_ok():
@@ -264,18 +680,13 @@ class Parse2XML(TortoiseIrModelDataReflect):
                     created_record = rd_result.ok_value
                     # 处理多对多关系
                     if resolved_record.unwrap().many2many:
-                        for field_name, db_ids in resolved_record.unwrap().many2many.items():
-                            many2many_manager = getattr(created_record, field_name)
-                            # 建立新关系
-                            related_objects = []
-                            for rel_id in db_ids:
-                                related_model = many2many_manager.remote_model
-                                related_obj = await related_model.filter(id=rel_id).first()
-                                if related_obj:
-                                    related_objects.append(related_obj)
-
-                            if related_objects:
-                                await many2many_manager.add(*related_objects)
+                        links_result = await self.many2many_links(
+                            type(created_record),
+                            {created_record.pk: resolved_record.unwrap().many2many},
+                            created=True
+                        )
+                        if not links_result.is_ok():
+                            return Err(links_result.err_value)
                     # 写入模板记录
                     template_result = await self.create("ir_model_data", {
                         "module": module,
@@ -283,99 +694,565 @@ class Parse2XML(TortoiseIrModelDataReflect):
                         "complete_name": f"{module}.{record.id}",
                         "model": record.model,
                         "ref_id": created_record.id,
-                        "noupdate": record.noupdate
+                        "noupdate": record.noupdate,
+                        "data": {"checksum": record.checksum}
                     })
                     if not template_result.is_ok():
                         return Err(template_result.unwrap_err())
-                    logger.info(f"Successfully created record {record.id} with ID {created_record.id}")
+                    self.resolver.register(f"{module}.{record.id}", created_record.id)
+                    self.stats["records_created"] += 1
+                    logger.info("Successfully created record %s with ID %s", record.id, created_record.id)
                     return Ok(True)
-                else:
-                    if record.noupdate:
-                        # 更新记录
-                        resolved_record = await self.resolve_references(record)  # 解析引用关系
-                        if not resolved_record.is_ok():
-                            return Err(resolved_record.err_value)
-                        # 更新主记录
-                        update_result = await self.update(
-                            resolved_record.unwrap().model,
-                            {"id": tmp.ref_id},
-                            resolved_record.unwrap().fields
-                        )
-                        if not update_result.is_ok():
-                            return Err(update_result.err_value)
-                        updated_record_id = tmp.ref_id
-                        # 处理多对多关系更新
-                        if resolved_record.unwrap().many2many:
-                            # 获取目标记录实例
-                            model_result = await self.get_model(record.model)
-                            if model_result.is_ok():
-                                target_record = await model_result.ok_value.filter(id=updated_record_id).first()
-                                if target_record:
-                                    for field_name, db_ids in resolved_record.unwrap().many2many.items():
-                                        if hasattr(target_record, field_name):
-                                            many2many_manager = getattr(target_record, field_name)
-                                            # 清除现有关系
-                                            await many2many_manager.clear()
-                                            # 建立新关系
-                                            related_objects = []
-                                            for rel_id in db_ids:
-                                                related_model = many2many_manager.remote_model
-                                                related_obj = await related_model.filter(id=rel_id).first()
-                                                if related_obj:
-                                                    related_objects.append(related_obj)
-
-                                            if related_objects:
-                                                await many2many_manager.add(*related_objects)
-                        # 更新记录时间戳
-                        await self.update(
-                            "ir_model_data",
-                            {"id": tmp.id},
-                            {"write_date": "now()"}
-                        )
-                        logger.info(f"Updated record {record.id} (ID: {updated_record_id})")
+                elif record.noupdate:
+                    return await self.update_record(module, record, tmp)
                 return Ok(True)
             return Err(tmp_result.err_value)
         except Exception as exc:
             return Err(exc)
 
-    async def parse(self, module: str, path: str) -> Result[bool, Exception]:
-        """"""
-        from rcc.config import BASE_DIR
+    async def bulk_create_records(self, module: str, records: List[Record]) -> Result[int, Exception]:
+        """
+        批量写入同一模型的一批记录，需要在事务中调用
+        :param module: 模块名称
+        :param records: 同一模型的连续记录，批次内的记录之间不能互相引用
+        :return: 新建记录数量
+        """
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                manifest_data = json.load(f)
-            data_files = manifest_data.get('data', [])
-            for data_file in data_files:
-                normalized_data_path = os.path.normpath(data_file.replace('/', os.sep))
-                full_data_path = os.path.join(BASE_DIR, 'apps', module, normalized_data_path)
+            model_name = records[0].model
+            model_cls_result = await self.get_model(model_name)
+            if not model_cls_result.is_ok():
+                return Err(model_cls_result.err_value)
+            model_cls = model_cls_result.ok_value
+            data_cls = (await self.get_model("ir_model_data")).unwrap()
+
+            # 一次查询该批次已存在的ir_model_data
+            complete_names = [f"{module}.{record.id}" for record in records]
+            existing = {tmp.complete_name: tmp for tmp in await data_cls.filter(complete_name__in=complete_names)}
+
+            new_records = []
+            for record in records:
+                tmp = existing.get(f"{module}.{record.id}")
+                if tmp is None:
+                    new_records.append(record)
+                    continue
+                self.resolver.register(tmp.complete_name, tmp.ref_id)
+                if self.unchanged(record, tmp):
+                    self.stats["records_skipped"] += 1
+                elif record.noupdate:
+                    update_result = await self.update_record(module, record, tmp)
+                    if not update_result.is_ok():
+                        return Err(update_result.err_value)
+            if not new_records:
+                return Ok(0)
+
+            # 并行执行新记录的eval字段
+            for eval_result in await asyncio.gather(*(self.evaluate(record) for record in new_records)):
+                if not eval_result.is_ok():
+                    return Err(eval_result.err_value)
+
+            # 引用已经预取到内存，这里不会产生额外查询
+            resolved_records = []
+            for record in new_records:
+                resolved_result = await self.resolve_references(record)
+                if not resolved_result.is_ok():
+                    return Err(resolved_result.err_value)
+                resolved_records.append(resolved_result.ok_value)
+
+            ids_result = await self.reserve_ids(model_name, len(resolved_records))
+            if not ids_result.is_ok():
+                return Err(ids_result.err_value)
+            ids = ids_result.ok_value
+            if ids is not None:
+                # 预先分配主键后一条语句批量插入
+                instances = [model_cls(**{model_cls._meta.pk_attr: pk}, **resolved.fields)
+                             for pk, resolved in zip(ids, resolved_records)]
+                await model_cls.bulk_create(instances, batch_size=self.chunk_size)
+            else:
+                # 无法预分配主键的数据库逐条插入，仍然处于同一事务中
+                instances = []
+                for resolved in resolved_records:
+                    instances.append(await model_cls.create(**resolved.fields))
+            await query_cache.invalidate(model_cls._meta.db_table, router.transaction(model_cls))
+
+            # 整个批次的多对多关系每个字段一次插入
+            links = {instance.pk: resolved.many2many
+                     for instance, resolved in zip(instances, resolved_records) if resolved.many2many}
+            if links:
+                links_result = await self.many2many_links(model_cls, links, created=True)
+                if not links_result.is_ok():
+                    return Err(links_result.err_value)
+
+            # 一条语句写入所有ir_model_data
+            await data_cls.bulk_create([
+                data_cls(
+                    module=module,
+                    name=record.id,
+                    complete_name=f"{module}.{record.id}",
+                    model=record.model,
+                    ref_id=instance.pk,
+                    noupdate=record.noupdate,
+                    data={"checksum": record.checksum},
+                ) for record, instance in zip(new_records, instances)
+            ], batch_size=self.chunk_size)
+            await query_cache.invalidate(data_cls._meta.db_table, router.transaction(data_cls))
+            for record, instance in zip(new_records, instances):
+                self.resolver.register(f"{module}.{record.id}", instance.pk)
+            self.stats["records_created"] += len(new_records)
+            return Ok(len(new_records))
+        except Exception as exc:
+            return Err(exc)
+
+    def split_chunks(self, module: str, records: List[Record]) -> List[List[Record]]:
+        """将连续的同模型记录分组，组内不超过chunk_size且不包含组内互相引用"""
+        chunks = []
+        chunk: List[Record] = []
+        chunk_ids = set()
+        for record in records:
+            if chunk and (record.model != chunk[0].model
+                          or len(chunk) >= self.chunk_size
+                          or chunk_ids.intersection(record_refs(record))):
+                chunks.append(chunk)
+                chunk, chunk_ids = [], set()
+            chunk.append(record)
+            chunk_ids.add(f"{module}.{record.id}")
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def connection_name(self) -> str:
+        """数据加载使用的数据库连接名称"""
+        return (await self.get_model("ir_model_data")).unwrap()._meta.default_connection
+
+    async def bulk_write(self, module: str, records: List[Record]) -> Result[int, Exception]:
+        """批量模式写入记录，commit为chunk时每个批次一个事务，为file时由load_file提供事务"""
+        created = 0
+        try:
+            connection_name = await self.connection_name()
+            for chunk in self.split_chunks(module, records):
+                if self.commit == "file":
+                    res = await self.bulk_create_records(module, chunk)
+                    if not res.is_ok():
+                        return Err(res.err_value)
+                else:
+                    savepoint = self.resolver.savepoint()
+                    try:
+                        async with in_transaction(connection_name):
+                            res = await self.bulk_create_records(module, chunk)
+                            if not res.is_ok():
+                                raise res.err_value
+                    except Exception:
+                        # 回滚后内存映射中的id已经失效
+                        self.resolver.rollback(savepoint)
+                        raise
+                    self.resolver.release(savepoint)
+                created += res.ok_value
+            return Ok(created)
+        except Exception as exc:
+            return Err(exc)
+
+    async def write_records(self, module: str, records: List[Record]) -> Result[int, Exception]:
+        """将记录写入数据库，返回成功处理的记录数量"""
+        if self.bulk:
+            res = await self.bulk_write(module, records)
+            if not res.is_ok():
+                logger.error(f"Failed to bulk load records of {module}: {res.err_value}")
+                return Err(res.err_value)
+            logger.info(f"Successfully bulk load {res.ok_value} new records of {module}")
+            return Ok(len(records))
+
+        async def load_record(record) -> bool:
+            async with self._record_semaphore:
                 try:
-                    with open(full_data_path, 'r', encoding="utf-8") as file:
-                        # 第一阶段：解析所有记录到内存
-                        records_result = await self.get_xml_with_record(file.read())
-                        if not records_result.is_ok():
-                            logger.error(records_result.err_value)
-                            continue
-                        records = records_result.ok_value
-                        # 第二阶段：按顺序创建记录
-                        for record in records:
-                            try:
-                                res = await self.create_record(module, record)
-                                if res.is_ok():
-                                    logger.info(f"Successfully load record {module}.{record.id}")
-                                else:
-                                    logger.error(f"Failed to load record {module}.{record.id}: {res.err_value}")
-                                    continue
-                            except Exception as exc:
-                                logger.error(f"Error processing record {record.id}: {exc}")
-                                continue
-                    logger.info(f"Successfully processed {len(records)} records")
+                    res = await self.create_record(module, record)
+                    if res.is_ok():
+                        # 每条记录一次的日志用%格式，被采样丢弃时不格式化
+                        logger.info("Successfully load record %s.%s", module, record.id)
+                        return True
+                    logger.error(f"Failed to load record {module}.{record.id}: {res.err_value}")
                 except Exception as exc:
-                    logger.error(f"Failed to parse record: {exc}")
-                    continue
-            return Ok(True)
-        except json.JSONDecodeError as exc:
-            logger.error(f"Invalid JSON in manifest for app {module}: {str(exc)}")
+                    logger.error(f"Error processing record {record.id}: {exc}")
+                return False
+
+        loaded = 0
+        # 同一层的记录互不引用，可以并发写入
+        for level in self.record_levels(module, records):
+            loaded += sum(await asyncio.gather(*(load_record(record) for record in level)))
+        return Ok(loaded)
+
+    @staticmethod
+    def record_levels(module: str, records: List[Record]) -> List[List[Record]]:
+        """按批次内的引用关系分层，被引用（或同id的先出现）的记录位于更早的层"""
+        levels: List[List[Record]] = []
+        defined: Dict[str, int] = {}
+        for record in records:
+            level = 0
+            for ref in record_refs(record) + [f"{module}.{record.id}"]:
+                if ref in defined:
+                    level = max(level, defined[ref] + 1)
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(record)
+            defined[f"{module}.{record.id}"] = level
+        return levels
+
+    async def load_chunks(self, module: str, path: str) -> Result[Tuple[int, int], Exception]:
+        """
+        流式解析数据文件并按批次写入
+        :return: (成功处理的记录数量, 文件中的记录数量)
+        """
+        loaded, total = 0, 0
+        for chunk_result in self.iter_chunks(path):
+            if not chunk_result.is_ok():
+                return Err(chunk_result.err_value)
+            records = chunk_result.ok_value
+            total += len(records)
+            # 批量预取本批次引用的所有xml_id
+            prefetch_result = await self.resolver.prefetch(
+                [ref for record in records for ref in record_refs(record)])
+            if not prefetch_result.is_ok():
+                return Err(prefetch_result.err_value)
+            write_result = await self.write_records(module, records)
+            if not write_result.is_ok():
+                return Err(write_result.err_value)
+            loaded += write_result.ok_value
+        return Ok((loaded, total))
+
+    def unchanged(self, record: Record, tmp: Model) -> bool:
+        """增量模式下，记录原文哈希与上次写入时一致"""
+        return bool(self.incremental and record.checksum
+                    and (tmp.data or {}).get("checksum") == record.checksum)
+
+    @staticmethod
+    def file_checksum(path: str) -> str:
+        """计算数据文件内容哈希"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    async def save_file_checksum(self, module: str, name: str, checksum: str, records: int) -> Result[bool, Exception]:
+        """记录数据文件已完整加载时的哈希"""
+        tmp_result = await self.get_first("ir_model_data_file", {"module": module, "name": name})
+        if not tmp_result.is_ok():
+            return Err(tmp_result.err_value)
+        data = {"checksum": checksum, "records": records}
+        if tmp_result.ok_value is None:
+            res = await self.create("ir_model_data_file", {"module": module, "name": name, **data})
+        else:
+            res = await self.update("ir_model_data_file", {"id": tmp_result.ok_value.id}, data)
+        if not res.is_ok():
+            return Err(res.err_value)
+        return Ok(True)
+
+    async def load_file(self, module: str, path: str) -> Result[int, Exception]:
+        """
+        加载单个数据文件，返回处理的记录数量
+        增量模式下文件哈希未变化时直接跳过，只需要一次查询
+        写入的表在文件加载结束（事务已提交）后统一失效查询缓存
+        """
+        async with query_cache.deferred():
+            return await self._load_file(module, path)
+
+    async def _load_file(self, module: str, path: str) -> Result[int, Exception]:
+        name = self.data_name(module, path)
+        checksum = None
+        if self.incremental:
+            # 快照中的哈希已在读取快照时与磁盘上的文件比较过
+            checksum = self.snapshot[path]["checksum"] if self.snapshot and path in self.snapshot \
+                else self.file_checksum(path)
+            tmp_result = await self.get_first("ir_model_data_file", {"module": module, "name": name})
+            if not tmp_result.is_ok():
+                return Err(tmp_result.err_value)
+            if tmp_result.ok_value is not None and tmp_result.ok_value.checksum == checksum:
+                self.stats["files_skipped"] += 1
+                logger.info(f"Skip unchanged data file {module}:{name}")
+                return Ok(0)
+
+        async def load() -> Result[int, Exception]:
+            res = await self.load_chunks(module, path)
+            if not res.is_ok():
+                return Err(res.err_value)
+            loaded, total = res.ok_value
+            # 只有全部记录都写入成功才记录文件哈希，否则下次启动重新加载
+            if checksum is not None and loaded == total:
+                save_result = await self.save_file_checksum(module, name, checksum, total)
+                if not save_result.is_ok():
+                    return Err(save_result.err_value)
+            self.stats["files_loaded"] += 1
+            return Ok(loaded)
+
+        if not (self.bulk and self.commit == "file"):
+            return await load()
+        savepoint = self.resolver.savepoint()
+        try:
+            async with in_transaction(await self.connection_name()):
+                res = await load()
+                if not res.is_ok():
+                    raise res.err_value
+        except Exception as exc:
+            self.resolver.rollback(savepoint)
+            return Err(exc)
+        self.resolver.release(savepoint)
+        return res
+
+    def scan_file(self, module: str, path: str) -> Result[Tuple[Set[str], Set[str]], Exception]:
+        """
+        快速扫描数据文件，只读取属性不执行eval
+        :return: (文件中定义的xml_id, 文件引用的xml_id)
+        """
+        defined, refs = set(), set()
+        try:
+            for _, element in ET.iterparse(path, events=("end",)):
+                if element.tag == "record":
+                    if element.get("id"):
+                        defined.add(f"{module}.{element.get('id')}")
+                    element.clear()
+                elif element.tag == "field":
+                    if element.get("ref"):
+                        refs.add(element.get("ref"))
+                    elif element.get("eval"):
+                        try:
+                            for val in ast.literal_eval(element.get("eval")):
+                                if val[0] == 4:
+                                    refs.add(val[1])
+                        except Exception as exc:
+                            logger.warning(f"Skip dependency scan of eval {element.get('eval')}: {exc}")
+            return Ok((defined, refs))
+        except Exception as exc:
+            return Err(exc)
+
+    @staticmethod
+    def data_name(module: str, path: str) -> str:
+        """数据文件相对于模块目录的名称"""
+        from rcc.config import BASE_DIR
+        return os.path.relpath(path, os.path.join(BASE_DIR, 'apps', module)).replace(os.sep, '/')
+
+    @staticmethod
+    def data_path(module: str, name: str) -> str:
+        """数据文件名称对应的完整路径"""
+        from rcc.config import BASE_DIR
+        return os.path.join(BASE_DIR, 'apps', module, os.path.normpath(name.replace('/', os.sep)))
+
+    def scan_apps(self, apps: List[Tuple[str, str]]) -> Result[
+            Tuple[Dict[str, List[str]], Dict[Tuple[str, str], Tuple[Set[str], Set[str]]]], Exception]:
+        """
+        读取manifest并扫描数据文件，使用快照时直接读取快照中保存的扫描结果
+        :param apps: [(模块名称, manifest路径)]
+        :return: ({模块名称: 依赖模块}, {(模块名称, 文件路径): (定义的xml_id, 引用的xml_id)})
+        """
+        depends: Dict[str, List[str]] = {}
+        scans: Dict[Tuple[str, str], Tuple[Set[str], Set[str]]] = {}
+        try:
+            if self.snapshot is not None:
+                modules = [module for module, _ in apps]
+                for module in modules:
+                    if module not in self.snapshot_depends:
+                        logger.warning(f"App {module} is not in the data snapshot")
+                        continue
+                    depends[module] = self.snapshot_depends[module]
+                for path, entry in list(self.snapshot.items()):
+                    if entry["module"] not in depends:
+                        continue
+                    node = (entry["module"], path)
+                    # 数据文件在生成快照后有修改时，该文件改为从xml加载
+                    if os.path.exists(path) and self.file_checksum(path) != entry["checksum"]:
+                        logger.warning(f"Data snapshot is outdated for {path}, loading it from xml")
+                        del self.snapshot[path]
+                        scan_result = self.scan_file(*node)
+                        if not scan_result.is_ok():
+                            logger.error(f"Failed to scan {path}: {scan_result.err_value}")
+                            continue
+                        scans[node] = scan_result.ok_value
+                        continue
+                    scans[node] = (set(entry["defined"]), set(entry["refs"]))
+                return Ok((depends, scans))
+
+            for module, path in apps:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest_data = json.load(f)
+                depends[module] = [dep.split('.')[-1] for dep in manifest_data.get('depends', [])]
+                for data_file in manifest_data.get('data', []):
+                    node = (module, self.data_path(module, data_file))
+                    scan_result = self.scan_file(*node)
+                    if not scan_result.is_ok():
+                        logger.error(f"Failed to scan {node[1]}: {scan_result.err_value}")
+                        continue
+                    scans[node] = scan_result.ok_value
+            return Ok((depends, scans))
+        except Exception as exc:
+            return Err(exc)
+
+    def build_graph(self, apps: List[Tuple[str, str]]) -> Result[DependencyGraph, Exception]:
+        """
+        根据ref/eval引用和manifest的depends构建数据文件依赖图
+        :param apps: [(模块名称, manifest路径)]
+        """
+        scan_result = self.scan_apps(apps)
+        if not scan_result.is_ok():
+            return Err(scan_result.err_value)
+        depends, scans = scan_result.ok_value
+        graph = DependencyGraph()
+        files: Dict[str, List[Tuple[str, str]]] = {module: [] for module in depends}
+        owners: Dict[str, Tuple[str, str]] = {}
+        try:
+            for node, (defined, _) in scans.items():
+                for xml_id in defined:
+                    owners.setdefault(xml_id, node)
+                files[node[0]].append(node)
+                graph.add_node(node)
+            # 文件引用了其他文件定义的记录
+            for node, (_, refs) in scans.items():
+                for ref in refs:
+                    if ref in owners:
+                        graph.add_edge(node, owners[ref])
+            # 模块声明的依赖，依赖模块的所有文件先加载
+            for module, deps in depends.items():
+                for dep in deps:
+                    if dep not in files:
+                        logger.warning(f"App {module} depends on {dep}, which is not installed")
+                        continue
+                    for node in files[module]:
+                        for dep_node in files[dep]:
+                            graph.add_edge(node, dep_node)
+            return Ok(graph)
+        except Exception as exc:
+            return Err(exc)
+
+    async def compile(self, apps: List[Tuple[str, str]], output: str) -> Result[int, Exception]:
+        """
+        解析数据文件并执行eval，将记录保存为压缩的二进制快照，加载快照时不再解析xml
+        :param apps: [(模块名称, manifest路径)]
+        :param output: 快照文件路径
+        :return: 快照中的记录数量
+        """
+        scan_result = self.scan_apps(apps)
+        if not scan_result.is_ok():
+            return Err(scan_result.err_value)
+        depends, scans = scan_result.ok_value
+        files = []
+        total = 0
+        try:
+            for (module, path), (defined, refs) in scans.items():
+                records = []
+                for res in self.iter_records(path):
+                    if not res.is_ok():
+                        return Err(res.err_value)
+                    eval_result = await self.evaluate(res.ok_value)
+                    if not eval_result.is_ok():
+                        return Err(eval_result.err_value)
+                    record = eval_result.ok_value
+                    records.append((record.id, record.model, record.noupdate,
+                                    record.fields, record.many2many, record.checksum))
+                files.append({
+                    "module": module,
+                    "name": self.data_name(module, path),
+                    "checksum": self.file_checksum(path),
+                    "defined": sorted(defined),
+                    "refs": sorted(refs),
+                    "records": records,
+                })
+                total += len(records)
+                logger.info(f"Compiled {len(records)} records of {path}")
+            payload = zlib.compress(json.dumps(snapshot_encode({
+                "version": SNAPSHOT_VERSION,
+                "depends": depends,
+                "files": files,
+            }), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            # 先写临时文件再替换，避免留下不完整的快照
+            tmp_path = f"{output}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC + payload)
+            os.replace(tmp_path, output)
+            logger.info(f"Data snapshot saved to {output}: {len(files)} files, {total} records")
+            return Ok(total)
+        except Exception as exc:
+            return Err(exc)
+        finally:
+            shutdown_eval_pool()
+
+    def use_snapshot(self, path: str) -> Result[int, Exception]:
+        """
+        使用compile生成的快照代替xml数据文件，快照只包含数据（JSON），读取时不会执行代码
+        :return: 快照中的文件数量
+        """
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            if not content.startswith(SNAPSHOT_MAGIC):
+                return Err(ValueError(f"{path} is not a data snapshot"))
+            try:
+                data = json.loads(zlib.decompress(content[len(SNAPSHOT_MAGIC):]), object_hook=snapshot_decode)
+            except (zlib.error, ValueError):
+                return Err(ValueError(f"{path} is not a supported data snapshot, run compile-data again"))
+            if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+                return Err(ValueError("Unsupported data snapshot version, run compile-data again"))
+            self.snapshot = {self.data_path(entry["module"], entry["name"]): entry for entry in data["files"]}
+            self.snapshot_depends = data["depends"]
+            return Ok(len(self.snapshot))
+        except Exception as exc:
             return Err(exc)
+
+    async def load(self, apps: List[Tuple[str, str]],
+                   dry_run: bool = False) -> Result[Dict[Tuple[str, str], Result[int, Exception]], Exception]:
+        """
+        按依赖关系并发加载多个模块的数据文件，被引用的记录总是先写入
+        :param apps: [(模块名称, manifest路径)]
+        :param dry_run: 在同一个事务中依次加载，结束后回滚，只统计会产生的变更
+        :return: {(模块名称, 文件路径): 加载结果}
+        """
+        graph_result = self.build_graph(apps)
+        if not graph_result.is_ok():
+            logger.error(graph_result.err_value)
+            return Err(graph_result.err_value)
+        graph = graph_result.ok_value
+        if not dry_run:
+            return Ok(await self.load_graph(graph))
+
+        # 事务连接不能并发使用，dry-run时顺序执行
+        self.concurrency = 1
+        self._record_semaphore = asyncio.Semaphore(1)
+        results = {}
+        try:
+            async with in_transaction(await self.connection_name()):
+                results = await self.load_graph(graph)
+                raise DryRunRollback()
+        except DryRunRollback:
+            logger.info("Dry run finished, all changes rolled back")
         except Exception as exc:
-            logger.error(exc)
             return Err(exc)
+        finally:
+            self.resolver.clear()
+        return Ok(results)
+
+    async def load_graph(self, graph: DependencyGraph) -> Dict[Tuple[str, str], Result[int, Exception]]:
+        """按依赖图加载数据文件"""
+
+        async def load_node(node):
+            module, full_data_path = node
+            res = await self.load_file(module, full_data_path)
+            if res.is_ok():
+                logger.info(f"Successfully processed {res.ok_value} records of {full_data_path}")
+            else:
+                logger.error(f"Failed to load {full_data_path}: {res.err_value}")
+            return res
+
+        run_result = await graph.run(load_node, self.concurrency)
+        if run_result.is_ok():
+            results = run_result.ok_value
+        else:
+            # 存在循环依赖时按照模块和文件的声明顺序依次加载
+            logger.error(f"{run_result.err_value}, fallback to sequential loading")
+            results = {}
+            for node in graph.nodes:
+                results[node] = await load_node(node)
+        shutdown_eval_pool()
+        logger.info("Data loading finished: " + ", ".join(f"{k}={v}" for k, v in self.stats.items()))
+        return results
+
+    async def parse(self, module: str, path: str) -> Result[bool, Exception]:
+        """加载单个模块的数据文件"""
+        res = await self.load([(module, path)])
+        if not res.is_ok():
+            return Err(res.err_value)
+        return Ok(True)
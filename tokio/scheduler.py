@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+import jsonpickle
+from celery.schedules import schedstate
+from redisbeat.scheduler import RedisScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def disabled_key(key: str) -> str:
+    """禁用的任务保存在该哈希中 {任务名称: 成员}，不在有序集合里，beat 不会读取"""
+    return f"{key}:disabled"
+
+
+def version_key(key: str) -> str:
+    """每次写入有序集合或禁用任务哈希后加一，ScheduleIndex 据此判断快照是否过期"""
+    return f"{key}:version"
+
+
+def is_enabled(entry) -> bool:
+    """ScheduleEntry 没有启用状态，禁用时 options 中保存 enabled=False"""
+    return (entry.options or {}).get('enabled', True) is not False
+
+
+class RedisBeatScheduler(RedisScheduler):
+    """
+    beat 使用的调度器（schedule.py 中的 CELERY_BEAT_SCHEDULER）
+    启动时把有序集合中禁用的任务移到 disabled_key 哈希，执行前去掉 options 中的 enabled
+    改写有序集合后增加 version_key 的版本号
+    """
+
+    def __init__(self, *args, **kwargs):
+        app = kwargs['app']
+        key = app.conf.get("CELERY_REDIS_SCHEDULER_KEY", "celery:beat:order_tasks")
+        self.disabled_key = disabled_key(key)
+        self.version_key = version_key(key)
+        self._reserved = False
+        super().__init__(*args, **kwargs)
+
+    def bump(self) -> int:
+        return self.rdb.incr(self.version_key)
+
+    def merge_inplace(self, tasks):
+        super().merge_inplace(tasks)
+        self.bump()
+
+    def add(self, **kwargs):
+        added = super().add(**kwargs)
+        self.bump()
+        return added
+
+    def remove(self, task_key):
+        removed = super().remove(task_key)
+        if removed:
+            self.bump()
+        return removed
+
+    def setup_schedule(self):
+        super().setup_schedule()
+        self.move_disabled()
+
+    def move_disabled(self) -> int:
+        """有序集合中禁用的任务（旧版本写入的）移到哈希，返回移动的数量"""
+        moved = 0
+        for member in self.rdb.zrange(self.key, 0, -1):
+            entry = jsonpickle.decode(member)
+            if is_enabled(entry):
+                continue
+            pipe = self.rdb.pipeline(transaction=True)
+            pipe.zrem(self.key, member)
+            pipe.hset(self.disabled_key, entry.name, member)
+            pipe.execute()
+            moved += 1
+        if moved:
+            self.bump()
+            logger.info(f"Moved {moved} disabled schedules to {self.disabled_key}")
+        return moved
+
+    def reserve(self, entry):
+        # tick 中到期的任务会用新的执行记录替换成员
+        self._reserved = True
+        return super().reserve(entry)
+
+    def tick(self):
+        self._reserved = False
+        interval = super().tick()
+        if self._reserved:
+            self.bump()
+        return interval
+
+    def is_due(self, entry):
+        # 启动后才写入有序集合的禁用任务不执行
+        if not is_enabled(entry):
+            return schedstate(False, self.max_interval)
+        return super().is_due(entry)
+
+    def apply_async(self, entry, producer=None, advance=True, **kwargs):
+        # enabled 不是发送任务的选项；替换而不是修改 options，tick 中的下一次 entry 共用同一个字典
+        if entry.options and 'enabled' in entry.options:
+            entry.options = {key: value for key, value in entry.options.items() if key != 'enabled'}
+        return super().apply_async(entry, producer, advance, **kwargs)
@@ -1,17 +1,283 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import logging
-from typing import Optional, Dict, Any, List, Union
+import re
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple, Union
 from datetime import datetime
+import jsonpickle
 from celery.schedules import crontab, schedule
-from redisbeat.scheduler import RedisScheduler
 from result import Result, Ok, Err
 
 from schedule import app
+from tokio.scheduler import RedisBeatScheduler, disabled_key, is_enabled, version_key
 
 logger = logging.getLogger(__name__)
 
+# add 的参数中作为任务选项保存的字段
+TASK_OPTIONS = ('queue', 'exchange', 'routing_key', 'priority')
+
+
+class ScheduleIndex(object):
+    """
+    RedisScheduler 有序集合与禁用任务哈希的本地快照 {任务名称: (redis中的成员, ScheduleEntry)}，按名称查找不访问redis
+    第一次使用时检查 redis 是否开启了 keyspace notifications（notify-keyspace-events 包含 K 以及 z、h 或 A），
+    开启时订阅这两个键的变更，收到通知后重新读取；否则快照使用超过 max_age 秒后比较
+    变更信号（version_key 的版本号 + 有序集合与哈希的成员数），有变化时才重新读取
+    版本号由 RedisBeatScheduler 与本类的写入增加，成员数用于发现不增加版本号的写入（旧版本的beat、app.add_task）
+    """
+
+    def __init__(self, rdb, key: str, max_age: float = 1.0, listen: bool = True):
+        self.rdb = rdb
+        self.key = key
+        self.disabled_key = disabled_key(key)
+        self.version_key = version_key(key)
+        self.max_age = max_age
+        # 是否尝试订阅变更通知，第一次使用时才访问redis
+        self.listen = listen
+        self._entries: Dict[str, Tuple[bytes, Any]] = {}
+        # 快照对应的变更信号 (版本号, 有序集合成员数, 哈希成员数) 与最后一次确认的时间
+        self._signal: Optional[Tuple[int, int, int]] = None
+        self._checked = 0.0
+        self._dirty = True
+        self._lock = threading.RLock()
+        self._listener = None
+
+    def _listen(self):
+        self.listen = False
+        try:
+            events = self.rdb.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+            if "K" not in events or ("A" not in events and ("z" not in events or "h" not in events)):
+                return
+            db = self.rdb.connection_pool.connection_kwargs.get("db", 0)
+            pubsub = self.rdb.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{f"__keyspace@{db}__:{key}": self._on_change for key in (self.key, self.disabled_key)})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                  exception_handler=self._on_listener_error)
+        except Exception as exc:
+            # 托管的redis可能禁用了 CONFIG，按 max_age 比较变更信号
+            logger.debug(f"Keyspace notifications unavailable for {self.key}: {exc}")
+
+    def _on_change(self, _message):
+        self._dirty = True
+
+    def _on_listener_error(self, exc, pubsub, thread):
+        """订阅断开后回到按 max_age 比较变更信号"""
+        logger.warning(f"Schedule keyspace listener stopped: {exc}")
+        self._dirty = True
+        self._listener = None
+        thread.stop()
+        pubsub.close()
+
+    @property
+    def listening(self) -> bool:
+        return self._listener is not None and self._listener.is_alive()
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def _fresh(self, max_age: Optional[float] = None) -> bool:
+        """
+        :param max_age: 本次不比较变更信号的时间，默认为 self.max_age；订阅变更时快照始终有效
+        """
+        if self.listen:
+            self._listen()
+        if self._dirty or self._signal is None:
+            return False
+        if self.listening:
+            return True
+        now = time.monotonic()
+        if now - self._checked < (self.max_age if max_age is None else max_age):
+            return True
+        if self._read_signal() != self._signal:
+            return False
+        self._checked = now
+        return True
+
+    def _read_signal(self) -> Tuple[int, int, int]:
+        """一次往返读取变更信号，不读取成员"""
+        pipe = self.rdb.pipeline(transaction=True)
+        pipe.get(self.version_key)
+        pipe.zcard(self.key)
+        pipe.hlen(self.disabled_key)
+        version, zcard, hlen = pipe.execute()
+        return int(version or 0), zcard, hlen
+
+    def refresh(self):
+        """重新读取整个有序集合与禁用任务哈希"""
+        with self._lock:
+            # 先清除标记，读取期间的变更会再次标记
+            self._dirty = False
+            loaded = time.monotonic()
+            pipe = self.rdb.pipeline(transaction=True)
+            pipe.get(self.version_key)
+            pipe.zrange(self.key, 0, -1)
+            pipe.hvals(self.disabled_key)
+            version, members, disabled = pipe.execute()
+            entries = {}
+            for member in [*members, *disabled]:
+                entry = jsonpickle.decode(member)
+                entries[entry.name] = (member, entry)
+            self._entries = entries
+            self._signal = (int(version or 0), len(members), len(disabled))
+            self._checked = loaded
+
+    def entries(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """{任务名称: ScheduleEntry}"""
+        if not self._fresh(max_age):
+            self.refresh()
+        return {name: entry for name, (_, entry) in self._entries.items()}
+
+    def get(self, name: str, max_age: Optional[float] = None) -> Optional[Any]:
+        """:param max_age: 为0时每次比较变更信号"""
+        if not self._fresh(max_age):
+            self.refresh()
+        item = self._entries.get(name)
+        return item[1] if item else None
+
+    def exists(self, name: str) -> bool:
+        """
+        写入前检查任务是否存在：变更信号没有变化时使用快照，
+        否则只查找该名称（HEXISTS + 按名称匹配的 ZSCAN），不重新读取全部任务
+        """
+        with self._lock:
+            if self._signal is None:
+                self.refresh()
+            if self._fresh(0):
+                return name in self._entries
+            if self.rdb.hexists(self.disabled_key, name):
+                return True
+            # 成员中的名称是JSON字符串，匹配后解码确认
+            pattern = "*" + re.sub(r'([*?\[\]\\])', r'\\\1', json.dumps(name)) + "*"
+            for member, _ in self.rdb.zscan_iter(self.key, match=pattern):
+                if jsonpickle.decode(member).name == name:
+                    return True
+            return False
+
+    @staticmethod
+    def _member(entry) -> bytes:
+        member = jsonpickle.encode(entry)
+        return member.encode() if isinstance(member, str) else member
+
+    def _execute(self, removes: List[Tuple[bytes, Any]], adds: List[Tuple[bytes, Any, float]]) -> List[int]:
+        """
+        一次事务中删除、添加任务，启用的任务在有序集合中，禁用的在哈希中
+        :param removes: [(成员, ScheduleEntry)]
+        :param adds: [(成员, ScheduleEntry, 分数)]
+        :return: 每个被删除任务的删除数
+        """
+        pipe = self.rdb.pipeline(transaction=True)
+        for member, entry in removes:
+            if is_enabled(entry):
+                pipe.zrem(self.key, member)
+            else:
+                pipe.hdel(self.disabled_key, entry.name)
+        enabled = {}
+        for member, entry, score in adds:
+            if is_enabled(entry):
+                pipe.hdel(self.disabled_key, entry.name)
+                enabled[member] = score
+            else:
+                pipe.hset(self.disabled_key, entry.name, member)
+        if enabled:
+            pipe.zadd(self.key, enabled)
+        return self._commit(pipe)[:len(removes)]
+
+    def _commit(self, pipe) -> List[Any]:
+        """
+        在写入的事务中增加版本号并读取成员数，返回写入命令的结果
+        期间没有其他写入时（版本号只增加了一）快照仍然有效，只更新变更信号
+        """
+        pipe.incr(self.version_key)
+        pipe.zcard(self.key)
+        pipe.hlen(self.disabled_key)
+        *results, version, zcard, hlen = pipe.execute()
+        if self._signal is not None and version == self._signal[0] + 1:
+            self._signal = (version, zcard, hlen)
+        else:
+            self._dirty = True
+        return results
+
+    def add(self, entry, score: float):
+        """快照中没有同名任务时直接写入，不需要先重新读取（调用方已用 exists 检查）"""
+        with self._lock:
+            if entry.name in self._entries:
+                self.add_many([(entry, score)])
+                return
+            member = self._member(entry)
+            self._execute([], [(member, entry, score)])
+            self._entries[entry.name] = (member, entry)
+
+    def add_many(self, entries: List[Tuple[Any, float]]) -> int:
+        """
+        一次事务写入多个任务，快照中的同名任务被替换
+        同名任务的成员已被beat更新时，重新读取并删除有序集合中留下的旧成员
+        """
+        with self._lock:
+            if not self._fresh():
+                self.refresh()
+            added = {entry.name: (self._member(entry), entry, score) for entry, score in entries}
+            replaced = [self._entries[name] for name in added if name in self._entries]
+            counts = self._execute(replaced, list(added.values()))
+            for name, (member, entry, _) in added.items():
+                self._entries[name] = (member, entry)
+            if not all(counts):
+                self._purge(set(added), {member for member, _, _ in added.values()})
+            return len(added)
+
+    def _purge(self, names, keep):
+        """删除有序集合中 names 里不在 keep 中的成员"""
+        stale = [member for member in self.rdb.zrange(self.key, 0, -1)
+                 if member not in keep and jsonpickle.decode(member).name in names]
+        if stale:
+            pipe = self.rdb.pipeline(transaction=True)
+            for member in stale:
+                pipe.zrem(self.key, member)
+            self._commit(pipe)
+
+    def remove(self, name: str) -> bool:
+        return bool(self.remove_many([name]))
+
+    def remove_many(self, names: List[str]) -> List[str]:
+        """
+        按快照中的成员在一次事务中删除，返回删除的任务名称
+        成员已被beat更新（运行次数等）时重新读取后再删除一次
+        """
+        with self._lock:
+            removed, pending = [], list(dict.fromkeys(names))
+            for attempt in range(2):
+                if attempt or not self._fresh():
+                    self.refresh()
+                found = [name for name in pending if name in self._entries]
+                if not found:
+                    break
+                counts = self._execute([self._entries[name] for name in found], [])
+                pending = []
+                for name, count in zip(found, counts):
+                    if count:
+                        self._entries.pop(name, None)
+                        removed.append(name)
+                    else:
+                        pending.append(name)
+                if not pending:
+                    break
+                self._dirty = True
+            return removed
+
+    def clear(self):
+        with self._lock:
+            pipe = self.rdb.pipeline(transaction=True)
+            pipe.delete(self.key, self.disabled_key)
+            pipe.incr(self.version_key)
+            pipe.execute()
+            self._entries = {}
+            self._dirty = True
+
 
 class Task:
     """celery定时任务管理器"""
@@ -19,27 +285,45 @@ class Task:
     def __init__(self, celery_app=None):
         """初始化任务管理器"""
         self.celery_app = celery_app or app
-        self.scheduler = RedisScheduler(app=self.celery_app)
+        self.scheduler = RedisBeatScheduler(app=self.celery_app)
+        self.index = ScheduleIndex(self.scheduler.rdb, self.scheduler.key)
+
+    @staticmethod
+    def describe(entry) -> Dict[str, Any]:
+        """ScheduleEntry 转为字典"""
+        options = dict(entry.options or {})
+        return {
+            'name': entry.name,
+            'task': entry.task,
+            'schedule': entry.schedule,
+            'args': list(entry.args or []),
+            'kwargs': dict(entry.kwargs or {}),
+            'options': options,
+            'enabled': is_enabled(entry),
+            'last_run_at': entry.last_run_at,
+            'total_run_count': entry.total_run_count,
+        }
 
     def list(self) -> Result[Dict[str, Any], Exception]:
         """
         列出所有定时任务
         """
         try:
-            return Ok(self.scheduler.list())
+            return Ok({name: self.describe(entry) for name, entry in self.index.entries().items()})
         except Exception as exc:
             return Err(exc)
 
     def export(self) -> Result[List[Dict[str, Any]], Exception]:
-        """导出所有任务配置，用于备份"""
+        """导出所有任务配置，用于备份，可以用 import_ 恢复"""
         try:
-            tasks = self.scheduler.list()
+            tasks = self.list().unwrap()
             exported = []
             for name, info in tasks.items():
                 exported.append({
                     'name': name,
                     'task': info.get("task", None),
                     'schedule': str(info.get("schedule", "")),
+                    **self.schedule_options(info.get("schedule"), info.get("last_run_at")),
                     'args': info.get("args", []),
                     'kwargs': info.get("kwargs", {}),
                     'options': info.get("options", {}),
@@ -52,9 +336,7 @@ class Task:
     def clear(self) -> Result[bool, Exception]:
         """清除所有定时任务"""
         try:
-            tasks = self.scheduler.list()
-            for name in tasks:
-                self.scheduler.remove(name)
+            self.index.clear()
             return Ok(True)
         except Exception as exc:
             return Err(exc)
@@ -66,8 +348,7 @@ class Task:
         :return:
         """
         try:
-            self.scheduler.remove(name)
-            return Ok(True)
+            return Ok(self.index.remove(name))
         except Exception as exc:
             return Err(exc)
 
@@ -78,8 +359,8 @@ class Task:
         :return:
         """
         try:
-            tasks = self.scheduler.list()
-            return Ok(tasks.get(name))
+            entry = self.index.get(name)
+            return Ok(self.describe(entry) if entry is not None else None)
         except Exception as exc:
             return Err(exc)
 
@@ -89,6 +370,8 @@ class Task:
         try:
             schedule_type = options.get('schedule_type', 'crontab')
 
+            if not schedule_type:
+                return Err(ValueError("schedule_type 不能为空"))
             if schedule_type == 'crontab':
                 # 创建 crontab 调度
                 return Ok(crontab(
@@ -139,36 +422,153 @@ class Task:
                 - queue/exchange/routing_key/priority: 任务选项
         """
         try:
-            # 检查任务名称是否已存在
-            existing_tasks = self.scheduler.list()
-            if options['name'] in existing_tasks:
+            # 检查任务名称是否已存在，避免其他进程刚添加的任务被重复添加
+            if self.index.exists(options['name']):
                 return Err(ValueError(f"任务 '{options['name']}' 已存在"))
+            entry_result = self.entry(options)
+            if not entry_result.is_ok():
+                return Err(entry_result.err_value)
+            entry = entry_result.ok_value
+            self.index.add(entry, self.score(entry))
+            return Ok(True)
+        except Exception as exc:
+            return Err(exc)
+
+    @staticmethod
+    def schedule_options(value, last_run_at: Optional[datetime] = None) -> Dict[str, Any]:
+        """调度对象转为 model 的参数，不支持的类型返回空字典"""
+        if isinstance(value, crontab):
+            return {
+                'schedule_type': 'crontab',
+                'crontab_minute': value._orig_minute,
+                'crontab_hour': value._orig_hour,
+                'crontab_day_of_week': value._orig_day_of_week,
+                'crontab_day_of_month': value._orig_day_of_month,
+                'crontab_month_of_year': value._orig_month_of_year,
+            }
+        if isinstance(value, schedule) and value.relative:
+            # 一次性任务：创建时间(last_run_at) + 间隔为执行时间
+            if last_run_at is None:
+                return {}
+            return {'schedule_type': 'date', 'run_date': (last_run_at + value.run_every).isoformat()}
+        if isinstance(value, schedule):
+            return {'schedule_type': 'interval', 'interval_seconds': value.run_every.total_seconds()}
+        return {}
+
+    def entry(self, options: Dict[str, Any], previous=None) -> Result[Any, Exception]:
+        """
+        校验参数并创建 ScheduleEntry，参数同 add
+        :param previous: 被替换的同名任务，保留其执行记录
+        """
+        try:
+            if not options.get('name'):
+                return Err(ValueError("name 不能为空"))
+            if not options.get('task'):
+                return Err(ValueError("task 不能为空"))
             # 创建调度对象
-            obj = self.model(options)
+            model_result = self.model(options)
+            if not model_result.is_ok():
+                return Err(model_result.err_value)
             # 准备任务选项
             task_options = {}
-            if options.get('queue'):
-                task_options['queue'] = options['queue']
-            if options.get('exchange'):
-                task_options['exchange'] = options['exchange']
-            if options.get('routing_key'):
-                task_options['routing_key'] = options['routing_key']
-            if options.get('priority'):
-                task_options['priority'] = options['priority']
-            # 添加到调度器
-            self.scheduler.add(
+            if not options.get('enabled', True):
+                task_options['enabled'] = False
+            for key in TASK_OPTIONS:
+                if options.get(key):
+                    task_options[key] = options[key]
+            history = {}
+            # 一次性任务的间隔从创建时间开始计算，不保留原来的执行记录
+            if previous is not None and not getattr(model_result.ok_value, 'relative', False):
+                history = {'last_run_at': previous.last_run_at, 'total_run_count': previous.total_run_count}
+            return Ok(self.scheduler.Entry(
                 name=options['name'],
                 task=options['task'],
-                schedule=obj,
+                schedule=model_result.ok_value,
                 args=options.get('args', []),
                 kwargs=options.get('kwargs', {}),
                 options=task_options or None,
-                enabled=options.get('enabled', True)
-            )
-            return Ok(True)
+                app=self.celery_app,
+                **history,
+            ))
         except Exception as exc:
             return Err(exc)
 
+    def score(self, entry) -> float:
+        """与 RedisScheduler.add 相同的分数（下次执行时间）"""
+        return self.scheduler._when(entry, entry.is_due()[1]) or 0
+
+    def add_many(self, items: List[Dict[str, Any]], replace: bool = False) -> Result[Dict[str, Any], Exception]:
+        """
+        批量添加定时任务，参数同 add；先校验全部任务，再在一次redis事务中写入校验通过的任务
+        :param replace: 替换同名任务（保留其执行记录），否则同名任务报错
+        :return: {"added": [任务名称], "errors": {任务名称或#序号: 错误信息}}
+        """
+        try:
+            current = self.index.entries(max_age=0)
+            entries, errors = {}, {}
+            for i, options in enumerate(items):
+                if not isinstance(options, dict):
+                    errors[f"#{i}"] = "任务参数必须是字典"
+                    continue
+                key = options.get('name') or f"#{i}"
+                if key in entries or key in errors:
+                    errors[key] = f"任务 '{key}' 重复"
+                    entries.pop(key, None)
+                    continue
+                if not replace and key in current:
+                    errors[key] = f"任务 '{key}' 已存在"
+                    continue
+                entry_result = self.entry(options, current.get(key))
+                if not entry_result.is_ok():
+                    errors[key] = str(entry_result.err_value)
+                    continue
+                entries[key] = entry_result.ok_value
+            if entries:
+                self.index.add_many([(entry, self.score(entry)) for entry in entries.values()])
+            if errors:
+                logger.warning(f"{len(errors)} schedules rejected: {errors}")
+            return Ok({"added": list(entries), "errors": errors})
+        except Exception as exc:
+            return Err(exc)
+
+    def remove_many(self, names: List[str]) -> Result[Dict[str, List[str]], Exception]:
+        """
+        在一次redis事务中删除多个定时任务
+        :return: {"removed": [删除的任务名称], "missing": [不存在的任务名称]}
+        """
+        try:
+            removed = self.index.remove_many(names)
+            missing = [name for name in dict.fromkeys(names) if name not in set(removed)]
+            return Ok({"removed": removed, "missing": missing})
+        except Exception as exc:
+            return Err(exc)
+
+    def import_(self, exported: List[Dict[str, Any]], replace: bool = True) -> Result[Dict[str, Any], Exception]:
+        """
+        从 export 的结果恢复定时任务，重复导入结果相同
+        :param replace: 替换同名任务（保留其执行记录），否则同名任务报错
+        :return: 同 add_many
+        """
+        items = []
+        for item in exported:
+            if not isinstance(item, dict):
+                items.append(item)
+                continue
+            options = {key: value for key, value in item.items() if key not in ('schedule', 'options')}
+            # 缺少调度类型时报错，不使用 model 默认的 crontab（每分钟执行）
+            options.setdefault('schedule_type', None)
+            if isinstance(options.get('run_date'), str):
+                try:
+                    options['run_date'] = datetime.fromisoformat(options['run_date'])
+                except ValueError:
+                    # 由 model 报告该任务的错误
+                    pass
+            saved = item.get('options') or {}
+            options.update({key: saved[key] for key in TASK_OPTIONS if key in saved})
+            options['enabled'] = bool(item.get('enabled', True) and saved.get('enabled', True))
+            items.append(options)
+        return self.add_many(items, replace=replace)
+
     def update(self, name: str, option: Dict[str, Any]) -> Result[bool, Exception]:
         """更新定时任务"""
         try:
@@ -181,22 +581,40 @@ class Task:
 
     def enable(self, name: str) -> Result[bool, Exception]:
         """启用定时任务"""
-        try:
-            task = self.get(name).unwrap()
-            if task:
-                task['enabled'] = True
-                return self.update(name, task)
-            return Ok(False)
-        except Exception as exc:
-            return Err(exc)
+        return self._set_enabled(name, True)
 
     def disable(self, name: str) -> Result[bool, Exception]:
         """禁用定时任务"""
+        return self._set_enabled(name, False)
+
+    def _set_enabled(self, name: str, enabled: bool) -> Result[bool, Exception]:
+        """保留原来的调度与执行记录，只修改 options 中的启用状态"""
         try:
-            task = self.get(name).unwrap()
-            if task:
-                task['enabled'] = False
-                return self.update(name, task)
-            return Ok(False)
+            entry = self.index.get(name)
+            if entry is None:
+                return Ok(False)
+            options = dict(entry.options or {})
+            if enabled:
+                options.pop('enabled', None)
+            else:
+                options['enabled'] = False
+            if options == (entry.options or {}):
+                return Ok(True)
+            updated = self.scheduler.Entry(
+                name=entry.name,
+                task=entry.task,
+                last_run_at=entry.last_run_at,
+                total_run_count=entry.total_run_count,
+                schedule=entry.schedule,
+                args=entry.args,
+                kwargs=entry.kwargs,
+                options=options,
+                app=self.celery_app,
+            )
+            # 从有序集合移到禁用任务哈希（或相反），禁用的任务 beat 不会读取
+            if not self.index.remove(name):
+                return Ok(False)
+            self.index.add(updated, self.score(updated))
+            return Ok(True)
         except Exception as exc:
             return Err(exc)
@@ -1,8 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import atexit
+import datetime
+import json
 import logging
 import logging.config
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
 from result import Result, Ok, Err
 from pathlib import Path
 
@@ -37,5 +44,329 @@ def ensure_logging_config(conf: dict) -> Result[bool, Exception]:
     try:
         ensure_log_directory(conf).unwrap()
         logging.config.dictConfig(conf)
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+# LogRecord 自带的属性，其余属性（logger.info(..., extra={...})）作为JSON的字段输出
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "queue_target"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "process": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    在调用线程中只取得消息文本并入队，格式化与写入由 LogDispatcher 的后台线程完成
+    队列满时丢弃并计数，不阻塞事件循环
+    """
+
+    def __init__(self, log_queue: queue.Queue, target: str):
+        super().__init__(log_queue)
+        self.target = target
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数可能是之后会被修改的对象，入队前确定消息文本，异常转为文本
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        record.queue_target = self.target
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogDispatcher(QueueListener):
+    """一个后台线程处理所有 logger 的队列，日志交给入队时所属 logger 原来的 handler"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.targets: Dict[str, List[logging.Handler]] = {}
+
+    def handle(self, record: logging.LogRecord):
+        for handler in self.targets.get(getattr(record, "queue_target", ""), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+_dispatcher: Optional[LogDispatcher] = None
+
+
+def configured_loggers() -> List[logging.Logger]:
+    """root 以及配置了 handler 的 logger"""
+    loggers = [logging.getLogger()]
+    for item in list(logging.root.manager.loggerDict.values()):
+        if isinstance(item, logging.Logger) and item.handlers:
+            loggers.append(item)
+    return loggers
+
+
+def start_queue_logging(size: int = 0) -> Result[LogDispatcher, Exception]:
+    """所有 logger 的 handler 移到后台线程，logger 上只保留 LogQueueHandler；重复调用时接管新增的 handler"""
+    global _dispatcher
+    try:
+        if _dispatcher is None:
+            _dispatcher = LogDispatcher(queue.Queue(maxsize=max(size, 0)))
+            _dispatcher.start()
+            atexit.register(stop_queue_logging)
+        for item in configured_loggers():
+            handlers = [handler for handler in item.handlers if not isinstance(handler, LogQueueHandler)]
+            if not handlers:
+                continue
+            target = item.name
+            _dispatcher.targets.setdefault(target, []).extend(handlers)
+            queue_handler = next((h for h in item.handlers if isinstance(h, LogQueueHandler)), None)
+            if queue_handler is None:
+                queue_handler = LogQueueHandler(_dispatcher.queue, target)
+            # 低于所有 handler 级别的日志不入队
+            queue_handler.setLevel(min(handler.level for handler in _dispatcher.targets[target]))
+            item.handlers = [queue_handler]
+        return Ok(_dispatcher)
+    except Exception as exc:
+        return Err(exc)
+
+
+def stop_queue_logging():
+    """写入队列中剩余的日志后停止后台线程，handler 放回原来的 logger"""
+    global _dispatcher
+    if _dispatcher is None:
+        return
+    dispatcher, _dispatcher = _dispatcher, None
+    dispatcher.stop()
+    for item in configured_loggers():
+        if any(isinstance(handler, LogQueueHandler) for handler in item.handlers):
+            item.handlers = dispatcher.targets.get(item.name, [])
+
+
+class SamplingFilter(logging.Filter):
+    """
+    同一调用位置的日志：前 first 条全部通过，之后每 every 条通过一条
+    通过的日志带有 suppressed 属性（之前被丢弃的条数），消息末尾附加 (+N suppressed)；高于 max_level 的日志不采样
+    """
+
+    def __init__(self, first: int = 100, every: int = 100, max_level: int = logging.INFO):
+        super().__init__()
+        self.first = max(first, 0)
+        self.every = max(every, 1)
+        self.max_level = max_level
+        self.suppressed = 0
+        # {(文件, 行号): [出现次数, 上次通过后丢弃的条数]}
+        self._counts: Dict[Tuple[str, int], List[int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        with self._lock:
+            state = self._counts.setdefault((record.pathname, record.lineno), [0, 0])
+            state[0] += 1
+            if state[0] > self.first and (state[0] - self.first) % self.every:
+                state[1] += 1
+                self.suppressed += 1
+                return False
+            suppressed, state[1] = state[1], 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} (+{suppressed} suppressed)"
+        return True
+
+    def describe(self) -> Dict[str, int]:
+        return {"first": self.first, "every": self.every, "suppressed": self.suppressed}
+
+
+def _logger(name: str) -> logging.Logger:
+    return logging.getLogger(None if name == "root" else name)
+
+
+def set_sampling(name: str, first: int = 100, every: Optional[int] = None) -> Optional[SamplingFilter]:
+    """logger 的采样设置，every为None时取消采样"""
+    item = _logger(name)
+    for old in [f for f in item.filters if isinstance(f, SamplingFilter)]:
+        item.removeFilter(old)
+    if every is None:
+        return None
+    sampling = SamplingFilter(first, every)
+    item.addFilter(sampling)
+    return sampling
+
+
+def sampling_of(name: str) -> Optional[SamplingFilter]:
+    return next((f for f in _logger(name).filters if isinstance(f, SamplingFilter)), None)
+
+
+class LogControl(object):
+    """
+    运行时修改 logger 级别与采样
+    绑定主进程创建的共享内存后，修改写入共享内存并增加版本号，其他工作进程在 sync 时应用
+    """
+
+    def __init__(self):
+        self._version = None
+        self._state = None
+        self._applied = 0
+        # 本进程中修改过的 logger，用于 snapshot
+        self._names = set()
+
+    @staticmethod
+    def create_shared(size: int = 65536):
+        """在主进程中创建 (版本号, JSON缓冲区)，通过 app.shared_ctx 传递给工作进程"""
+        import multiprocessing
+        return multiprocessing.Value('q', 0), multiprocessing.Array('c', size)
+
+    def bind(self, version, state):
+        """工作进程中绑定共享内存并应用已有的修改"""
+        self._version, self._state = version, state
+        self._applied = -1
+        self.sync()
+
+    @staticmethod
+    def validate(levels: Optional[Dict[str, Any]], sampling: Optional[Dict[str, Any]]) -> Result[Dict, Exception]:
+        """
+        :param levels: {logger名称: 级别名称}
+        :param sampling: {logger名称: {"first": n, "every": m}}，值为None时取消采样
+        :return: 规范化后的 {"levels": ..., "sampling": ...}
+        """
+        try:
+            normalized = {"levels": {}, "sampling": {}}
+            for name, level in (levels or {}).items():
+                level = str(level).upper()
+                if not isinstance(logging.getLevelName(level), int):
+                    return Err(ValueError(f"Unknown log level {level}"))
+                normalized["levels"][str(name)] = level
+            for name, options in (sampling or {}).items():
+                if options is None:
+                    normalized["sampling"][str(name)] = None
+                    continue
+                first, every = int(options.get("first", 100)), int(options.get("every", 100))
+                if first < 0 or every < 1:
+                    return Err(ValueError(f"Invalid sampling for {name}: first >= 0 and every >= 1"))
+                normalized["sampling"][str(name)] = {"first": first, "every": every}
+            return Ok(normalized)
+        except Exception as exc:
+            return Err(exc)
+
+    def apply(self, overrides: Dict[str, Dict]):
+        for name, level in overrides.get("levels", {}).items():
+            _logger(name).setLevel(level)
+            self._names.add(name)
+        for name, options in overrides.get("sampling", {}).items():
+            current = sampling_of(name)
+            if options is None:
+                set_sampling(name, every=None)
+            elif current is None or (current.first, current.every) != (options["first"], options["every"]):
+                set_sampling(name, options["first"], options["every"])
+            self._names.add(name)
+
+    def update(self,
+               levels: Optional[Dict[str, Any]] = None,
+               sampling: Optional[Dict[str, Any]] = None) -> Result[Dict[str, Any], Exception]:
+        """修改级别与采样，已绑定共享内存时同步到所有工作进程；返回本进程的 snapshot"""
+        validated = self.validate(levels, sampling)
+        if not validated.is_ok():
+            return Err(validated.err_value)
+        overrides = validated.ok_value
+        try:
+            if self._state is not None:
+                with self._version.get_lock():
+                    merged = self._read()
+                    for key in ("levels", "sampling"):
+                        merged.setdefault(key, {}).update(overrides[key])
+                    payload = json.dumps(merged).encode()
+                    if len(payload) >= len(self._state):
+                        return Err(ValueError("Too many log overrides for the shared buffer"))
+                    self._state.value = payload
+                    self._version.value += 1
+                    self._applied = self._version.value
+                self.apply(merged)
+            else:
+                self.apply(overrides)
+            return Ok(self.snapshot())
+        except Exception as exc:
+            return Err(exc)
+
+    def _read(self) -> Dict[str, Dict]:
+        raw = self._state.value
+        return json.loads(raw) if raw else {}
+
+    def sync(self):
+        """其他进程修改过时应用共享内存中的设置，只读取一次整数，可以在每个请求中调用"""
+        if self._version is None or self._version.value == self._applied:
+            return
+        with self._version.get_lock():
+            version, overrides = self._version.value, self._read()
+        self.apply(overrides)
+        self._applied = version
+
+    def snapshot(self) -> Dict[str, Any]:
+        """本进程中 root、配置过级别或采样的 logger 的当前设置"""
+        names = {"root"} | self._names | {item.name for item in configured_loggers() if item.name != "root"}
+        loggers = {}
+        for name in sorted(names):
+            item = _logger(name)
+            sampling = sampling_of(name)
+            loggers[name] = {
+                "level": logging.getLevelName(item.level),
+                "effective_level": logging.getLevelName(item.getEffectiveLevel()),
+                "sampling": sampling.describe() if sampling else None,
+            }
+        return {"version": self._applied, "loggers": loggers}
+
+
+log_control = LogControl()
+
+
+def configure_logging() -> Result[bool, Exception]:
+    """
+    按 application.yml 的 LOGGING 调整日志：
+    LEVELS 覆盖各 logger 的级别，SAMPLING 为 logger 添加采样，FORMAT 为json时输出JSON行，MODE 为queue时由后台线程写入
+    """
+    try:
+        from core.conf import settings
+        if not settings:
+            return Ok(False)
+        for name, level in settings.get_dict("LOGGING.LEVELS", {}).items():
+            logging.getLogger(None if name == "root" else name).setLevel(str(level).upper())
+        if settings.get_str("LOGGING.FORMAT", "text") == "json":
+            formatter = JsonFormatter()
+            handlers = [handler for item in configured_loggers() for handler in item.handlers]
+            if _dispatcher is not None:
+                handlers.extend(handler for targets in _dispatcher.targets.values() for handler in targets)
+            for handler in handlers:
+                if not isinstance(handler, LogQueueHandler):
+                    handler.setFormatter(formatter)
+        for name, options in settings.get_dict("LOGGING.SAMPLING", {}).items():
+            set_sampling(name, int(options.get("FIRST", 100)), int(options.get("EVERY", 100)))
+        if settings.get_str("LOGGING.MODE", "sync") == "queue":
+            start_queue_logging(settings.get_int("LOGGING.QUEUE_SIZE", 0)).unwrap()
+        return Ok(True)
     except Exception as exc:
         return Err(exc)
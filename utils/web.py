@@ -1,40 +1,246 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import hmac
 import importlib
+import logging
 from sanic import Sanic, Blueprint
 from result import Result, Ok, Err
 from sanic_ext import Extend
 from sanic_compress import Compress
+from tortoise import Tortoise
 from tortoise.contrib.sanic import register_tortoise
-from typing import Dict
+from typing import Dict, List, Optional
 
+from core.reflect.registry import registry
 from rcc.config import (
     INSTALL_APPS,
     VIEWS_DIR
 )
 
+logger = logging.getLogger(__name__)
 
-def tortoise(app: Sanic, addr: str, modules: Dict, generate_schemas: bool = True) -> Result[bool, Exception]:
-    """初始化ORM"""
+
+def tortoise(app: Sanic,
+             addr: str,
+             modules: Dict,
+             generate_schemas: bool = True,
+             replicas: Optional[Dict[str, str]] = None) -> Result[bool, Exception]:
+    """
+    初始化ORM
+    :param replicas: 只读副本 {连接名称: db_url}，注册为额外的连接，读取由 router 路由
+    """
     try:
         model_list = []
         for app_name, model_paths in modules.items():
             model_list.extend(model_paths)
         model_list = list(set(model_list))
-        register_tortoise(
-            app,
-            modules={
-                'models': model_list
-            },
-            db_url=addr,
-            generate_schemas=generate_schemas,
-        )
+        if replicas:
+            register_tortoise(
+                app,
+                config=tortoise_config(addr, model_list, replicas),
+                generate_schemas=generate_schemas,
+            )
+        else:
+            register_tortoise(
+                app,
+                modules={
+                    'models': model_list
+                },
+                db_url=addr,
+                generate_schemas=generate_schemas,
+            )
+        configure_router(replicas)
+
+        @app.listener('before_server_start')
+        async def invalidate_registry(*_):
+            # 工作进程中重新初始化了ORM，模型注册表下次查找时重建
+            registry.invalidate()
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+async def init_orm(generate_schemas: Optional[bool] = None) -> Result[bool, Exception]:
+    """在Sanic之外（命令行）初始化ORM，配置与 setup 一致，使用完成后调用 Tortoise.close_connections"""
+    try:
+        from core.conf import settings
+        modules = discover_modules().unwrap()
+        model_list = list(set(path for model_paths in modules.values() for path in model_paths))
+        replicas = get_replica_urls().unwrap()
+        await Tortoise.init(config=tortoise_config(get_tortoise_url().unwrap(), model_list, replicas))
+        registry.invalidate()
+        configure_router(replicas)
+        if generate_schemas is None:
+            generate_schemas = settings.get_bool("DATABASE.GENERATE_SCHEMAS")
+        if generate_schemas:
+            await Tortoise.generate_schemas(safe=True)
         return Ok(True)
     except Exception as exc:
         return Err(exc)
 
 
+def query_cache_setup(app: Sanic) -> Result[bool, Exception]:
+    """多进程时通过共享内存同步各工作进程的查询缓存代数"""
+    try:
+        from core.reflect.cache import Generations, query_cache
+
+        @app.listener('main_process_start')
+        async def share_cache_generations(srv, *_):
+            srv.shared_ctx.cache_generations = Generations.create_shared()
+
+        @app.listener('before_server_start')
+        async def bind_cache_generations(srv, *_):
+            generations = getattr(srv.shared_ctx, 'cache_generations', None)
+            if generations is not None:
+                query_cache.generations.bind(generations)
+            query_cache.reset()
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def metrics_setup(app: Sanic) -> Result[bool, Exception]:
+    """reflect层的查询统计：ORM初始化后替换客户端方法，按请求统计语句数量"""
+    try:
+        from core.reflect.metrics import metrics
+
+        @app.listener('before_server_start')
+        async def instrument_clients(*_):
+            metrics.configure()
+            if metrics.enabled:
+                metrics.instrument_clients()
+
+        @app.on_request
+        async def begin_request_metrics(request):
+            if metrics.enabled:
+                metrics.begin_request()
+
+        @app.on_response
+        async def end_request_metrics(request, response):
+            stats = metrics.end_request(request.path)
+            if stats is not None and response is not None:
+                response.headers['X-Query-Count'] = str(stats.queries)
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def audit_sink_setup(app: Sanic) -> Result[bool, Exception]:
+    """审计日志在每个工作进程中批量写入，停止服务前写入队列中剩余的日志"""
+    try:
+        from core.conf import settings
+        from core.reflect.audit import audit_sink
+        if not settings.get_bool("AUDIT.BUFFERED", True):
+            return Ok(False)
+
+        @app.listener('after_server_start')
+        async def start_audit_sink(*_):
+            audit_sink.configure()
+            audit_sink.start()
+
+        @app.listener('before_server_stop')
+        async def drain_audit_sink(*_):
+            res = await audit_sink.stop()
+            if not res.is_ok():
+                logger.error(f"Failed to drain audit logs: {res.err_value}")
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def partition_setup(app: Sanic) -> Result[bool, Exception]:
+    """Postgres 上 ir_logger 按 create_date 分区，工作进程启动后定期建立新分区、清理过期分区"""
+    try:
+        from core.reflect.partition import logger_partitions
+
+        @app.listener('after_server_start')
+        async def start_partitions(*_):
+            logger_partitions.configure()
+            if logger_partitions.enabled:
+                logger_partitions.start()
+
+        @app.listener('before_server_stop')
+        async def stop_partitions(*_):
+            await logger_partitions.stop()
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def rollup_schedule_setup(app: Sanic) -> Result[bool, Exception]:
+    """审计日志汇总任务没有注册时，按 AUDIT.ROLLUP.INTERVAL 注册为 celery 定时任务"""
+    try:
+        from core.conf import settings
+        interval = settings.get_int("AUDIT.ROLLUP.INTERVAL", 300)
+        if interval <= 0:
+            return Ok(False)
+
+        @app.listener('main_process_start')
+        async def register_rollup_task(srv, *_):
+            task = getattr(srv.ctx, 'task', None)
+            if task is None:
+                return
+            name = "rollup_audit_logs"
+            res = task.get(name)
+            if res.is_ok() and res.ok_value is None:
+                res = task.add({
+                    'name': name,
+                    'task': 'apps.web.tasks.audit.rollup_audit_logs',
+                    'schedule_type': 'interval',
+                    'interval_seconds': interval,
+                })
+            if not res.is_ok():
+                logger.error(f"Failed to register audit rollup task: {res.err_value}")
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def log_control_setup(app: Sanic) -> Result[bool, Exception]:
+    """运行时修改的日志级别与采样通过共享内存同步到所有工作进程，每个请求开始时检查版本号"""
+    try:
+        from utils.log import LogControl, log_control
+
+        @app.listener('main_process_start')
+        async def share_log_control(srv, *_):
+            srv.shared_ctx.log_control_version, srv.shared_ctx.log_control_state = LogControl.create_shared()
+
+        @app.listener('before_server_start')
+        async def bind_log_control(srv, *_):
+            version = getattr(srv.shared_ctx, 'log_control_version', None)
+            state = getattr(srv.shared_ctx, 'log_control_state', None)
+            if version is not None and state is not None:
+                log_control.bind(version, state)
+
+        @app.on_request
+        async def sync_log_control(request):
+            log_control.sync()
+
+        return Ok(True)
+    except Exception as exc:
+        return Err(exc)
+
+
+def bearer_authorized(request, setting: str) -> bool:
+    """
+    校验请求头 Authorization: Bearer <token>，token 取配置项 setting
+    没有配置 token 时拒绝访问
+    """
+    from core.conf import settings
+    token = settings.get_str(setting, None) if settings else None
+    if not token:
+        return False
+    header = request.headers.get('Authorization', '')
+    return hmac.compare_digest(header.removeprefix('Bearer ').strip(), token)
+
+
 def discover_blueprints(srv: Sanic):
     """注册蓝图"""
     for app_name in INSTALL_APPS:
@@ -87,17 +293,23 @@ def discover_modules() -> Result[Dict, Exception]:
     return Ok(models)
 
 
-def get_tortoise_url() -> Result[str, Exception]:
-    """获取db_url"""
+def get_tortoise_url(overrides: Optional[Dict] = None) -> Result[str, Exception]:
+    """获取db_url，overrides中的配置项（如只读副本的 HOST、PORT）覆盖 DATABASE 中的同名配置"""
     from core.conf import settings
-    max_size = settings.get_int("DATABASE.MAX_SIZE", 10)
-    min_size = settings.get_int("DATABASE.MIN_SIZE", 1)
-    charset = settings.get_str("DATABASE.CHARSET", "utf8mb4")
-    host = settings.get_str("DATABASE.HOST", None)
-    port = settings.get_int("DATABASE.PORT", None)
-    username = settings.get_str("DATABASE.USERNAME", None)
-    password = settings.get_str("DATABASE.PASSWORD", None)
-    name = settings.get_str("DATABASE.NAME", None)
+    overrides = overrides or {}
+
+    def option(key: str, getter, default=None):
+        value = overrides.get(key)
+        return getter(f"DATABASE.{key}", default) if value is None else value
+
+    max_size = option("MAX_SIZE", settings.get_int, 10)
+    min_size = option("MIN_SIZE", settings.get_int, 1)
+    charset = option("CHARSET", settings.get_str, "utf8mb4")
+    host = option("HOST", settings.get_str)
+    port = option("PORT", settings.get_int)
+    username = option("USERNAME", settings.get_str)
+    password = option("PASSWORD", settings.get_str)
+    name = option("NAME", settings.get_str)
 
     match settings.get("DATABASE.ENGINE"):
         case "pgsql" | "polar":
@@ -110,6 +322,45 @@ def get_tortoise_url() -> Result[str, Exception]:
             return Err(Exception(f"{settings.get('DATABASE.ENGINE')} nonsupport"))
 
 
+def get_replica_urls() -> Result[Dict[str, str], Exception]:
+    """获取 DATABASE.REPLICAS 中只读副本的db_url: {连接名称: db_url}"""
+    from core.conf import settings
+    try:
+        replicas = {}
+        for i, replica in enumerate(settings.get_list("DATABASE.REPLICAS", []) or []):
+            url_result = get_tortoise_url(replica or {})
+            if not url_result.is_ok():
+                return Err(url_result.err_value)
+            replicas[f"replica_{i}"] = url_result.ok_value
+        return Ok(replicas)
+    except Exception as exc:
+        return Err(exc)
+
+
+def tortoise_config(addr: str, model_list: List[str], replicas: Optional[Dict[str, str]] = None) -> Dict:
+    """主库为default连接，模型只绑定主库，只读副本作为额外连接"""
+    return {
+        'connections': {'default': addr, **(replicas or {})},
+        'apps': {
+            'models': {
+                'models': model_list,
+                'default_connection': 'default',
+            }
+        },
+    }
+
+
+def configure_router(replicas: Optional[Dict[str, str]] = None):
+    """配置读写分离路由，没有只读副本时所有读取走主库"""
+    from core.conf import settings
+    from core.reflect.router import router
+    router.configure(
+        list(replicas or {}),
+        policy=settings.get_str("DATABASE.REPLICA_POLICY", "round_robin") if settings else "round_robin",
+        read_after_write=settings.get_float("DATABASE.READ_AFTER_WRITE", 1.0) if settings else 1.0,
+    )
+
+
 def setup(app: Sanic) -> Result[bool, Exception]:
     try:
         from core.conf import settings
@@ -124,7 +375,14 @@ def setup(app: Sanic) -> Result[bool, Exception]:
 
         # 注册模型
         modules = discover_modules().unwrap()
-        tortoise(app, get_tortoise_url().unwrap(), modules, settings.get_bool("DATABASE.GENERATE_SCHEMAS"))
+        tortoise(app, get_tortoise_url().unwrap(), modules, settings.get_bool("DATABASE.GENERATE_SCHEMAS"),
+                 get_replica_urls().unwrap())
+        query_cache_setup(app).unwrap()
+        metrics_setup(app).unwrap()
+        audit_sink_setup(app).unwrap()
+        partition_setup(app).unwrap()
+        rollup_schedule_setup(app).unwrap()
+        log_control_setup(app).unwrap()
 
         app.ext.openapi.describe(
             title="Sanic Web API",